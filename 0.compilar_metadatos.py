@@ -0,0 +1,28 @@
+import os
+import sys
+from toxiclibros.bd import conectar, crear_tabla_procesados
+from toxiclibros.metadatos import compilar_metadatos
+
+# === CONFIGURACIÓN ===
+BASE_PATH = r"E:\GutembergALL"
+METADATA_CSV = os.path.join(BASE_PATH, "gutenberg_over_70000_metadata.csv")
+DB_PATH = "gutenberg_all.db"  # la tabla metadata va junto a procesados
+
+
+def main():
+    # Uso: python 0.compilar_metadatos.py [CSV] [DB]
+    ruta_csv = sys.argv[1] if len(sys.argv) > 1 else METADATA_CSV
+    db_path = sys.argv[2] if len(sys.argv) > 2 else DB_PATH
+
+    conn = conectar(db_path)
+    crear_tabla_procesados(conn)
+    n = compilar_metadatos(conn, ruta_csv)
+    sin_anio, lenguajes = conn.execute(
+        "SELECT SUM(anio IS NULL), COUNT(DISTINCT lenguaje_principal) FROM metadata").fetchone()
+    conn.close()
+    print(f"✅ {n} libros en la tabla metadata de {db_path} "
+          f"({lenguajes} lenguajes, {sin_anio or 0} sin año de publicación)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import os
+import time
+from toxiclibros.indice import cargar_indice
+from toxiclibros.corpus import empaquetar, TAMANO_SHARD
+
+# === CONFIGURACIÓN ===
+BASE_PATH = r"E:\GutembergALL"
+BOOKS_FOLDER = os.path.join(BASE_PATH, "books")
+MANIFIESTO_LIBROS = os.path.join(BASE_PATH, "books_manifest.json")
+CORPUS_FOLDER = os.path.join(BASE_PATH, "corpus")  # usar con 1.filter_Guttemberg_all.py --corpus
+
+
+def main():
+    indice = cargar_indice(BOOKS_FOLDER, MANIFIESTO_LIBROS)
+    print(f"📦 Empaquetando {len(indice)} libros en {CORPUS_FOLDER} (shards de {TAMANO_SHARD >> 20} MB)")
+
+    inicio = time.perf_counter()
+    n = empaquetar(indice, CORPUS_FOLDER, TAMANO_SHARD)
+    print(f"✅ {n} libros empaquetados en {time.perf_counter() - inicio:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,88 @@
+import argparse
 import sqlite3
-import pandas as pd
+import time
+from toxiclibros.bd import conectar, crear_tabla_procesados
+from toxiclibros.metadatos import asegurar_metadatos
 
 DB_PATH = "gutenberg_all.db"  # o "gutenberg_all.db"
 CSV_PATH = "gutenberg_over_70000_metadata.csv"
 
-# Cargar CSV con títulos
-df = pd.read_csv(CSV_PATH)
-df = df.set_index("Book Num")
-
-# Conectar a la base de datos
-conn = sqlite3.connect(DB_PATH)
-cursor = conn.cursor()
-
-# Asegurarse de que la columna exista
-cursor.execute("PRAGMA table_info(procesados)")
-columnas = [col[1] for col in cursor.fetchall()]
-if 'titulo' not in columnas:
-    cursor.execute("ALTER TABLE procesados ADD COLUMN titulo TEXT")
-
-# Buscar IDs sin título
-cursor.execute("SELECT book_id FROM procesados WHERE titulo IS NULL OR titulo = ''")
-ids_faltantes = [r[0] for r in cursor.fetchall()]
-
-for book_id in ids_faltantes:
-    try:
-        titulo = df.loc[book_id, 'Book Title']
-        cursor.execute("UPDATE procesados SET titulo = ? WHERE book_id = ?", (titulo, book_id))
-        print(f"✅ Actualizado título para {book_id}")
-    except Exception as e:
-        print(f"⚠️ No se pudo actualizar {book_id}: {e}")
-
-conn.commit()
-conn.close()
-print("🎉 Reparación completada.")
+# Campos de procesados que se reparan: (columna en procesados, columna en metadata)
+CAMPOS = [("titulo", "titulo"), ("lenguaje", "lenguaje"), ("anio", "anio")]
+
+
+def preparar_reparaciones(conn):
+    # Tabla temporal con los libros de procesados a los que les falta algún
+    # campo o lo tienen distinto de los metadatos (nunca se borra un valor:
+    # solo cuentan los campos con valor en metadata)
+    conn.execute("DROP TABLE IF EXISTS temp.reparaciones")
+    distintos = " OR ".join(f"(m.{origen} IS NOT NULL AND p.{destino} IS NOT m.{origen})"
+                            for destino, origen in CAMPOS)
+    conn.execute(f"""
+        CREATE TEMP TABLE reparaciones AS
+        SELECT p.book_id, {", ".join(f"m.{origen} AS {destino}" for destino, origen in CAMPOS)},
+               {", ".join(f"(m.{origen} IS NOT NULL AND p.{destino} IS NOT m.{origen}) AS cambia_{destino}"
+                          for destino, origen in CAMPOS)}
+        FROM procesados p JOIN metadata m ON m.book_id = p.book_id
+        WHERE {distintos}
+    """)
+    conn.execute("CREATE UNIQUE INDEX temp.idx_reparaciones ON reparaciones(book_id)")
+
+
+def aplicar_reparaciones(conn):
+    # Un solo UPDATE ... FROM; devuelve las filas cambiadas
+    asignaciones = ", ".join(
+        f"{destino} = CASE WHEN r.cambia_{destino} THEN r.{destino} ELSE procesados.{destino} END"
+        for destino, _ in CAMPOS
+    )
+    if sqlite3.sqlite_version_info >= (3, 33, 0):
+        sql = f"UPDATE procesados SET {asignaciones} FROM reparaciones r WHERE r.book_id = procesados.book_id"
+    else:
+        # SQLite sin UPDATE ... FROM: el mismo cambio con subconsultas correlacionadas
+        asignaciones = ", ".join(
+            f"{destino} = COALESCE((SELECT r.{destino} FROM reparaciones r "
+            f"WHERE r.book_id = procesados.book_id AND r.cambia_{destino}), {destino})"
+            for destino, _ in CAMPOS
+        )
+        sql = f"UPDATE procesados SET {asignaciones} WHERE book_id IN (SELECT book_id FROM reparaciones)"
+    return conn.execute(sql).rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rellena o corrige título, lenguaje y año de procesados a partir de los metadatos")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--csv", default=CSV_PATH, help="CSV de metadatos (se compila en la tabla metadata)")
+    parser.add_argument("--simular", action="store_true", help="contar lo que cambiaría sin escribir nada")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    conn = conectar(args.db)
+    crear_tabla_procesados(conn)  # añade las columnas que falten
+    asegurar_metadatos(conn, args.csv)
+
+    with conn:
+        preparar_reparaciones(conn)
+        sumas = ", ".join(f"SUM(cambia_{destino})" for destino, _ in CAMPOS)
+        por_campo = conn.execute(f"SELECT COUNT(*), {sumas} FROM reparaciones").fetchone()
+        sin_metadatos = conn.execute("""
+            SELECT COUNT(*) FROM procesados p
+            WHERE NOT EXISTS (SELECT 1 FROM metadata m WHERE m.book_id = p.book_id)
+        """).fetchone()[0]
+        cambiadas = 0 if args.simular else aplicar_reparaciones(conn)
+    conn.close()
+
+    total = por_campo[0]
+    for (destino, _), n in zip(CAMPOS, por_campo[1:]):
+        print(f"🔧 {destino:<9} {n or 0} libros")
+    if sin_metadatos:
+        print(f"⚠️ {sin_metadatos} libros de procesados no están en los metadatos")
+    if args.simular:
+        print(f"🔎 Simulación: cambiarían {total} filas ({time.perf_counter() - inicio:.1f} s)")
+    else:
+        print(f"🎉 Reparación completada: {cambiadas} filas cambiadas en una transacción "
+              f"({time.perf_counter() - inicio:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
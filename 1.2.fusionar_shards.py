@@ -0,0 +1,124 @@
+import argparse
+import glob
+import os
+import sqlite3
+import sys
+from collections import Counter
+import pandas as pd
+from toxiclibros.bd import conectar, crear_tabla_procesados, fusionar_procesados, CRITERIOS_FUSION
+from toxiclibros.indice import leer_manifiesto
+from toxiclibros.shards import shard_de, shard_de_ruta
+
+# === CONFIGURACIÓN ===
+BASE_PATH = r"E:\GutembergALL"
+METADATA_CSV = os.path.join(BASE_PATH, "gutenberg_over_70000_metadata.csv")
+MANIFIESTO_LIBROS = os.path.join(BASE_PATH, "books_manifest.json")  # libros con .pkl (opcional)
+DB_PATH = "gutenberg_all.db"
+CRITERIO = "fecha"        # o "version": ver CRITERIOS_FUSION en toxiclibros/bd.py
+MOSTRAR_IDS = 20          # IDs que se listan de cada problema de cobertura
+
+
+def buscar_shards(destino):
+    # gutenberg_all.shard*-of-*.db junto a la base de datos de destino
+    base, extension = os.path.splitext(destino)
+    return sorted(glob.glob(f"{glob.escape(base)}.shard*-of-*{extension}"))
+
+
+def comprobar_shards(rutas):
+    # Avisos si faltan shards, se repiten o mezclan distintos N
+    avisos = []
+    presentes = {}
+    for ruta in rutas:
+        spec = shard_de_ruta(ruta)
+        if spec:
+            i, n = spec
+            presentes.setdefault(n, Counter())[i] += 1
+    if len(presentes) > 1:
+        avisos.append(f"shards de repartos distintos: N = {sorted(presentes)}")
+    for n, indices in presentes.items():
+        faltan = [i for i in range(n) if i not in indices]
+        if faltan:
+            avisos.append(f"faltan los shards {faltan} de {n}")
+        repetidos = [i for i, c in indices.items() if c > 1]
+        if repetidos:
+            avisos.append(f"shards repetidos: {repetidos}")
+    return avisos
+
+
+def listar(ids):
+    ids = sorted(ids)
+    texto = ", ".join(str(book_id) for book_id in ids[:MOSTRAR_IDS])
+    return texto + (f", ... (+{len(ids) - MOSTRAR_IDS})" if len(ids) > MOSTRAR_IDS else "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fusiona las bases de datos de los shards en una sola")
+    parser.add_argument("shards", nargs="*",
+                        help="bases de datos de los shards (por defecto, las *.shardI-of-N.db del destino)")
+    parser.add_argument("--destino", default=DB_PATH)
+    parser.add_argument("--criterio", choices=sorted(CRITERIOS_FUSION), default=CRITERIO,
+                        help="qué fila gana si un libro está en varias bases de datos")
+    parser.add_argument("--csv", default=METADATA_CSV, help="metadatos con los libros esperados")
+    parser.add_argument("--manifiesto", default=MANIFIESTO_LIBROS,
+                        help="manifiesto de libros con fichero; si existe, solo se esperan esos")
+    args = parser.parse_args()
+
+    rutas = args.shards or buscar_shards(args.destino)
+    if not rutas:
+        sys.exit(f"❌ No hay shards que fusionar junto a {args.destino}")
+    for aviso in comprobar_shards(rutas):
+        print(f"⚠️ {aviso}")
+
+    conn = conectar(args.destino)
+    crear_tabla_procesados(conn)
+
+    # === FUSIONAR ===
+    apariciones = Counter()
+    mal_asignados = set()
+    for ruta in rutas:
+        origen = sqlite3.connect(ruta)
+        crear_tabla_procesados(origen)  # migra shards de versiones anteriores
+        ids = [fila[0] for fila in origen.execute("SELECT book_id FROM procesados")]
+        origen.close()
+
+        apariciones.update(ids)
+        spec = shard_de_ruta(ruta)
+        if spec:
+            i, n = spec
+            mal_asignados.update(book_id for book_id in ids if shard_de(book_id, n) != i)
+
+        cambiadas = fusionar_procesados(conn, ruta, args.criterio)
+        print(f"🧩 {ruta}: {len(ids)} libros, {cambiadas} filas insertadas o sustituidas")
+    total = conn.execute("SELECT COUNT(*) FROM procesados").fetchone()[0]
+    conn.close()
+    print(f"✅ {args.destino}: {total} libros tras la fusión (criterio: {args.criterio})")
+
+    # === COBERTURA ===
+    # Cada libro de los metadatos (con fichero, si hay manifiesto) debe estar en exactamente un shard
+    esperados = set(int(book_id) for book_id in pd.read_csv(args.csv)["Book Num"])
+    manifiesto = leer_manifiesto(args.manifiesto) if args.manifiesto else None
+    if manifiesto is not None:
+        esperados &= set(manifiesto["libros"])
+
+    faltan = esperados - set(apariciones)
+    repetidos = {book_id for book_id, c in apariciones.items() if c > 1}
+    ajenos = set(apariciones) - esperados
+
+    print(f"📋 Cobertura: {len(esperados) - len(faltan)}/{len(esperados)} libros esperados"
+          f"{' (con fichero según el manifiesto)' if manifiesto is not None else ''}")
+    if faltan:
+        print(f"❌ {len(faltan)} libros sin puntuar en ningún shard: {listar(faltan)}")
+    if repetidos:
+        print(f"❌ {len(repetidos)} libros en más de un shard: {listar(repetidos)}")
+    if mal_asignados:
+        print(f"❌ {len(mal_asignados)} libros en un shard que no les corresponde: {listar(mal_asignados)}")
+    if ajenos:
+        print(f"⚠️ {len(ajenos)} libros que no están entre los esperados: {listar(ajenos)}")
+
+    if faltan or repetidos or mal_asignados:
+        sys.exit(1)
+    print("🎉 Cada libro esperado está exactamente en un shard.")
+
+
+if __name__ == "__main__":
+    main()
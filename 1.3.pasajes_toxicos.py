@@ -0,0 +1,81 @@
+import argparse
+import csv
+from toxiclibros.bd import conectar, crear_tabla_procesados, ETIQUETAS
+from toxiclibros.pasajes import leer_puntuaciones, leer_pasajes, resumir, UMBRAL
+
+# === CONFIGURACIÓN ===
+DB_PATH = "gutenberg_all.db"
+CAMPOS_CSV = ["book_id", "etiqueta", "trozos", "maximo", "p95", "sobre_umbral"]
+
+
+def mostrar_libro(conn, book_id, etiquetas, umbral):
+    # Agregados por etiqueta y pasajes más tóxicos de un libro, sin puntuar nada
+    fila = conn.execute("SELECT titulo, trozos_muestra, trozos_total FROM procesados WHERE book_id = ?",
+                        (book_id,)).fetchone()
+    puntuaciones = leer_puntuaciones(conn, book_id)
+    if fila is None or puntuaciones is None:
+        print(f"⚠️ [{book_id}] sin detalle por trozo (puntúalo con --pasajes > 0)")
+        return
+    titulo, muestra, total = fila
+    print(f"\n📖 [{book_id}] {titulo}: {len(puntuaciones['inicios'])} trozos"
+          f"{f' ({muestra} puntuados por muestreo)' if muestra is not None and muestra < total else ''}")
+    print(f"   {'etiqueta':<16} {'máximo':>7} {'p95':>7} {f'>= {umbral:g}':>8}")
+    for etiqueta in etiquetas:
+        resumen = resumir(puntuaciones[etiqueta], umbral)
+        if resumen:
+            print(f"   {etiqueta:<16} {resumen['maximo']:7.3f} {resumen['p95']:7.3f} "
+                  f"{100 * resumen['sobre_umbral']:7.1f}%")
+
+    for etiqueta in etiquetas:
+        pasajes = leer_pasajes(conn, book_id, etiqueta)
+        if not pasajes:
+            continue
+        print(f"   🔥 {etiqueta}:")
+        for pasaje in pasajes:
+            print(f"      {pasaje['puesto']}. {pasaje[etiqueta]:.3f} "
+                  f"[{pasaje['inicio']}-{pasaje['fin']}] {pasaje['fragmento']}")
+
+
+def exportar_agregados(conn, ruta, etiquetas, umbral):
+    # Una fila por libro y etiqueta con los agregados de sus trozos
+    n = 0
+    with open(ruta, "w", newline="", encoding="utf-8") as f:
+        escritor = csv.DictWriter(f, fieldnames=CAMPOS_CSV)
+        escritor.writeheader()
+        for (book_id,) in conn.execute("SELECT book_id FROM trozos_puntuaciones ORDER BY book_id").fetchall():
+            puntuaciones = leer_puntuaciones(conn, book_id)
+            for etiqueta in etiquetas:
+                resumen = resumir(puntuaciones[etiqueta], umbral)
+                if resumen:
+                    escritor.writerow({"book_id": book_id, "etiqueta": etiqueta, **resumen})
+            n += 1
+    print(f"✅ Agregados de {n} libros en {ruta}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pasajes más tóxicos y agregados por libro a partir de las puntuaciones guardadas")
+    parser.add_argument("libros", nargs="*", type=int, help="IDs de los libros que mostrar")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--etiqueta", choices=ETIQUETAS, action="append",
+                        help="limitar a estas etiquetas (repetible)")
+    parser.add_argument("--umbral", type=float, default=UMBRAL,
+                        help="puntuación a partir de la que un trozo cuenta como tóxico")
+    parser.add_argument("--csv", metavar="RUTA",
+                        help="exportar máximo, p95 y proporción sobre el umbral de todos los libros")
+    args = parser.parse_args()
+    if not args.libros and not args.csv:
+        parser.error("indica algún libro o --csv")
+
+    conn = conectar(args.db)
+    crear_tabla_procesados(conn)
+    etiquetas = args.etiqueta or ETIQUETAS
+    for book_id in args.libros:
+        mostrar_libro(conn, book_id, etiquetas, args.umbral)
+    if args.csv:
+        exportar_agregados(conn, args.csv, etiquetas, args.umbral)
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,23 @@ import sqlite3
 import pickle
 import re
 from tqdm import tqdm
-from detoxify import Detoxify
+from toxiclibros.modelos import crear_backend
+from toxiclibros.indice import cargar_indice
+from toxiclibros.corpus import CorpusEmpaquetado
+from toxiclibros.troceado import estimar_tokens
+from toxiclibros.metricas import Cronometro, Metricas
 
 # === CONFIGURACIÓN ===
 BASE_PATH = r"E:\GutembergALL"
 METADATA_CSV = os.path.join(BASE_PATH, "gutenberg_over_70000_metadata.csv")
 BOOKS_FOLDER = os.path.join(BASE_PATH, "books")
+MANIFIESTO_LIBROS = os.path.join(BASE_PATH, "books_manifest.json")
+CORPUS_PATH = None  # carpeta de 0.empaquetar_corpus.py para leer de ahí en vez de los .pkl
 DB_PATH = "gutenberg.db"
+BACKEND = "pytorch"  # o "onnx" (ONNX Runtime en CPU, ver toxiclibros/modelos.py)
+METRICAS_LOG = "metricas_gutenberg.jsonl"    # tiempos por etapa, ver toxiclibros/metricas.py
+METRICAS_PROMETHEUS = "metricas_gutenberg.prom"
+METRICAS_INTERVALO = 60.0
 
 # Etiquetas de Detoxify
 labels = [
@@ -19,7 +29,7 @@ labels = [
 ]
 
 # Cargar modelo Detoxify
-detox_model = Detoxify("original")
+detox_model = crear_backend(BACKEND, "original")
 
 # === CONEXIÓN A SQLITE ===
 conn = sqlite3.connect(DB_PATH)
@@ -85,13 +95,28 @@ def registrar(book_id, palabras, lenguaje, anio, titulo, scores):
         print(f"⚠️ Error al registrar {book_id}: {e}")
 
 
+# Índice book_id -> .pkl, construido una vez (o reutilizado del manifiesto)
+corpus = CorpusEmpaquetado(CORPUS_PATH) if CORPUS_PATH else None
+indice_libros = {} if corpus else cargar_indice(BOOKS_FOLDER, MANIFIESTO_LIBROS)
+
 def buscar_archivo_pkl(book_id):
-    patron = f"{book_id}_"
-    for root, _, files in os.walk(BOOKS_FOLDER):
-        for file in files:
-            if file.startswith(patron) and file.endswith(".pkl"):
-                return os.path.join(root, file)
-    return None
+    return indice_libros.get(book_id)
+
+def cargar_texto(book_id, crono):
+    # Texto del libro desde el corpus empaquetado o desde su .pkl (None si no está)
+    if corpus is not None:
+        with crono.medir("busqueda"):
+            encontrado = book_id in corpus
+        if not encontrado:
+            return None
+        with crono.medir("lectura"):
+            return corpus.texto(book_id)
+    with crono.medir("busqueda"):
+        file_path = buscar_archivo_pkl(book_id)
+    if not file_path:
+        return None
+    with crono.medir("lectura"), open(file_path, "rb") as f:
+        return pickle.load(f)
 
 def dividir_en_parrafos(texto):
     texto = re.sub(r'\s+', ' ', texto).strip()
@@ -126,14 +151,13 @@ df = df.set_index('Book Num')
 print(f"📄 Libros en inglés encontrados: {len(df)}")
 
 # === PROCESAR LIBROS ===
+metricas = Metricas(METRICAS_LOG, METRICAS_PROMETHEUS, METRICAS_INTERVALO)
 for book_id in tqdm(df.index, desc="📖 Analizando libros"):
-    file_path = buscar_archivo_pkl(book_id)
-    if not file_path:
-        continue
-
+    crono = Cronometro()
     try:
-        with open(file_path, "rb") as f:
-            texto = pickle.load(f)
+        texto = cargar_texto(book_id, crono)
+        if texto is None:
+            continue
         if not isinstance(texto, str):
             raise ValueError("Contenido no es texto")
 
@@ -148,14 +172,22 @@ for book_id in tqdm(df.index, desc="📖 Analizando libros"):
             if match:
                 anio = int(match.group(1))
 
-        parrafos = dividir_en_parrafos(texto)
-        scores = analizar_parrafos(parrafos)
+        with crono.medir("troceado"):
+            parrafos = dividir_en_parrafos(texto)
+        crono.trozos = len(parrafos)
+        crono.tokens = sum(estimar_tokens(p[:512]) for p in parrafos)
+        with crono.medir("inferencia"):
+            scores = analizar_parrafos(parrafos)
 
-        registrar(book_id, palabras, lenguaje, anio, titulo, scores)
+        with crono.medir("escritura"):
+            registrar(book_id, palabras, lenguaje, anio, titulo, scores)
+        metricas.libro(book_id, crono, "puntuado")
         print(f"✅ Analizado {book_id}")
 
     except Exception as e:
+        metricas.libro(book_id, crono, "error")
         print(f"❌ [{book_id}] Error procesando: {e}")
 
 conn.close()
+metricas.cerrar()
 print("✅ Finalizado.")
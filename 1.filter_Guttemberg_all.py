@@ -1,161 +1,1163 @@
-import pandas as pd
 import os
-import sqlite3
+import signal
+import hashlib
 import pickle
 import re
+import random
+import itertools
+import time
+import queue
+import argparse
+import multiprocessing as mp
+from multiprocessing.connection import wait as esperar_conexiones
+from collections import Counter, deque
 from tqdm import tqdm
-from detoxify import Detoxify
+from toxiclibros.indice import cargar_indice
+from toxiclibros.metadatos import asegurar_metadatos
+from toxiclibros.bd import conectar, crear_tabla_procesados, EscritorProcesados
+from toxiclibros.bd import crear_tabla_cuarentena, registrar_cuarentena, cargar_cuarentena
+from toxiclibros.troceado import Troceador
+from toxiclibros.cache import CachePuntuaciones
+from toxiclibros.corpus import CorpusEmpaquetado
+from toxiclibros.muestreo import EstimadorMedias, orden_estratificado
+from toxiclibros.precarga import Precargador
+from toxiclibros.metricas import Cronometro, Metricas
+from toxiclibros.shards import parsear_shard, shard_de, ruta_shard
+from toxiclibros.cuarentena import Cuarentena, Presupuesto, PresupuestoExcedido
+from toxiclibros.pasajes import detalle_libro
+from toxiclibros.planificador import POLITICAS, planificar, tokens_relleno
+from toxiclibros.modelos import BACKENDS, PoolModelos, crear_backend, identificador_modelo, comprobar_paridad
 
 # === CONFIGURACIÓN ===
 BASE_PATH = r"E:\GutembergALL"
 METADATA_CSV = os.path.join(BASE_PATH, "gutenberg_over_70000_metadata.csv")
 BOOKS_FOLDER = os.path.join(BASE_PATH, "books")
+MANIFIESTO_LIBROS = os.path.join(BASE_PATH, "books_manifest.json")
+CORPUS_PATH = None  # carpeta de 0.empaquetar_corpus.py para leer de ahí en vez de los .pkl (--corpus)
 DB_PATH = "gutenberg_all.db"
 
+# Modo incremental: un libro se vuelve a puntuar solo si cambia su .pkl,
+# su modelo o PIPELINE_VERSION (súbela al cambiar troceado o puntuación).
+# Otro --tokens-por-trozo que el de la versión se registra como sufijo.
+PIPELINE_VERSION = "3"
+PIPELINE_TOKENS_POR_TROZO = 384
+
+# Modelo de cada libro según su Language: original solo entiende inglés y
+# multilingual cubre estos idiomas; el resto va a MODELO_OTROS. Con MODELO
+# (--modelo) se usa el mismo para todos. Los modelos se cargan al llegar el
+# primer libro que los necesita y, por encima de MEMORIA_MODELOS_MB, se
+# descarga el usado hace más tiempo; los libros se ordenan por modelo para
+# no alternar entre ellos.
+MODELO = None
+MODELOS_POR_LENGUAJE = {
+    "English": "original",
+    "French": "multilingual", "Spanish": "multilingual", "Italian": "multilingual",
+    "Portuguese": "multilingual", "Turkish": "multilingual", "Russian": "multilingual",
+}
+MODELO_OTROS = "multilingual"
+MEMORIA_MODELOS_MB = 3000
+
+# Backend de inferencia: "pytorch" (Detoxify tal cual) u "onnx" (ONNX Runtime en CPU)
+BACKEND = "pytorch"
+CUANTIZAR = False         # solo onnx: cuantización dinámica int8 (--int8)
+HILOS_INTER = 1           # solo onnx: hilos entre operadores
+
+
+def modelo_de(lenguaje):
+    if MODELO:
+        return MODELO
+    # "English; French" -> English
+    principal = re.split(r"[;,]", str(lenguaje))[0].strip()
+    return MODELOS_POR_LENGUAJE.get(principal, MODELO_OTROS)
+
+
+def modelo_id(modelo):
+    # Nombre registrado en procesados y en la caché
+    return identificador_modelo(modelo, BACKEND == "onnx" and CUANTIZAR)
+
+
+def version_registrada():
+    # Las puntuaciones con otro tamaño de trozo, o las medias estimadas por
+    # muestreo (con cualquier tolerancia), no valen como las de la versión
+    # para el modo incremental
+    version = PIPELINE_VERSION
+    if TOKENS_POR_TROZO != PIPELINE_TOKENS_POR_TROZO:
+        version += f"+trozos{TOKENS_POR_TROZO}"
+    if MUESTREO_TOLERANCIA:
+        version += f"+muestreo{MUESTREO_TOLERANCIA:g}"
+    return version
+
+# Troceado e inferencia por lotes
+TOKENS_POR_TROZO = PIPELINE_TOKENS_POR_TROZO  # párrafos consecutivos agrupados hasta este presupuesto
+BATCH_SIZE = 32           # trozos por llamada a predict del modelo (1 = uno a uno)
+BATCH_MAX_TOKENS = 4096   # tokens por lote contando el relleno hasta el trozo más largo
+POLITICA_LOTES = "secuencial"  # o "por_longitud": ordena los trozos por tokens antes de agruparlos
+LIBROS_POR_GRUPO = 8      # con por_longitud, libros cuyos trozos se ordenan y agrupan juntos
+
+# Muestreo adaptativo (--muestreo TOL): se puntúa una muestra estratificada de
+# trozos hasta que el IC 95 % de la media de cada etiqueta tiene semiancho <= TOL
+MUESTREO_TOLERANCIA = None
+MUESTREO_MINIMO = 30      # trozos antes de comprobar la convergencia (y libros más cortos: enteros)
+MUESTREO_ESTRATOS = 10    # tramos contiguos del libro entre los que se reparte la muestra
+
+# Presupuesto por libro (0 = sin límite); quien lo excede va a la tabla
+# cuarentena y se reintenta aparte con --reintentar-cuarentena
+PRESUPUESTO_SEGUNDOS = 1800
+PRESUPUESTO_MEMORIA_MB = 4096     # crecimiento de la memoria del proceso mientras se puntúa
+PRESUPUESTO_FICHERO_MB = 200      # ni se lee un .pkl (o entrada del corpus) mayor
+MARGEN_VIGILANTE = 2              # con --workers, se mata al worker a este múltiplo del límite
+
+# Detalle por trozo (--pasajes K): puntuaciones de cada trozo y los K más
+# tóxicos de cada etiqueta en trozos_puntuaciones y pasajes_toxicos; 0 = solo medias
+TOP_K_PASAJES = 5
+
+# Caché de puntuaciones por trozo compartida entre libros (--sin-cache la desactiva)
+CACHE_PATH = "cache_puntuaciones.db"
+CACHE_MAX_ENTRADAS = 1_000_000
+
+# Ejecución paralela (sobrescribible con --workers, --hilos y --cola)
+N_WORKERS = 1             # procesos de puntuación; 1 = bucle secuencial en este proceso
+HILOS_POR_WORKER = 1      # hilos de inferencia (intra-op) dentro de cada worker (con --workers > 1)
+TAMANO_COLA = 64          # libros y resultados en vuelo entre procesos
+
+# Precarga (--precarga K): un hilo lee y trocea los siguientes K libros
+# mientras se puntúa el actual; 0 = leer y puntuar uno detrás de otro
+PRECARGA_LIBROS = 0
+
+# Métricas por etapa (búsqueda, lectura, troceado, inferencia, escritura):
+# una línea JSON y el fichero para Prometheus se reescriben cada intervalo
+METRICAS_LOG = "metricas.jsonl"
+METRICAS_PROMETHEUS = "metricas.prom"
+METRICAS_INTERVALO = 60.0
+LIBROS_LENTOS = 10        # libros más lentos que se listan al terminar
+
+# Escritura en SQLite: una transacción cada FLUSH_FILAS libros o FLUSH_SEGUNDOS
+FLUSH_FILAS = 200
+FLUSH_SEGUNDOS = 30.0
+
 # Etiquetas de Detoxify
 labels = [
     "toxicity", "severe_toxicity", "obscene",
     "identity_attack", "insult", "threat", "sexual_explicit"
 ]
 
-# Cargar modelo Detoxify
-detox_model = Detoxify("original")
-
-# === CONEXIÓN A SQLITE ===
-conn = sqlite3.connect(DB_PATH)
-cursor = conn.cursor()
-
-# === CREAR TABLA SI NO EXISTE ===
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS procesados (
-    book_id INTEGER PRIMARY KEY,
-    palabras INTEGER,
-    lenguaje TEXT,
-    anio INTEGER,
-    titulo TEXT,
-    toxicity REAL,
-    severe_toxicity REAL,
-    obscene REAL,
-    identity_attack REAL,
-    insult REAL,
-    threat REAL,
-    sexual_explicit REAL
-)
-""")
-conn.commit()
+# Modelos Detoxify: se cargan bajo demanda para que cada worker tenga los
+# suyos y el proceso escritor no cargue pesos que no usa.
+pool = None
+modelo_activo = None      # modelo del grupo que se está puntuando
+hilos_modelo = None       # hilos de inferencia por proceso (None = los de PyTorch)
+
+
+def cargar_modelo(modelo=None):
+    global pool
+    if pool is None:
+        pool = PoolModelos(lambda nombre: crear_backend(BACKEND, nombre, hilos_modelo, CUANTIZAR, HILOS_INTER),
+                           MEMORIA_MODELOS_MB)
+    return pool.obtener(modelo or modelo_activo)
+
+
+def activar_modelo(modelo):
+    # Modelo con el que se puntúan (y se buscan en la caché) los trozos siguientes
+    global modelo_activo
+    modelo_activo = modelo
+    if cache is not None:
+        cache.modelo = modelo_id(modelo)
+
+
+cache = None
+
+def abrir_cache():
+    global cache
+    if cache is None and CACHE_PATH:
+        # El modelo de las claves lo fija activar_modelo en cada grupo
+        cache = CachePuntuaciones(CACHE_PATH, modelo_activo and modelo_id(modelo_activo), CACHE_MAX_ENTRADAS)
+    return cache
+
+
+def cerrar_cache():
+    # Escribe las marcas de uso pendientes (ver toxiclibros/cache.py)
+    global cache
+    if cache is not None:
+        cache.cerrar()
+        cache = None
+
+
+# Presupuesto de la unidad de trabajo que se está puntuando (None fuera de ella)
+presupuesto = None
+REINTENTAR_CUARENTENA = False
+
+def comprobar_presupuesto():
+    if presupuesto is not None:
+        presupuesto.comprobar()
+
+def vigilar(trozos):
+    # Los trozos de un libro, comprobando el presupuesto antes de cada uno
+    for trozo in trozos:
+        comprobar_presupuesto()
+        yield trozo
+
+
+corpus = None
+
+def abrir_corpus():
+    global corpus
+    if corpus is None and CORPUS_PATH:
+        corpus = CorpusEmpaquetado(CORPUS_PATH)
+    return corpus
+
+
+def aplicar_configuracion(config):
+    # Los workers (spawn) reimportan este módulo con los valores por defecto:
+    # las opciones de línea de comandos que cambian la configuración les
+    # llegan en este dict.
+    global CACHE_PATH, CORPUS_PATH, BACKEND, CUANTIZAR, HILOS_INTER, MODELO, MEMORIA_MODELOS_MB
+    global POLITICA_LOTES, LIBROS_POR_GRUPO, MUESTREO_TOLERANCIA, PRECARGA_LIBROS, TOKENS_POR_TROZO
+    global PRESUPUESTO_SEGUNDOS, PRESUPUESTO_MEMORIA_MB, PRESUPUESTO_FICHERO_MB, REINTENTAR_CUARENTENA
+    global TOP_K_PASAJES, hilos_modelo
+    TOKENS_POR_TROZO = config["tokens_por_trozo"]
+    TOP_K_PASAJES = config["pasajes"]
+    PRESUPUESTO_SEGUNDOS = config["presupuesto_segundos"]
+    PRESUPUESTO_MEMORIA_MB = config["presupuesto_memoria"]
+    PRESUPUESTO_FICHERO_MB = config["presupuesto_fichero"]
+    REINTENTAR_CUARENTENA = config["reintentar_cuarentena"]
+    PRECARGA_LIBROS = config["precarga"]
+    MUESTREO_TOLERANCIA = config["muestreo"]
+    POLITICA_LOTES = config["politica_lotes"]
+    LIBROS_POR_GRUPO = config["libros_por_grupo"]
+    CACHE_PATH = config["cache"]
+    CORPUS_PATH = config["corpus"]
+    BACKEND = config["backend"]
+    CUANTIZAR = config["int8"]
+    HILOS_INTER = config["hilos_inter"]
+    MODELO = config["modelo"]
+    MEMORIA_MODELOS_MB = config["memoria_modelos"]
+    hilos_modelo = config["hilos"]
 
 
 # === FUNCIONES ===
-def registrar(book_id, palabras, lenguaje, anio, titulo, scores):
+def leer_metadatos(conn, incremental):
+    # (book_id, lenguaje, titulo, anio, hash previo, modelo previo) de cada
+    # libro de la tabla metadata; en modo incremental, con la huella de la
+    # fila de procesados puntuada con la versión actual y, si se guardan
+    # pasajes, con su detalle por trozo (el modelo se compara libro a libro
+    # en preparar_tareas)
+    return conn.execute("""
+        SELECT m.book_id, m.lenguaje, m.titulo, m.anio, p.hash_contenido, p.modelo
+        FROM metadata m
+        LEFT JOIN procesados p
+            ON p.book_id = m.book_id AND ? AND p.hash_contenido IS NOT NULL AND p.version_pipeline = ?
+            AND (? OR EXISTS (SELECT 1 FROM trozos_puntuaciones t WHERE t.book_id = p.book_id))
+        ORDER BY m.book_id
+    """, (bool(incremental), version_registrada(), not TOP_K_PASAJES)).fetchall()
+
+
+def registrar(escritor, book_id, palabras, lenguaje, anio, titulo, scores, hash_contenido, modelo,
+              muestra, detalle):
+    # modelo: identificador del modelo con que se puntuó el libro
+    # muestra: (trozos puntuados, trozos del libro, semiancho del IC o None)
+    # detalle: filas de trozos_puntuaciones y pasajes_toxicos (None sin --pasajes)
+    escritor.agregar((
+        book_id,
+        palabras,
+        lenguaje,
+        anio,
+        titulo,
+        float(scores.get("toxicity", 0.0)),
+        float(scores.get("severe_toxicity", 0.0)),
+        float(scores.get("obscene", 0.0)),
+        float(scores.get("identity_attack", 0.0)),
+        float(scores.get("insult", 0.0)),
+        float(scores.get("threat", 0.0)),
+        float(scores.get("sexual_explicit", 0.0)),
+        hash_contenido,
+        version_registrada(),
+        modelo,
+        *muestra,
+        time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+    ), detalle)
+
+
+# Contadores de rendimiento de la ejecución (por proceso)
+estadisticas = {"parrafos": 0, "segundos": 0.0, "cache_consultas": 0, "cache_aciertos": 0,
+                "tokens_reales": 0, "tokens_rellenados": 0, "trozos_omitidos": 0,
+                "precarga_tomas": 0, "precarga_ocupacion": 0, "precarga_vacia": 0,
+                "precarga_espera_consumidor": 0.0, "precarga_espera_productor": 0.0,
+                "modelos_cargas": 0, "modelos_expulsiones": 0}
+
+def parrafos_por_segundo():
+    if estadisticas["segundos"] == 0:
+        return 0.0
+    return estadisticas["parrafos"] / estadisticas["segundos"]
+
+def imprimir_estadisticas(est, segundos):
+    print(f"⚡ {est['parrafos']} trozos en {segundos:.1f} s "
+          f"({est['parrafos'] / max(segundos, 1e-9):.1f} trozos/s)")
+    if est["cache_consultas"]:
+        print(f"🧠 Caché: {est['cache_aciertos']}/{est['cache_consultas']} aciertos "
+              f"({100 * est['cache_aciertos'] / est['cache_consultas']:.1f} %)")
+    if est["trozos_omitidos"]:
+        print(f"🎲 Muestreo: {est['trozos_omitidos']} trozos sin puntuar "
+              f"({100 * est['trozos_omitidos'] / (est['trozos_omitidos'] + est['parrafos']):.1f} %)")
+    if est["tokens_rellenados"]:
+        print(f"📐 Eficiencia de relleno ({POLITICA_LOTES}): "
+              f"{100 * est['tokens_reales'] / est['tokens_rellenados']:.1f} % "
+              f"({est['tokens_reales']} tokens reales / {est['tokens_rellenados']} con relleno, estimados)")
+    if est["precarga_tomas"]:
+        # Cola vacía al pedir el siguiente grupo: la lectura no da abasto (E/S);
+        # lector bloqueado con la cola llena: el modelo no da abasto (cómputo)
+        print(f"🚚 Precarga: ocupación media {est['precarga_ocupacion'] / est['precarga_tomas']:.1f} grupos, "
+              f"vacía en {100 * est['precarga_vacia'] / est['precarga_tomas']:.1f} % de las tomas; "
+              f"puntuación esperando a la lectura {est['precarga_espera_consumidor']:.1f} s, "
+              f"lectura esperando a la puntuación {est['precarga_espera_productor']:.1f} s")
+    if est["modelos_expulsiones"]:
+        print(f"🤖 Modelos: {est['modelos_cargas']} cargas, {est['modelos_expulsiones']} descargados "
+              f"por el tope de {MEMORIA_MODELOS_MB} MB")
+
+def predecir_lote(modelo, lote):
+    # Puntuaciones de cada texto del lote (None si no se pudo puntuar)
     try:
-        cursor.execute("""
-            INSERT INTO procesados (
-                book_id, palabras, lenguaje, anio, titulo,
-                toxicity, severe_toxicity, obscene,
-                identity_attack, insult, threat, sexual_explicit
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(book_id) DO UPDATE SET
-                palabras = excluded.palabras,
-                lenguaje = excluded.lenguaje,
-                anio = excluded.anio,
-                titulo = excluded.titulo,
-                toxicity = excluded.toxicity,
-                severe_toxicity = excluded.severe_toxicity,
-                obscene = excluded.obscene,
-                identity_attack = excluded.identity_attack,
-                insult = excluded.insult,
-                threat = excluded.threat,
-                sexual_explicit = excluded.sexual_explicit
-        """, (
-            book_id,
-            palabras,
-            lenguaje,
-            anio,
-            titulo,
-            float(scores.get("toxicity", 0.0)),
-            float(scores.get("severe_toxicity", 0.0)),
-            float(scores.get("obscene", 0.0)),
-            float(scores.get("identity_attack", 0.0)),
-            float(scores.get("insult", 0.0)),
-            float(scores.get("threat", 0.0)),
-            float(scores.get("sexual_explicit", 0.0))
-        ))
-        conn.commit()
+        resultados = modelo.predict(lote)
+        return [
+            {label: float(resultados[label][i]) for label in labels if label in resultados}
+            for i in range(len(lote))
+        ]
     except Exception as e:
-        print(f"⚠️ Error al registrar {book_id}: {e}")
+        print(f"⚠️ Error al analizar lote de {len(lote)} trozos, reintentando uno a uno: {e}")
+
+    puntuaciones = []
+    for p in lote:
+        try:
+            resultados = modelo.predict(p)
+            puntuaciones.append({label: float(resultados[label]) for label in labels if label in resultados})
+        except Exception as e:
+            print(f"⚠️ Error al analizar trozo: {e}")
+            puntuaciones.append(None)
+    return puntuaciones
+
+def inferir(trozos):
+    # predecir_lote sobre una lista de Trozo, anotando el relleno del lote
+    reales, rellenados = tokens_relleno([t.tokens for t in trozos])
+    estadisticas["tokens_reales"] += reales
+    estadisticas["tokens_rellenados"] += rellenados
+    return predecir_lote(cargar_modelo(), [t.texto for t in trozos])
+
+def puntuar_lote(lote):
+    # Como inferir, pero solo pasa por el modelo lo que no está en la caché
+    comprobar_presupuesto()
+    if cache is None:
+        return inferir(lote)
+
+    textos = [t.texto for t in lote]
+    puntuaciones = cache.buscar(textos)
+    faltan = [i for i, p in enumerate(puntuaciones) if p is None]
+    if faltan:
+        nuevas = inferir([lote[i] for i in faltan])
+        validas = []
+        for i, p in zip(faltan, nuevas):
+            puntuaciones[i] = p
+            if p is not None:
+                validas.append((textos[i], p))
+        if validas:
+            cache.guardar([t for t, _ in validas], [p for _, p in validas])
+    return puntuaciones
+
+def puntuar_trozos(trozos):
+    # Puntuaciones de cada trozo (None si falla) en el orden de entrada,
+    # con los lotes formados según POLITICA_LOTES.
+    puntuaciones = {}
+    lotes = planificar(enumerate(trozos), POLITICA_LOTES, BATCH_SIZE, BATCH_MAX_TOKENS,
+                       tokens=lambda elemento: elemento[1].tokens)
+    for lote in lotes:
+        for (i, _), puntuacion in zip(lote, puntuar_lote([t for _, t in lote])):
+            puntuaciones[i] = puntuacion
+    return [puntuaciones[i] for i in range(len(puntuaciones))]
+
+def actualizar_estadisticas(n, inicio):
+    estadisticas["parrafos"] += n
+    estadisticas["segundos"] += time.perf_counter() - inicio
+    if cache is not None:
+        estadisticas["cache_consultas"] = cache.consultas
+        estadisticas["cache_aciertos"] = cache.aciertos
+
+def analizar_libros(trozos_por_libro):
+    # (medias por etiqueta, trozos puntuados, [(inicio, fin, puntuaciones)] de
+    # cada trozo) de varios libros puntuados juntos: con por_longitud, los
+    # lotes mezclan trozos de todos ellos y las puntuaciones se devuelven a su
+    # libro. Los trozos se consumen de forma perezosa en modo secuencial.
+    propietarios = []
+
+    def trozos_etiquetados():
+        for j, trozos in enumerate(trozos_por_libro):
+            for trozo in vigilar(trozos):
+                propietarios.append((j, trozo.inicio, trozo.fin))
+                yield trozo
+
+    inicio = time.perf_counter()
+    puntuaciones = puntuar_trozos(trozos_etiquetados())
+
+    acumulado = [{label: 0.0 for label in labels} for _ in trozos_por_libro]
+    n = [0] * len(trozos_por_libro)
+    detalles = [[] for _ in trozos_por_libro]
+    for (j, inicio_trozo, fin_trozo), puntuacion in zip(propietarios, puntuaciones):
+        detalles[j].append((inicio_trozo, fin_trozo, puntuacion))
+        if puntuacion is None:
+            continue
+        for label in labels:
+            acumulado[j][label] += puntuacion.get(label, 0.0)
+        n[j] += 1
+
+    actualizar_estadisticas(sum(n), inicio)
+
+    return [
+        ({label: float(acumulado[j][label] / n[j]) if n[j] else 0.0 for label in labels}, n[j], detalles[j])
+        for j in range(len(trozos_por_libro))
+    ]
+
+def analizar_muestreo(trozos, semilla):
+    # (medias, (trozos puntuados, trozos del libro, semiancho del IC), detalle)
+    # puntuando lotes de una muestra estratificada hasta que todas las medias
+    # convergen; en el detalle, los trozos fuera de la muestra van sin puntuación
+    trozos = list(vigilar(trozos))
+    total = len(trozos)
+    if total <= MUESTREO_MINIMO:
+        media, n, detalle = analizar_libros([trozos])[0]
+        return media, (n, total, None), detalle
+
+    inicio = time.perf_counter()
+    estimador = EstimadorMedias(labels)
+    orden = orden_estratificado(total, MUESTREO_ESTRATOS, random.Random(semilla))
+    puntuadas = {}
+    # Lotes con el mismo tope de tokens que puntuar_trozos, pero en el orden
+    # estratificado: lo puntuado es siempre un prefijo de la muestra
+    lotes = planificar(((i, trozos[i]) for i in orden), "secuencial", BATCH_SIZE, BATCH_MAX_TOKENS,
+                       tokens=lambda elemento: elemento[1].tokens)
+    for lote in lotes:
+        for (i, _), puntuacion in zip(lote, puntuar_lote([t for _, t in lote])):
+            puntuadas[i] = puntuacion
+            if puntuacion is not None:
+                estimador.agregar(puntuacion)
+        if estimador.n >= MUESTREO_MINIMO and estimador.convergido(MUESTREO_TOLERANCIA, total):
+            break
+    actualizar_estadisticas(estimador.n, inicio)
+    estadisticas["trozos_omitidos"] += total - estimador.n
 
+    media = {label: float(estimador.medias[label]) for label in labels}
+    detalle = [(t.inicio, t.fin, puntuadas.get(i)) for i, t in enumerate(trozos)]
+    return media, (estimador.n, total, estimador.semiancho_maximo(total)), detalle
 
-def buscar_archivo_pkl(book_id):
-    patron = f"{book_id}_"
-    for root, _, files in os.walk(BOOKS_FOLDER):
-        for file in files:
-            if file.startswith(patron) and file.endswith(".pkl"):
-                return os.path.join(root, file)
-    return None
 
-def dividir_en_parrafos(texto):
-    texto = re.sub(r'\s+', ' ', texto).strip()
-    return [p.strip() for p in texto.split('\n') if p.strip()]
+def es_forzado(book_id, lenguaje, forzar):
+    # forzar: None (nada), [] (todo) o lista de IDs y/o lenguajes
+    if forzar is None:
+        return False
+    if not forzar:
+        return True
+    return str(book_id) in forzar or str(lenguaje).lower() in forzar
 
-def analizar_parrafos(parrafos):
-    if not parrafos:
-        return {label: 0.0 for label in labels}
 
-    acumulado = {label: 0.0 for label in labels}
-    n = 0
+def preparar_tareas(metadatos, indice, forzar):
+    # Una tarea por libro con su fichero, los metadatos que necesita el registro,
+    # la huella ya registrada (None = puntuar siempre) y el modelo que le toca,
+    # para que los workers no tengan que cargar los metadatos, el índice ni la
+    # base de datos. Se devuelven ordenadas por modelo.
+    tareas = []
+    for book_id, lenguaje, titulo, anio, hash_previo, modelo_previo in metadatos:
+        file_path = indice.get(book_id)
+        if not file_path:
+            continue
 
-    for p in parrafos:
+        modelo = modelo_de(lenguaje)
+        huella_previa = None
+        if hash_previo is not None and modelo_previo == modelo_id(modelo) \
+                and not es_forzado(book_id, lenguaje, forzar):
+            huella_previa = hash_previo
+
+        tareas.append((book_id, file_path, lenguaje, titulo, anio, huella_previa, modelo))
+    tareas.sort(key=lambda tarea: tarea[6])
+    return tareas
+
+
+SIN_CAMBIOS = "sin_cambios"
+
+def comprobar_tamano(n_bytes):
+    if PRESUPUESTO_FICHERO_MB and n_bytes > PRESUPUESTO_FICHERO_MB * 2**20:
+        raise PresupuestoExcedido("tamaño", {"bytes": n_bytes})
+
+def leer_libro(book_id, file_path, huella_previa, crono=None):
+    # (texto, hash del .pkl) o SIN_CAMBIOS si el hash coincide con la huella.
+    # En el corpus empaquetado el hash viene en su índice y no hace falta leer.
+    crono = crono or Cronometro()
+    if corpus is not None:
+        with crono.medir("busqueda"):
+            hash_contenido = corpus.hash(book_id)
+        if hash_contenido == huella_previa:
+            return SIN_CAMBIOS
+        comprobar_tamano(len(corpus.bytes(book_id)))
+        with crono.medir("lectura"):
+            return corpus.texto(book_id), hash_contenido
+
+    with crono.medir("busqueda"):
+        f = open(file_path, "rb")
+    with f, crono.medir("lectura"):
+        comprobar_tamano(os.fstat(f.fileno()).st_size)
+        datos = f.read()
+        hash_contenido = hashlib.sha1(datos).hexdigest()
+        if hash_contenido == huella_previa:
+            return SIN_CAMBIOS
+        texto = pickle.loads(datos)
+    if not isinstance(texto, str):
+        raise ValueError("Contenido no es texto")
+    return texto, hash_contenido
+
+
+def cargar_grupo(tareas, materializar=False):
+    # Lectura y troceado de un grupo: (resultados, pendientes, cronos), donde
+    # resultados ya tiene SIN_CAMBIOS en los libros que no hay que puntuar (o
+    # su Cuarentena si exceden el presupuesto al leerlos), pendientes es
+    # [(índice, troceador, trozos, hash)] y cronos los tiempos por etapa de
+    # cada tarea. Sin materializar, los trozos son el propio troceador y se
+    # generan al puntuar; materializados (precarga) el troceado ocurre aquí,
+    # fuera del hilo del modelo, con el presupuesto de cada libro.
+    resultados = [None] * len(tareas)
+    cronos = [Cronometro() for _ in tareas]
+    pendientes = []
+    for i, tarea in enumerate(tareas):
+        book_id = tarea[0]
+        troceador = None
         try:
-            resultados = detox_model.predict(p[:512])
-            for label in labels:
-                acumulado[label] += float(resultados.get(label, 0.0))
-            n += 1
+            leido = leer_libro(book_id, tarea[1], tarea[5], cronos[i])
+            if leido is SIN_CAMBIOS:
+                resultados[i] = SIN_CAMBIOS
+                continue
+            texto, hash_contenido = leido
+            # Las palabras se cuentan en la misma pasada que genera los trozos
+            troceador = Troceador(texto, TOKENS_POR_TROZO)
+            if materializar:
+                limite = Presupuesto(PRESUPUESTO_SEGUNDOS, PRESUPUESTO_MEMORIA_MB)
+                with cronos[i].medir("troceado"):
+                    trozos = []
+                    for trozo in troceador:
+                        limite.comprobar()
+                        trozos.append(trozo)
+            else:
+                trozos = troceador
+            pendientes.append((i, troceador, trozos, hash_contenido))
+        except PresupuestoExcedido as e:
+            if troceador is not None:
+                e.uso["trozos"] = troceador.trozos
+            print(f"🚧 [{book_id}] {e}; a cuarentena")
+            resultados[i] = Cuarentena(e.motivo, e.uso)
         except Exception as e:
-            print(f"⚠️ Error al analizar párrafo: {e}")
+            print(f"❌ [{book_id}] Error procesando: {e}")
+    return resultados, pendientes, cronos
+
+
+def puntuar_grupo(tareas, cargado):
+    # (filas, cronos) con una entrada por tarea: la fila a registrar,
+    # SIN_CAMBIOS si el .pkl coincide con la huella registrada, Cuarentena si
+    # excede el presupuesto o None si el libro falla, y su Cronometro.
+    global presupuesto
+    resultados, pendientes, cronos = cargado
+    if not pendientes:
+        return resultados, cronos
+    # Todos los libros de un grupo comparten modelo; se carga (si hace falta)
+    # antes de empezar a contar el presupuesto
+    activar_modelo(tareas[0][6])
+    cargar_modelo()
+
+    # El troceado perezoso ocurre dentro de la puntuación: se cronometra por
+    # separado y el resto del tiempo (caché incluida) cuenta como inferencia.
+    def troceado_pendientes():
+        return sum(cronos[i].tiempos.get("troceado", 0.0) for i, _, _, _ in pendientes)
+
+    # El presupuesto de un grupo es la suma del de sus libros; si se excede
+    # van todos a cuarentena y el reintento los separa uno a uno
+    n = len(pendientes)
+    presupuesto = Presupuesto(PRESUPUESTO_SEGUNDOS and PRESUPUESTO_SEGUNDOS * n,
+                              PRESUPUESTO_MEMORIA_MB and PRESUPUESTO_MEMORIA_MB * n)
+    inicio, troceado_previo = time.perf_counter(), troceado_pendientes()
+    try:
+        if MUESTREO_TOLERANCIA:
+            analizados = []
+            for i, _, trozos, _ in pendientes:
+                inicio_libro, troceado_libro = time.perf_counter(), cronos[i].tiempos.get("troceado", 0.0)
+                analizados.append(analizar_muestreo(cronos[i].cronometrar(trozos, "troceado"), tareas[i][0]))
+                cronos[i].sumar("inferencia", time.perf_counter() - inicio_libro
+                                - (cronos[i].tiempos["troceado"] - troceado_libro))
+        else:
+            analizados = [
+                (media, (n, troceador.trozos, None), detalle)
+                for (media, n, detalle), (_, troceador, _, _) in zip(
+                    analizar_libros([cronos[i].cronometrar(trozos, "troceado") for i, _, trozos, _ in pendientes]),
+                    pendientes)
+            ]
+            # Con por_longitud los lotes mezclan libros: el tiempo del grupo se
+            # reparte en proporción a los trozos de cada uno
+            inferencia = time.perf_counter() - inicio - (troceado_pendientes() - troceado_previo)
+            total_trozos = sum(troceador.trozos for _, troceador, _, _ in pendientes)
+            for i, troceador, _, _ in pendientes:
+                parte = troceador.trozos / total_trozos if total_trozos else 1 / len(pendientes)
+                cronos[i].sumar("inferencia", inferencia * parte)
+    except PresupuestoExcedido as e:
+        print(f"🚧 [{', '.join(str(tareas[i][0]) for i, _, _, _ in pendientes)}] {e}; a cuarentena")
+        for i, troceador, _, _ in pendientes:
+            resultados[i] = Cuarentena(e.motivo, dict(e.uso, trozos=troceador.trozos))
+        return resultados, cronos
+    except Exception as e:
+        print(f"❌ [{', '.join(str(tareas[i][0]) for i, _, _, _ in pendientes)}] Error procesando: {e}")
+        return resultados, cronos
+    finally:
+        presupuesto = None
+
+    for (i, troceador, _, hash_contenido), (scores, muestra, detalle) in zip(pendientes, analizados):
+        book_id, _, lenguaje, titulo, anio, _, modelo = tareas[i]
+        if TOP_K_PASAJES:
+            detalle = detalle_libro(book_id, troceador.texto, detalle, TOP_K_PASAJES)
+        else:
+            detalle = None
+        resultados[i] = (book_id, troceador.palabras, lenguaje, anio, titulo, scores, hash_contenido,
+                         modelo_id(modelo), muestra, detalle)
+        cronos[i].trozos, cronos[i].tokens = troceador.trozos, troceador.tokens
+        if muestra[2] is None:
+            # Puntuado entero: los trozos que faltan son los que fallaron
+            cronos[i].fallidos = troceador.trozos - muestra[0]
+    return resultados, cronos
 
-    if n == 0:
-        return {label: 0.0 for label in labels}
 
-    media = {label: float(acumulado[label] / n) for label in labels}
-    return media
+def tam_grupo():
+    # Solo tiene sentido puntuar varios libros juntos si se reordenan sus trozos
+    # (el muestreo decide libro a libro cuándo parar y el reintento de la
+    # cuarentena aísla cada libro)
+    if POLITICA_LOTES == "por_longitud" and not MUESTREO_TOLERANCIA and not REINTENTAR_CUARENTENA:
+        return LIBROS_POR_GRUPO
+    return 1
 
-# === CARGAR METADATOS ===
-df = pd.read_csv(METADATA_CSV)
-# df = df[df['Language'] == 'English'] eliminado filtro
-df = df.set_index('Book Num')
-print(f"📄 Libros en inglés encontrados: {len(df)}")
 
-# === PROCESAR LIBROS ===
-for book_id in tqdm(df.index, desc="📖 Analizando libros"):
-    file_path = buscar_archivo_pkl(book_id)
-    if not file_path:
-        continue
+def formar_grupos(tareas, n_grupo):
+    # Grupos consecutivos de hasta n_grupo libros con el mismo modelo
+    for _, tareas_modelo in itertools.groupby(tareas, key=lambda tarea: tarea[6]):
+        tareas_modelo = list(tareas_modelo)
+        for k in range(0, len(tareas_modelo), n_grupo):
+            yield tareas_modelo[k:k + n_grupo]
 
+
+def grupos_cargados(grupos):
+    # Iterable de (grupo, cargado). Con precarga, la lectura y el troceado de
+    # los siguientes grupos avanzan en otro hilo mientras se puntúa el actual.
+    if PRECARGA_LIBROS:
+        profundidad = -(-PRECARGA_LIBROS // tam_grupo())  # K libros, en grupos
+        return Precargador(grupos, lambda grupo: cargar_grupo(grupo, materializar=True), profundidad)
+    return ((grupo, cargar_grupo(grupo)) for grupo in grupos)
+
+
+# === COMPROBACIÓN DE PARIDAD ===
+def ejecutar_paridad(tareas, n_trozos):
+    # Puntúa una muestra de trozos de los libros de cada modelo con PyTorch y
+    # con el backend elegido y muestra la diferencia máxima, como evidencia
+    # para aceptar el más rápido.
+    for modelo, tareas_modelo in itertools.groupby(tareas, key=lambda tarea: tarea[6]):
+        tareas_modelo = list(tareas_modelo)
+        muestra = []
+        for tarea in random.Random(42).sample(tareas_modelo, len(tareas_modelo)):
+            leido = leer_libro(tarea[0], tarea[1], None)
+            muestra.extend(t.texto for t in Troceador(leido[0], TOKENS_POR_TROZO))
+            if len(muestra) >= n_trozos:
+                break
+        muestra = muestra[:n_trozos]
+
+        print(f"🔬 Paridad {BACKEND} ({modelo_id(modelo)}) frente a pytorch en {len(muestra)} trozos")
+        referencia = crear_backend("pytorch", modelo)
+        candidato = cargar_modelo(modelo)
+        inicio = time.perf_counter()
+        diferencias = comprobar_paridad(referencia, candidato, muestra, BATCH_SIZE)
+        del referencia
+        for etiqueta, diferencia in sorted(diferencias.items()):
+            print(f"   {etiqueta:<16} {diferencia:.2e}")
+        print(f"📏 Diferencia máxima: {max(diferencias.values(), default=0.0):.2e} "
+              f"({time.perf_counter() - inicio:.1f} s)")
+
+
+def crear_metricas(config):
+    return Metricas(config["metricas_log"], config["metricas_prometheus"],
+                    config["metricas_intervalo"], LIBROS_LENTOS)
+
+
+def imprimir_cuarentena(apartados):
+    if apartados:
+        print(f"🚧 {apartados} libros a cuarentena; reintenta con --reintentar-cuarentena "
+              f"(y, por ejemplo, otro --tokens-por-trozo)")
+
+
+# === MODO SECUENCIAL ===
+def ejecutar_secuencial(tareas, config):
+    conn = conectar(DB_PATH)
+    crear_tabla_procesados(conn)
+    crear_tabla_cuarentena(conn)
+    escritor = EscritorProcesados(conn, config["flush_filas"], config["flush_segundos"],
+                                  limpiar_cuarentena=REINTENTAR_CUARENTENA)
+    abrir_cache()
+    abrir_corpus()
+    metricas = crear_metricas(config)
+    inicio = time.perf_counter()
+
+    sin_cambios = 0
+    apartados = 0
+    cargados = grupos_cargados(formar_grupos(tareas, tam_grupo()))
+    barra = tqdm(total=len(tareas), desc="📖 Analizando libros")
     try:
-        with open(file_path, "rb") as f:
-            texto = pickle.load(f)
-        if not isinstance(texto, str):
-            raise ValueError("Contenido no es texto")
+        for grupo, cargado in cargados:
+            filas, cronos = puntuar_grupo(grupo, cargado)
+            for tarea, fila, crono in zip(grupo, filas, cronos):
+                if fila is None:
+                    metricas.libro(tarea[0], crono, "error")
+                    continue
+                if fila is SIN_CAMBIOS:
+                    sin_cambios += 1
+                    metricas.libro(tarea[0], crono, "sin_cambios")
+                    continue
+                if isinstance(fila, Cuarentena):
+                    apartados += 1
+                    registrar_cuarentena(conn, tarea[0], fila.motivo, fila.uso, TOKENS_POR_TROZO)
+                    metricas.libro(tarea[0], crono, "cuarentena")
+                    continue
+                with crono.medir("escritura"):
+                    registrar(escritor, *fila)
+                metricas.libro(fila[0], crono, "puntuado")
+                print(f"✅ Analizado {fila[0]}")
+            barra.update(len(grupo))
+            if isinstance(cargados, Precargador):
+                barra.set_postfix(parrafos_s=f"{parrafos_por_segundo():.1f}",
+                                  precarga=f"{cargados.ocupacion()}/{cargados.profundidad}")
+            else:
+                barra.set_postfix(parrafos_s=f"{parrafos_por_segundo():.1f}")
+    except KeyboardInterrupt:
+        # Lo pendiente se vuelca al cerrar: basta relanzar con --incremental para seguir
+        print("\n⏸️ Interrumpido; relanza con --incremental para continuar donde se quedó.")
+    finally:
+        escritor.cerrar()
+        cerrar_cache()
+        if isinstance(cargados, Precargador):
+            estadisticas.update(cargados.estadisticas())
+        if pool is not None:
+            estadisticas.update(pool.estadisticas())
 
-        palabras = len(texto.split())
-        lenguaje = df.loc[book_id, 'Language']
-        titulo = df.loc[book_id, 'Book Title']
+    if sin_cambios:
+        print(f"⏭️ {sin_cambios} libros sin cambios omitidos")
+    imprimir_cuarentena(apartados)
+    imprimir_estadisticas(estadisticas, time.perf_counter() - inicio)
+    metricas.cerrar()
 
-        published = df.loc[book_id, 'Published Date']
-        anio = None
-        if isinstance(published, str):
-            match = re.search(r"(\d{4})", published)
-            if match:
-                anio = int(match.group(1))
 
-        parrafos = dividir_en_parrafos(texto)
-        scores = analizar_parrafos(parrafos)
+# === MODO PARALELO ===
+# Mensajes de cada worker (por su tubería; el proceso principal los reenvía al
+# escritor por la cola de resultados):
+#   ("libro", fila, crono)                   -> registrar en procesados
+#   ("omitido", book_id[, crono])            -> libro con error (sin crono si cayó el worker)
+#   ("sin_cambios", book_id, crono)          -> misma huella, no se puntúa
+#   ("cuarentena", book_id, Cuarentena, crono) -> excede el presupuesto o tumba
+#                                               al worker (sin crono)
+#   ("estadisticas", dict)                   -> contadores de cada worker al terminar
+#   None                                     -> fin, el escritor cierra
 
-        registrar(book_id, palabras, lenguaje, anio, titulo, scores)
-        print(f"✅ Analizado {book_id}")
+def grupos_de_cola(cola_tareas, n_grupo):
+    # Grupos de hasta n_grupo libros del mismo modelo ya disponibles en la
+    # cola, hasta el centinela. Un libro de otro modelo abre el grupo siguiente.
+    terminado = False
+    siguiente = None
+    while not terminado:
+        grupo = []
+        tarea = siguiente if siguiente is not None else cola_tareas.get()
+        siguiente = None
+        while tarea is not None:
+            if grupo and tarea[6] != grupo[0][6]:
+                siguiente = tarea
+                break
+            grupo.append(tarea)
+            if len(grupo) >= n_grupo:
+                break
+            try:
+                tarea = cola_tareas.get_nowait()
+            except queue.Empty:
+                break
+        terminado = tarea is None
+        if grupo:
+            yield grupo
+
+
+def worker_libros(id_worker, cola_tareas, conexion, en_curso, inicio_en_curso, config):
+    # Ctrl-C lo gestiona el proceso principal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    aplicar_configuracion(config)
+    abrir_cache()
+    abrir_corpus()
+
+    # conexion.send() escribe desde este hilo: lo enviado sigue en la tubería
+    # aunque el worker caiga justo después (Queue.put() lo deja en un búfer que
+    # vuelca otro hilo, y un worker que cae a mitad bloquea la cola a todos).
+    # Lo que no llegó a enviar (precarga incluida) se reparte otra vez.
+    # en_curso: tam_grupo() huecos por worker con los libros del grupo actual
+    n_grupo = tam_grupo()
+    huecos = range(id_worker * n_grupo, (id_worker + 1) * n_grupo)
+    cargados = grupos_cargados(grupos_de_cola(cola_tareas, n_grupo))
+    for grupo, cargado in cargados:
+        inicio_en_curso[id_worker] = time.time()
+        for hueco, tarea in itertools.zip_longest(huecos, grupo):
+            en_curso[hueco] = tarea[0] if tarea is not None else -1
+        filas, cronos = puntuar_grupo(grupo, cargado)
+        for tarea, fila, crono in zip(grupo, filas, cronos):
+            if fila is None:
+                conexion.send(("omitido", tarea[0], crono))
+            elif fila is SIN_CAMBIOS:
+                conexion.send(("sin_cambios", tarea[0], crono))
+            elif isinstance(fila, Cuarentena):
+                conexion.send(("cuarentena", tarea[0], fila, crono))
+            else:
+                conexion.send(("libro", fila, crono))
+        for hueco in huecos:
+            en_curso[hueco] = -1
+
+    cerrar_cache()
+    if isinstance(cargados, Precargador):
+        estadisticas.update(cargados.estadisticas())
+    if pool is not None:
+        estadisticas.update(pool.estadisticas())
+    conexion.send(("estadisticas", dict(estadisticas)))
+
+
+def escritor_resultados(cola_resultados, total, db_path, config):
+    # Único proceso que escribe en SQLite; solo el proceso principal le envía
+    # resultados, así que la caída de un worker no afecta a esta cola.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    aplicar_configuracion(config)
+    conn = conectar(db_path)
+    crear_tabla_procesados(conn)
+    crear_tabla_cuarentena(conn)
+    escritor = EscritorProcesados(conn, config["flush_filas"], config["flush_segundos"],
+                                  limpiar_cuarentena=REINTENTAR_CUARENTENA)
+    metricas = crear_metricas(config)
+    inicio = time.perf_counter()
+    totales = {clave: 0 for clave in estadisticas}
+    sin_cambios = 0
+    apartados = 0
+
+    barra = tqdm(total=total, desc="📖 Analizando libros")
+    while True:
+        try:
+            mensaje = cola_resultados.get(timeout=1.0)
+        except queue.Empty:
+            escritor.volcar_si_toca()
+            metricas.volcar_si_toca()
+            continue
+        if mensaje is None:
+            break
+        tipo = mensaje[0]
+        if tipo == "libro":
+            fila, crono = mensaje[1], mensaje[2]
+            with crono.medir("escritura"):
+                registrar(escritor, *fila)
+            metricas.libro(fila[0], crono, "puntuado")
+            print(f"✅ Analizado {fila[0]}")
+            barra.update(1)
+        elif tipo == "omitido":
+            metricas.libro(mensaje[1], mensaje[2] if len(mensaje) > 2 else None, "error")
+            barra.update(1)
+        elif tipo == "sin_cambios":
+            sin_cambios += 1
+            metricas.libro(mensaje[1], mensaje[2], "sin_cambios")
+            barra.update(1)
+        elif tipo == "cuarentena":
+            book_id, apartado, crono = mensaje[1], mensaje[2], mensaje[3]
+            apartados += 1
+            registrar_cuarentena(conn, book_id, apartado.motivo, apartado.uso, TOKENS_POR_TROZO)
+            metricas.libro(book_id, crono, "cuarentena")
+            barra.update(1)
+        elif tipo == "estadisticas":
+            for clave, valor in mensaje[1].items():
+                totales[clave] += valor
+    barra.close()
+    escritor.cerrar()
+
+    if sin_cambios:
+        print(f"⏭️ {sin_cambios} libros sin cambios omitidos")
+    imprimir_cuarentena(apartados)
+    imprimir_estadisticas(totales, time.perf_counter() - inicio)
+    metricas.cerrar()
+
+
+def ejecutar_paralelo(tareas, config):
+    # "spawn" en todas las plataformas: PyTorch no es seguro tras fork y en
+    # Windows es el único método disponible.
+    ctx = mp.get_context("spawn")
+    n_workers, hilos, tamano_cola = config["workers"], config["hilos"], config["cola"]
+    # Una cola de tareas y una tubería de resultados por worker: el proceso
+    # principal sabe qué libros tiene cada uno y, si cae, cuáles no llegaron.
+    n_grupo = tam_grupo()
+    capacidad = max(1, tamano_cola // n_workers, n_grupo)
+    colas_tareas = [None] * n_workers
+    receptores = [None] * n_workers
+    cola_resultados = ctx.Queue(tamano_cola)
+    en_curso = ctx.Array("q", [-1] * (n_workers * n_grupo), lock=False)  # ver worker_libros
+    inicio_en_curso = ctx.Array("d", [0.0] * n_workers, lock=False)
+    # Vigilante: un grupo que no termina ni con el margen sobre su presupuesto
+    # (p. ej. bloqueado dentro de una llamada al modelo) se corta matando al worker
+    limite_grupo = PRESUPUESTO_SEGUNDOS * n_grupo * MARGEN_VIGILANTE
+
+    def lanzar_worker(i):
+        # Cola nueva: la del worker caído puede quedar a medio leer
+        if colas_tareas[i] is not None:
+            colas_tareas[i].cancel_join_thread()
+        colas_tareas[i] = ctx.Queue(capacidad)
+        receptores[i], emisor = ctx.Pipe(duplex=False)
+        p = ctx.Process(target=worker_libros,
+                        args=(i, colas_tareas[i], emisor, en_curso, inicio_en_curso, config),
+                        daemon=True)
+        p.start()
+        emisor.close()  # al morir el worker, recv() da EOFError en vez de bloquearse
+        return p
+
+    escritor = ctx.Process(target=escritor_resultados,
+                           args=(cola_resultados, len(tareas), DB_PATH, config))
+    escritor.start()
+    workers = [lanzar_worker(i) for i in range(n_workers)]
+    print(f"🚀 {n_workers} workers x {hilos} hilos, cola de {capacidad} por worker")
+
+    por_repartir = deque(tareas)
+    pendientes = [{} for _ in range(n_workers)]  # book_id -> tarea enviada y sin resultado, por worker
+    cerrados = [False] * n_workers  # ya tiene su centinela
+
+    def repartir():
+        # Por turnos, mientras quepa algo en la cola de algún worker
+        hubo_hueco = True
+        while por_repartir and hubo_hueco:
+            hubo_hueco = False
+            for i in range(n_workers):
+                if not por_repartir or cerrados[i]:
+                    continue
+                try:
+                    colas_tareas[i].put_nowait(por_repartir[0])
+                except queue.Full:
+                    continue
+                tarea = por_repartir.popleft()
+                pendientes[i][tarea[0]] = tarea
+                hubo_hueco = True
+
+    def atender(i):
+        # Reenvía al escritor un mensaje del worker i; False si no enviará más
+        if receptores[i] is None:
+            return False
+        try:
+            mensaje = receptores[i].recv()
+        except (EOFError, OSError):  # OSError: cayó a mitad de un mensaje
+            receptores[i].close()
+            receptores[i] = None
+            return False
+        if mensaje[0] != "estadisticas":
+            pendientes[i].pop(mensaje[1][0] if mensaje[0] == "libro" else mensaje[1], None)
+        cola_resultados.put(mensaje)
+        return True
+
+    def recuperar(i, en_vuelo, motivo, segundos):
+        # Del worker caído: el grupo que tenía en curso va entero a cuarentena
+        # (con --reintentar-cuarentena se puntúa libro a libro); lo demás
+        # que no llegó a enviar (precargado) se reparte otra vez.
+        while atender(i):
+            pass
+        reencolados = [tarea for book_id, tarea in pendientes[i].items() if book_id not in en_vuelo]
+        for book_id in pendientes[i].keys() & en_vuelo:
+            apartado = Cuarentena(motivo, {"segundos": round(segundos, 3)})
+            cola_resultados.put(("cuarentena", book_id, apartado, None))
+        por_repartir.extendleft(reversed(reencolados))
+        pendientes[i] = {}
+        if reencolados:
+            print(f"🔁 {len(reencolados)} libros del worker {i} vuelven a la cola")
+
+    try:
+        while True:
+            listos = esperar_conexiones([r for r in receptores if r is not None], timeout=0.5)
+            for i, receptor in enumerate(receptores):
+                if receptor is not None and receptor in listos:
+                    atender(i)
+
+            # Un worker caído se sustituye
+            for i, w in enumerate(workers):
+                huecos = range(i * n_grupo, (i + 1) * n_grupo)
+                en_vuelo = {en_curso[hueco] for hueco in huecos} - {-1}
+                segundos = time.time() - inicio_en_curso[i]
+                if limite_grupo and w.exitcode is None and en_vuelo and segundos > limite_grupo:
+                    print(f"⏱️ Worker {i} lleva {segundos:.0f} s con los libros {sorted(en_vuelo)}; deteniéndolo")
+                    w.terminate()
+                    w.join()
+                    # Pudo pasar al grupo siguiente antes de morir
+                    en_vuelo = {en_curso[hueco] for hueco in huecos} - {-1}
+                    motivo = "tiempo"
+                elif w.exitcode not in (None, 0):
+                    print(f"💥 Worker {i} terminó con código {w.exitcode} (libros {sorted(en_vuelo)}); relanzando")
+                    motivo = f"caída del worker (código {w.exitcode})"
+                else:
+                    continue
+                recuperar(i, en_vuelo, motivo, segundos)
+                for hueco in huecos:
+                    en_curso[hueco] = -1
+                cerrados[i] = False
+                workers[i] = lanzar_worker(i)
+
+            repartir()
+            if not por_repartir:
+                for i in range(n_workers):
+                    if not cerrados[i]:
+                        try:
+                            colas_tareas[i].put_nowait(None)
+                            cerrados[i] = True
+                        except queue.Full:
+                            pass
+            if all(cerrados) and all(r is None for r in receptores) and all(w.exitcode == 0 for w in workers):
+                break
+    except KeyboardInterrupt:
+        # Se detienen los workers (lo que tengan en curso se pierde) y el
+        # escritor vacía la cola, así que todo lo recibido queda registrado.
+        print("\n⏸️ Interrumpido; relanza con --incremental para continuar donde se quedó.")
+        for w in workers:
+            w.terminate()
+    finally:
+        cola_resultados.put(None)
+        escritor.join()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Análisis de toxicidad de libros de Gutenberg")
+    parser.add_argument("--workers", type=int, default=N_WORKERS,
+                        help="procesos de puntuación (1 = secuencial)")
+    parser.add_argument("--hilos", type=int,
+                        help="hilos de inferencia (intra-op) por proceso, también sin --workers "
+                             f"(por defecto, los de PyTorch en modo secuencial y {HILOS_POR_WORKER} por worker)")
+    parser.add_argument("--cola", type=int, default=TAMANO_COLA,
+                        help="profundidad de las colas de tareas y resultados")
+    parser.add_argument("--flush-filas", type=int, default=FLUSH_FILAS,
+                        help="libros por transacción en SQLite")
+    parser.add_argument("--flush-segundos", type=float, default=FLUSH_SEGUNDOS,
+                        help="segundos máximos entre transacciones")
+    parser.add_argument("--precarga", type=int, metavar="K", default=PRECARGA_LIBROS,
+                        help="leer y trocear en segundo plano los siguientes K libros (0 = sin precarga)")
+    parser.add_argument("--metricas-log", default=METRICAS_LOG,
+                        help="fichero JSON lines con una instantánea de las métricas por intervalo")
+    parser.add_argument("--metricas-prometheus", default=METRICAS_PROMETHEUS,
+                        help="fichero de texto con las métricas en formato Prometheus")
+    parser.add_argument("--metricas-intervalo", type=float, default=METRICAS_INTERVALO,
+                        help="segundos entre volcados de métricas")
+    parser.add_argument("--presupuesto-segundos", type=float, default=PRESUPUESTO_SEGUNDOS,
+                        help="segundos máximos por libro antes de apartarlo a cuarentena (0 = sin límite)")
+    parser.add_argument("--presupuesto-memoria", type=float, metavar="MB", default=PRESUPUESTO_MEMORIA_MB,
+                        help="crecimiento máximo de memoria por libro en MB (0 = sin límite)")
+    parser.add_argument("--presupuesto-fichero", type=float, metavar="MB", default=PRESUPUESTO_FICHERO_MB,
+                        help="tamaño máximo del .pkl de un libro en MB (0 = sin límite)")
+    parser.add_argument("--reintentar-cuarentena", action="store_true",
+                        help="puntuar solo los libros en cuarentena, uno a uno")
+    parser.add_argument("--tokens-por-trozo", type=int, default=PIPELINE_TOKENS_POR_TROZO,
+                        help="tamaño aproximado de cada trozo en tokens (cambiarlo hace que "
+                             "--incremental vuelva a puntuar los libros)")
+    parser.add_argument("--pasajes", type=int, metavar="K", default=TOP_K_PASAJES,
+                        help="guardar las puntuaciones de cada trozo y los K pasajes más tóxicos "
+                             "por etiqueta (0 = solo las medias)")
+    parser.add_argument("--politica-lotes", choices=POLITICAS, default=POLITICA_LOTES,
+                        help="orden de los trozos al formar los lotes de inferencia")
+    parser.add_argument("--libros-por-grupo", type=int, default=LIBROS_POR_GRUPO,
+                        help="con por_longitud, libros que se reordenan y puntúan juntos")
+    parser.add_argument("--muestreo", type=float, metavar="TOL", default=MUESTREO_TOLERANCIA,
+                        help="estimar cada libro con una muestra de trozos hasta que el IC 95 %% "
+                             "de cada media tenga semiancho <= TOL")
+    parser.add_argument("--modelo", default=MODELO,
+                        help="usar este modelo de Detoxify para todos los libros "
+                             "(por defecto, según el lenguaje: ver MODELOS_POR_LENGUAJE)")
+    parser.add_argument("--memoria-modelos", type=float, metavar="MB", default=MEMORIA_MODELOS_MB,
+                        help="memoria máxima de los modelos cargados a la vez por proceso")
+    parser.add_argument("--backend", choices=BACKENDS, default=BACKEND,
+                        help="motor de inferencia")
+    parser.add_argument("--int8", action="store_true", default=CUANTIZAR,
+                        help="con --backend onnx, usar el modelo cuantizado a int8")
+    parser.add_argument("--hilos-inter", type=int, default=HILOS_INTER,
+                        help="con --backend onnx, hilos entre operadores")
+    parser.add_argument("--paridad", type=int, metavar="N_TROZOS",
+                        help="comparar el backend elegido con pytorch en N trozos y salir")
+    parser.add_argument("--cache", default=CACHE_PATH,
+                        help="base de datos de la caché de puntuaciones por trozo")
+    parser.add_argument("--sin-cache", dest="cache", action="store_const", const=None,
+                        help="puntuar todos los trozos sin consultar la caché")
+    parser.add_argument("--corpus", default=CORPUS_PATH,
+                        help="leer los libros del corpus empaquetado en esta carpeta en vez de los .pkl")
+    parser.add_argument("--shard", type=parsear_shard, metavar="I/N",
+                        help="puntuar solo el shard I de N (0 <= I < N) en su propia base de datos")
+    parser.add_argument("--incremental", action="store_true",
+                        help="omitir libros cuyo .pkl, modelo y versión no han cambiado")
+    parser.add_argument("--force", nargs="*", metavar="ID_O_LENGUAJE",
+                        help="en modo incremental, repuntuar estos IDs o lenguajes (sin valores: todos)")
+    args = parser.parse_args()
+    if args.force is not None:
+        args.force = [valor.lower() for valor in args.force]
+    if args.hilos is None and args.workers > 1:
+        args.hilos = HILOS_POR_WORKER  # sin limitar, los workers se pisarían los núcleos
+    return args
+
+
+def main():
+    global DB_PATH
+    args = parse_args()
+    config = vars(args)
+    aplicar_configuracion(config)
+    if args.shard:
+        # Cada nodo escribe en su base de datos; se combinan con 1.2.fusionar_shards.py
+        DB_PATH = ruta_shard(DB_PATH, *args.shard)
+
+    # === CARGAR METADATOS ===
+    # El CSV se compila en la tabla metadata la primera vez (o si cambia)
+    conn = conectar(DB_PATH)
+    crear_tabla_procesados(conn)
+    crear_tabla_cuarentena(conn)
+    asegurar_metadatos(conn, METADATA_CSV)
+    metadatos = leer_metadatos(conn, args.incremental)
+    apartados = cargar_cuarentena(conn)
+    conn.close()
+    # filtro de solo inglés eliminado: cada lenguaje va a su modelo
+    print(f"📄 Libros en los metadatos: {len(metadatos)}")
+
+    # === PROCESAR LIBROS ===
+    if args.corpus:
+        # La "ruta" de cada tarea es la del corpus; los libros se leen por book_id
+        indice = {book_id: args.corpus for book_id in abrir_corpus().ids()}
+        print(f"📦 Corpus empaquetado: {len(indice)} libros en {args.corpus}")
+    else:
+        indice = cargar_indice(BOOKS_FOLDER, MANIFIESTO_LIBROS)
+
+    if args.incremental:
+        con_huella = sum(1 for fila in metadatos if fila[4] is not None)
+        print(f"♻️ Modo incremental: {con_huella} libros con huella (versión {version_registrada()})")
+
+    tareas = preparar_tareas(metadatos, indice, args.force)
+    print(f"📂 Libros con fichero: {len(tareas)}")
+
+    # Los libros en cuarentena solo se puntúan al reintentarlos (o si se fuerzan)
+    if args.reintentar_cuarentena:
+        tareas = [tarea for tarea in tareas if tarea[0] in apartados]
+        print(f"🚧 Reintentando {len(tareas)} libros en cuarentena")
+    elif apartados:
+        antes = len(tareas)
+        tareas = [tarea for tarea in tareas
+                  if tarea[0] not in apartados or es_forzado(tarea[0], tarea[2], args.force)]
+        print(f"🚧 {antes - len(tareas)} libros en cuarentena omitidos (--reintentar-cuarentena)")
+    if args.shard:
+        i, n = args.shard
+        tareas = [tarea for tarea in tareas if shard_de(tarea[0], n) == i]
+        print(f"🧩 Shard {i}/{n}: {len(tareas)} libros -> {DB_PATH}")
+    por_modelo = Counter(tarea[6] for tarea in tareas)
+    print(f"🤖 Libros por modelo: {', '.join(f'{modelo_id(m)} {n}' for m, n in sorted(por_modelo.items()))}")
+    if args.paridad:
+        ejecutar_paridad(tareas, args.paridad)
+        return
+    if args.workers > 1:
+        ejecutar_paralelo(tareas, config)
+    else:
+        ejecutar_secuencial(tareas, config)
+    print("✅ Finalizado.")
 
-    except Exception as e:
-        print(f"❌ [{book_id}] Error procesando: {e}")
 
-conn.close()
-print("✅ Finalizado.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+# Análisis de toxicidad por año: python 2.analisis.py {global,lenguajes,simple,seleccion} [--help]
+from toxiclibros.analisis import main
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+# Banco de pruebas de rendimiento con un corpus sintético (ver ejecutar.py).
@@ -0,0 +1,132 @@
+# Corpus sintético con la misma estructura que el de Gutenberg:
+#   <destino>/books/<sub>/{id}_{titulo}.pkl   texto del libro serializado con pickle
+#   <destino>/gutenberg_over_70000_metadata.csv
+#
+# Los libros tienen líneas partidas a ~70 caracteres, párrafos separados por
+# línea en blanco, las marcas START/END de Gutenberg y la licencia repetida
+# en todos ellos, como los originales. Una fracción de palabras de cada libro
+# sale de un léxico "tóxico" para que el modelo simulado dé puntuaciones
+# distintas por libro y los análisis tengan grupos que separar.
+import argparse
+import csv
+import os
+import pickle
+import random
+import textwrap
+
+VOCABULARIO = {
+    "English": ("the of and to in that was his he it with is for as had you not be her on at by which "
+                "have or from this him but all she they were my are me one their so an said them we who "
+                "would been will no when there if more out up into do any your what has man could other "
+                "than our some very time upon about may its only now like little then can should made "
+                "did us such great before must two these see know over much down after first mr good").split(),
+    "French": ("de la le et les des en un du une que est pour qui dans par plus pas au sur ne se ce il "
+               "sont avec son elle nous mais comme ou si leur bien tout fait dit vous sa ses même").split(),
+    "German": ("der die und in den von zu das mit sich des auf für ist im dem nicht ein eine als auch "
+               "es an werden aus er hat dass sie nach wird bei einer um am sind noch wie einem über").split(),
+    "Spanish": ("de la que el en y a los se del las un por con no una su para es al lo como más pero "
+                "sus le ya o fue este ha sí porque esta son entre cuando muy sin sobre también me").split(),
+}
+LEXICO_TOXICO = "damn hell fool idiot stupid kill hate brute wretch villain curse devil beast coward".split()
+
+LICENCIA = (
+    "This eBook is for the use of anyone anywhere in the United States and most other parts of the "
+    "world at no cost and with almost no restrictions whatsoever. You may copy it, give it away or "
+    "re-use it under the terms of the Project Gutenberg License included with this eBook or online "
+    "at www.gutenberg.org."
+)
+MESES = "Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec".split()
+
+LIBROS = 600
+PALABRAS_MIN = 1_000
+PALABRAS_MAX = 20_000
+LENGUAJES = "English:0.85,French:0.06,German:0.05,Spanish:0.04"
+ANIOS = "1990-1999"
+LIBROS_POR_CARPETA = 500
+
+
+def parsear_lenguajes(texto):
+    # "English:0.8,French:0.2" -> ([lenguajes], [pesos])
+    lenguajes, pesos = [], []
+    for parte in texto.split(","):
+        nombre, _, peso = parte.partition(":")
+        lenguajes.append(nombre.strip())
+        pesos.append(float(peso) if peso else 1.0)
+    return lenguajes, pesos
+
+
+def parsear_anios(texto):
+    inicio, _, fin = texto.partition("-")
+    return int(inicio), int(fin or inicio)
+
+
+def generar_texto(rng, titulo, lenguaje, n_palabras, tasa_toxica):
+    vocabulario = VOCABULARIO.get(lenguaje, VOCABULARIO["English"])
+    parrafos = [f"The Project Gutenberg eBook of {titulo}", LICENCIA,
+                f"*** START OF THE PROJECT GUTENBERG EBOOK {titulo.upper()} ***"]
+    restantes = n_palabras
+    while restantes > 0:
+        n = min(restantes, rng.randint(20, 200))
+        palabras = [
+            rng.choice(LEXICO_TOXICO) if rng.random() < tasa_toxica else rng.choice(vocabulario)
+            for _ in range(n)
+        ]
+        palabras[0] = palabras[0].capitalize()
+        parrafos.append(textwrap.fill(" ".join(palabras) + ".", width=70))
+        restantes -= n
+    parrafos += [f"*** END OF THE PROJECT GUTENBERG EBOOK {titulo.upper()} ***", LICENCIA]
+    return "\n\n".join(parrafos) + "\n"
+
+
+def generar(destino, libros=LIBROS, palabras_min=PALABRAS_MIN, palabras_max=PALABRAS_MAX,
+            lenguajes=LENGUAJES, anios=ANIOS, semilla=42):
+    # Escribe el corpus en destino y devuelve (carpeta de libros, ruta del CSV)
+    rng = random.Random(semilla)
+    nombres, pesos = parsear_lenguajes(lenguajes)
+    anio_ini, anio_fin = parsear_anios(anios)
+    carpeta_libros = os.path.join(destino, "books")
+    ruta_csv = os.path.join(destino, "gutenberg_over_70000_metadata.csv")
+
+    filas = []
+    for k in range(libros):
+        book_id = 10_000 + k
+        lenguaje = rng.choices(nombres, pesos)[0]
+        titulo = " ".join(rng.choice(VOCABULARIO["English"]) for _ in range(rng.randint(2, 6))).title()
+        # Distribución log-uniforme: muchos libros cortos y pocos largos, como en Gutenberg
+        n_palabras = int(palabras_min * (palabras_max / palabras_min) ** rng.random())
+        tasa_toxica = 0.05 * rng.random() ** 3
+
+        carpeta = os.path.join(carpeta_libros, f"{k // LIBROS_POR_CARPETA:03d}")
+        os.makedirs(carpeta, exist_ok=True)
+        slug = titulo.replace(" ", "_")[:40]
+        with open(os.path.join(carpeta, f"{book_id}_{slug}.pkl"), "wb") as f:
+            pickle.dump(generar_texto(rng, titulo, lenguaje, n_palabras, tasa_toxica), f)
+
+        fecha = f"{rng.choice(MESES)} {rng.randint(1, 28)}, {rng.randint(anio_ini, anio_fin)}"
+        filas.append((book_id, titulo, f"Author {rng.randint(1, libros // 3 + 1)}", lenguaje, fecha))
+
+    with open(ruta_csv, "w", encoding="utf-8", newline="") as f:
+        escritor = csv.writer(f)
+        escritor.writerow(["Book Num", "Book Title", "Author", "Language", "Published Date"])
+        escritor.writerows(filas)
+    return carpeta_libros, ruta_csv
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera un corpus sintético con la estructura de Gutenberg")
+    parser.add_argument("destino")
+    parser.add_argument("--libros", type=int, default=LIBROS)
+    parser.add_argument("--palabras-min", type=int, default=PALABRAS_MIN)
+    parser.add_argument("--palabras-max", type=int, default=PALABRAS_MAX)
+    parser.add_argument("--lenguajes", default=LENGUAJES, help="lenguaje:peso separados por comas")
+    parser.add_argument("--anios", default=ANIOS, help="rango de años de publicación, p. ej. 1990-1999")
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args()
+
+    carpeta, ruta_csv = generar(args.destino, args.libros, args.palabras_min, args.palabras_max,
+                                args.lenguajes, args.anios, args.semilla)
+    print(f"✅ {args.libros} libros en {carpeta} y metadatos en {ruta_csv}")
+
+
+if __name__ == "__main__":
+    main()
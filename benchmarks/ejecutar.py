@@ -0,0 +1,378 @@
+# Banco de pruebas de rendimiento del pipeline completo.
+#
+# Genera un corpus sintético (corpus_sintetico.py) en una carpeta de trabajo,
+# ejecuta cada etapa con el modelo simulado (modelo_simulado.py, sin red ni
+# pesos) y añade una línea JSON con los tiempos a RESULTADOS, etiquetada con
+# el commit, para comparar entre commits:
+#
+#   python -m benchmarks.ejecutar --libros 600 --repeticiones 3
+#   python -m benchmarks.ejecutar --filtro "--politica-lotes por_longitud --precarga 8"
+#   python -m benchmarks.ejecutar --comparar 1a2b3c4            # contra la última ejecución
+#   python -m benchmarks.ejecutar --comparar 1a2b3c4 5d6e7f8
+#
+# Etapas: índice de ficheros, compilación de metadatos, preparación de tareas
+# y puntuación de 1.filter_Guttemberg_all.py (con el desglose por etapa de
+# toxiclibros.metricas), su pasada incremental sin cambios, los
+# 2.analisysKmeans*.py, la exportación 3.processtoRDF_all.py y las vistas de
+# Django. Una etapa cuyas dependencias no están instaladas se registra como
+# omitida y el resto sigue.
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import platform
+import runpy
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks import corpus_sintetico
+from benchmarks.modelo_simulado import ModeloSimulado
+from toxiclibros.metadatos import compilar_metadatos
+from toxiclibros.modelos import PoolModelos
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTADOS = "resultados_benchmark.jsonl"
+REPETICIONES = 1
+COSTE_POR_TOKEN = 0.0     # segundos de "inferencia" simulada por token y trozo del lote
+
+SCRIPTS_ANALISIS = [
+    "2.analisysKmeans.py",
+    "2.analisysKmeans_all.py",
+    "2.analisysKmeans_all_separado.py",
+    "2.analisysKmeans_all_separado_simple.py",
+]
+VISTAS = [
+    ("web.dashboard", "dashboard", {}),
+    ("web.grafo_data", "grafo_libros", {}),
+    ("web.grafo_param_data", "grafo_parametrico_data", {"param": "toxicity"}),
+]
+
+
+def cargar_script(nombre):
+    # Los scripts del pipeline no son importables por nombre (empiezan por cifra)
+    spec = importlib.util.spec_from_file_location("bench_" + nombre.replace(".", "_")[:-3],
+                                                  os.path.join(RAIZ, nombre))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+@contextlib.contextmanager
+def en_carpeta(carpeta):
+    anterior = os.getcwd()
+    os.chdir(carpeta)
+    try:
+        yield
+    finally:
+        os.chdir(anterior)
+
+
+def commit_actual():
+    # (hash corto, hay cambios sin confirmar); (None, None) fuera de git
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        estado = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=RAIZ,
+                                capture_output=True, text=True, check=True).stdout
+        return commit, bool(estado.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+class Banco:
+
+    def __init__(self, args, trabajo):
+        self.args = args
+        self.trabajo = trabajo
+        self.etapas = {}
+        self.filtro = None
+        self.config = None
+        self.indice = None
+        self.df = None
+        self.tareas = None
+
+    def medir(self, nombre, funcion, preparar=None):
+        # Ejecuta la etapa `repeticiones` veces (preparar() antes de cada una,
+        # fuera del tiempo) y guarda el mínimo y la media; funcion puede
+        # devolver un dict de detalle que se guarda con la etapa.
+        tiempos, detalle = [], None
+        try:
+            for _ in range(self.args.repeticiones):
+                if preparar:
+                    preparar()
+                with self.silencio():
+                    inicio = time.perf_counter()
+                    detalle = funcion()
+                    tiempos.append(time.perf_counter() - inicio)
+        except ImportError as e:
+            self.etapas[nombre] = {"omitida": str(e)}
+            print(f"⏭️ {nombre:<44} omitida ({e})")
+            return
+        except Exception as e:
+            self.etapas[nombre] = {"error": f"{type(e).__name__}: {e}"}
+            print(f"❌ {nombre:<44} error: {type(e).__name__}: {e}")
+            return
+
+        resultado = {"segundos": min(tiempos), "media": sum(tiempos) / len(tiempos), "repeticiones": len(tiempos)}
+        if detalle:
+            resultado["detalle"] = detalle
+        self.etapas[nombre] = resultado
+        print(f"⏱️ {nombre:<44} {resultado['segundos']:9.3f} s (media {resultado['media']:.3f} s)")
+
+    @contextlib.contextmanager
+    def silencio(self):
+        # Los scripts imprimen una línea por libro: fuera de --verboso se descartan
+        if self.args.verboso:
+            yield
+            return
+        with open(os.devnull, "w", encoding="utf-8") as nulo, contextlib.redirect_stdout(nulo):
+            yield
+
+    def ruta(self, *partes):
+        return os.path.join(self.trabajo, *partes)
+
+    # === 1.filter_Guttemberg_all.py ===
+    def preparar_filtro(self):
+        filtro = cargar_script("1.filter_Guttemberg_all.py")
+        filtro.BOOKS_FOLDER = self.ruta("books")
+        filtro.METADATA_CSV = self.ruta("gutenberg_over_70000_metadata.csv")
+        filtro.MANIFIESTO_LIBROS = self.ruta("books_manifest.json")
+        filtro.DB_PATH = self.ruta("gutenberg_all.db")
+        # Con el pool ya creado, cargar_modelo() da el simulado para cualquier modelo
+        filtro.pool = PoolModelos(lambda nombre: ModeloSimulado(self.args.coste_token))
+
+        argv = sys.argv
+        sys.argv = ["1.filter_Guttemberg_all.py", "--sin-cache",
+                    "--metricas-log", self.ruta("metricas.jsonl"),
+                    "--metricas-prometheus", self.ruta("metricas.prom"),
+                    "--metricas-intervalo", "1e9"] + self.args.filtro.split()
+        try:
+            self.config = vars(filtro.parse_args())
+        finally:
+            sys.argv = argv
+        if self.config["workers"] > 1:
+            raise ValueError("el modelo simulado solo llega al modo secuencial (sin --workers)")
+        filtro.aplicar_configuracion(self.config)
+        self.filtro = filtro
+
+    def etapas_filtro(self):
+        filtro = self.filtro
+
+        def borrar(*rutas):
+            for ruta in rutas:
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+
+        def indice():
+            self.indice = filtro.cargar_indice(filtro.BOOKS_FOLDER, filtro.MANIFIESTO_LIBROS)
+
+        def metadatos():
+            conn = filtro.conectar(filtro.DB_PATH)
+            compilar_metadatos(conn, filtro.METADATA_CSV)
+            conn.close()
+
+        def tareas():
+            conn = filtro.conectar(filtro.DB_PATH)
+            self.tareas = filtro.preparar_tareas(filtro.leer_metadatos(conn, False), self.indice, None)
+            conn.close()
+            return {"libros": len(self.tareas)}
+
+        def puntuacion():
+            filtro.ejecutar_secuencial(self.tareas, self.config)
+            with open(self.ruta("metricas.jsonl"), "r", encoding="utf-8") as f:
+                instantanea = json.loads(f.readlines()[-1])
+            detalle = {etapa: valores["segundos"] for etapa, valores in instantanea["etapas"].items()}
+            detalle.update(instantanea["contadores"])
+            return detalle
+
+        def incremental():
+            conn = filtro.conectar(filtro.DB_PATH)
+            metadatos = filtro.leer_metadatos(conn, True)
+            conn.close()
+            filtro.ejecutar_secuencial(filtro.preparar_tareas(metadatos, self.indice, None), self.config)
+
+        def borrar_bd():
+            borrar(filtro.DB_PATH, filtro.DB_PATH + "-wal", filtro.DB_PATH + "-shm")
+            conn = filtro.conectar(filtro.DB_PATH)
+            filtro.crear_tabla_procesados(conn)
+            conn.close()
+
+        def vaciar_resultados():
+            # Se conserva la tabla metadata de la etapa anterior
+            conn = filtro.conectar(filtro.DB_PATH)
+            with conn:
+                for tabla in ("procesados", "trozos_puntuaciones", "pasajes_toxicos"):
+                    conn.execute(f"DELETE FROM {tabla}")
+            conn.close()
+            borrar(self.ruta("metricas.jsonl"))
+
+        self.medir("filtro.indice", indice, preparar=lambda: borrar(filtro.MANIFIESTO_LIBROS))
+        self.medir("filtro.metadatos", metadatos, preparar=borrar_bd)
+        self.medir("filtro.tareas", tareas)
+        self.medir("filtro.puntuacion", puntuacion, preparar=vaciar_resultados)
+        self.medir("filtro.incremental", incremental)
+
+    # === 2.analisysKmeans*.py y 3.processtoRDF_all.py ===
+    def ejecutar_script(self, nombre, graficos=False):
+        if graficos:
+            import matplotlib
+            matplotlib.use("Agg")  # plt.show() no abre ventanas
+        with en_carpeta(self.trabajo):
+            runpy.run_path(os.path.join(RAIZ, nombre), run_name="__main__")
+        if graficos:
+            import matplotlib.pyplot as plt
+            plt.close("all")
+
+    def etapas_scripts(self):
+        # 2.analisysKmeans.py y 3.processtoRDF.py leen gutenberg.db (solo inglés)
+        if os.path.exists(self.ruta("gutenberg_all.db")):
+            shutil.copyfile(self.ruta("gutenberg_all.db"), self.ruta("gutenberg.db"))
+        for nombre in SCRIPTS_ANALISIS:
+            self.medir(f"analisis.{nombre[2:-3]}", lambda: self.ejecutar_script(nombre, graficos=True))
+        self.medir("rdf.processtoRDF_all", lambda: self.ejecutar_script("3.processtoRDF_all.py"))
+
+    # === Vistas de Django ===
+    def etapas_web(self):
+        # Las vistas abren '../gutenberg_all.db' respecto al directorio actual
+        carpeta_web = self.ruta("web")
+        os.makedirs(carpeta_web, exist_ok=True)
+        estado = {}
+
+        def preparar_django():
+            sys.path.insert(0, os.path.join(RAIZ, "web"))
+            os.environ.setdefault("DJANGO_SETTINGS_MODULE", "toxiclibros_web.settings")
+            import django
+            django.setup()
+            from django.test import RequestFactory
+            from libros import views
+            estado["fabrica"], estado["views"] = RequestFactory(SERVER_NAME="localhost"), views
+
+        self.medir("web.arranque", preparar_django)
+        if "views" not in estado:
+            return
+
+        for nombre, vista, kwargs in VISTAS:
+            def llamar(vista=vista, kwargs=kwargs):
+                with en_carpeta(carpeta_web):
+                    respuesta = getattr(estado["views"], vista)(estado["fabrica"].get("/"), **kwargs)
+                if respuesta.status_code != 200:
+                    raise RuntimeError(f"HTTP {respuesta.status_code}")
+                return {"bytes": len(respuesta.content)}
+            self.medir(nombre, llamar)
+
+    def ejecutar(self):
+        inicio = time.perf_counter()
+        with self.silencio():
+            corpus_sintetico.generar(self.trabajo, self.args.libros, self.args.palabras_min,
+                                     self.args.palabras_max, self.args.lenguajes, self.args.anios,
+                                     self.args.semilla)
+        print(f"📚 Corpus sintético de {self.args.libros} libros en {self.trabajo} "
+              f"({time.perf_counter() - inicio:.1f} s)")
+
+        try:
+            self.preparar_filtro()
+        except ImportError as e:
+            print(f"⏭️ 1.filter_Guttemberg_all.py omitido ({e})")
+        else:
+            self.etapas_filtro()
+        self.etapas_scripts()
+        self.etapas_web()
+
+
+def parametros(args):
+    claves = ["libros", "palabras_min", "palabras_max", "lenguajes", "anios", "semilla",
+              "coste_token", "repeticiones", "filtro"]
+    return {clave: getattr(args, clave) for clave in claves}
+
+
+def guardar(args, etapas):
+    commit, sucio = commit_actual()
+    registro = {
+        "commit": commit,
+        "sucio": sucio,
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "parametros": parametros(args),
+        "etapas": etapas,
+    }
+    with open(args.resultados, "a", encoding="utf-8") as f:
+        f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+    print(f"💾 Resultados de {commit or 'sin commit'}{' (con cambios)' if sucio else ''} añadidos a {args.resultados}")
+
+
+def comparar(ruta, referencia, candidato=None):
+    with open(ruta, "r", encoding="utf-8") as f:
+        registros = [json.loads(linea) for linea in f if linea.strip()]
+
+    def buscar(prefijo):
+        # La última ejecución de ese commit
+        for registro in reversed(registros):
+            if (registro.get("commit") or "").startswith(prefijo):
+                return registro
+        raise SystemExit(f"❌ No hay resultados del commit {prefijo} en {ruta}")
+
+    ref = buscar(referencia)
+    cand = buscar(candidato) if candidato else registros[-1]
+    print(f"📊 {ref['commit']} ({ref['fecha']}) -> {cand['commit']} ({cand['fecha']})")
+    if ref["parametros"] != cand["parametros"]:
+        print("⚠️ Parámetros distintos: los tiempos no son directamente comparables")
+
+    for etapa in list(dict.fromkeys(list(ref["etapas"]) + list(cand["etapas"]))):
+        a = ref["etapas"].get(etapa, {}).get("segundos")
+        b = cand["etapas"].get(etapa, {}).get("segundos")
+        if a is None or b is None:
+            print(f"   {etapa:<44} {'-' if a is None else f'{a:.3f}':>9} -> {'-' if b is None else f'{b:.3f}':>9}")
+            continue
+        cambio = 100 * (b - a) / a if a else 0.0
+        print(f"   {etapa:<44} {a:9.3f} -> {b:9.3f} s  {cambio:+6.1f} %")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Banco de pruebas del pipeline con un corpus sintético")
+    parser.add_argument("--libros", type=int, default=corpus_sintetico.LIBROS)
+    parser.add_argument("--palabras-min", type=int, default=corpus_sintetico.PALABRAS_MIN)
+    parser.add_argument("--palabras-max", type=int, default=corpus_sintetico.PALABRAS_MAX)
+    parser.add_argument("--lenguajes", default=corpus_sintetico.LENGUAJES,
+                        help="lenguaje:peso separados por comas")
+    parser.add_argument("--anios", default=corpus_sintetico.ANIOS,
+                        help="rango de años (los análisis necesitan >= 50 libros por año)")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--coste-token", type=float, default=COSTE_POR_TOKEN,
+                        help="segundos de inferencia simulada por token (0 = solo el pipeline)")
+    parser.add_argument("--repeticiones", type=int, default=REPETICIONES,
+                        help="ejecuciones de cada etapa; se guarda la más rápida y la media")
+    parser.add_argument("--filtro", default="",
+                        help="opciones extra para 1.filter_Guttemberg_all.py, entre comillas")
+    parser.add_argument("--trabajo", help="carpeta de trabajo (por defecto, una temporal que se borra)")
+    parser.add_argument("--resultados", default=RESULTADOS, help="fichero JSON lines de resultados")
+    parser.add_argument("--comparar", nargs="+", metavar="COMMIT",
+                        help="comparar los resultados de un commit con otro (o con la última ejecución)")
+    parser.add_argument("--verboso", action="store_true", help="no silenciar la salida de los scripts")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.comparar:
+        comparar(args.resultados, *args.comparar[:2])
+        return
+
+    trabajo = args.trabajo or tempfile.mkdtemp(prefix="toxiclibros_bench_")
+    os.makedirs(trabajo, exist_ok=True)
+    try:
+        banco = Banco(args, trabajo)
+        banco.ejecutar()
+        guardar(args, banco.etapas)
+    finally:
+        if not args.trabajo:
+            shutil.rmtree(trabajo, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# Sustituto de Detoxify para medir el pipeline sin descargar pesos ni GPU.
+#
+# Misma interfaz que los backends de toxiclibros.modelos: predict(str) ->
+# {etiqueta: float} y predict(list) -> {etiqueta: [float, ...]}. Las
+# puntuaciones son deterministas (dependen solo del texto): una base derivada
+# del hash del trozo más la proporción de palabras del léxico tóxico del
+# corpus sintético. Con segundos_por_token > 0 cada lote espera lo que
+# tardaría el modelo, rellenando hasta el trozo más largo como haría el real.
+import hashlib
+import time
+
+from benchmarks.corpus_sintetico import LEXICO_TOXICO
+
+ETIQUETAS = [
+    "toxicity", "severe_toxicity", "obscene",
+    "identity_attack", "insult", "threat", "sexual_explicit"
+]
+PESOS = [1.0, 0.2, 0.5, 0.3, 0.8, 0.4, 0.1]
+TOXICAS = frozenset(LEXICO_TOXICO)
+
+
+class ModeloSimulado:
+
+    def __init__(self, segundos_por_token=0.0, caracteres_por_token=4):
+        self.nombre = "simulado"
+        self.segundos_por_token = segundos_por_token
+        self.caracteres_por_token = caracteres_por_token
+
+    def _puntuar(self, texto):
+        palabras = texto.split()
+        proporcion = sum(p.strip(".,").lower() in TOXICAS for p in palabras) / max(len(palabras), 1)
+        resumen = hashlib.blake2b(texto.encode("utf-8"), digest_size=len(ETIQUETAS)).digest()
+        return {
+            etiqueta: min(1.0, byte / 255 * 0.02 + peso * proporcion * 10)
+            for etiqueta, peso, byte in zip(ETIQUETAS, PESOS, resumen)
+        }
+
+    def predict(self, texto):
+        lista = [texto] if isinstance(texto, str) else list(texto)
+        if self.segundos_por_token:
+            tokens = max((len(t[:2048]) // self.caracteres_por_token for t in lista), default=0)
+            time.sleep(self.segundos_por_token * tokens * len(lista))
+        puntuaciones = [self._puntuar(t) for t in lista]
+
+        if isinstance(texto, str):
+            return puntuaciones[0]
+        return {etiqueta: [p[etiqueta] for p in puntuaciones] for etiqueta in ETIQUETAS}
@@ -0,0 +1,89 @@
+# Modo incremental de 1.filter_Guttemberg_all.py con el corpus sintético y el
+# modelo simulado de benchmarks/ (sin pesos ni red)
+import os
+import sys
+
+import pytest
+
+from benchmarks import corpus_sintetico
+from benchmarks.ejecutar import cargar_script
+from benchmarks.modelo_simulado import ModeloSimulado
+from toxiclibros.metadatos import compilar_metadatos
+from toxiclibros.modelos import PoolModelos
+
+LIBROS = 6
+
+
+@pytest.fixture
+def filtro(tmp_path):
+    corpus_sintetico.generar(str(tmp_path), libros=LIBROS, palabras_min=500, palabras_max=2_000)
+    modulo = cargar_script("1.filter_Guttemberg_all.py")
+    modulo.BOOKS_FOLDER = str(tmp_path / "books")
+    modulo.METADATA_CSV = str(tmp_path / "gutenberg_over_70000_metadata.csv")
+    modulo.MANIFIESTO_LIBROS = str(tmp_path / "books_manifest.json")
+    modulo.DB_PATH = str(tmp_path / "gutenberg_all.db")
+    modulo.pool = PoolModelos(lambda nombre: ModeloSimulado())
+    conn = modulo.conectar(modulo.DB_PATH)
+    modulo.crear_tabla_procesados(conn)
+    compilar_metadatos(conn, modulo.METADATA_CSV)
+    conn.close()
+    return modulo
+
+
+def puntuar(filtro, *opciones):
+    # Una pasada incremental como la de main() -> versión registrada de cada libro
+    argv = sys.argv
+    carpeta = os.path.dirname(filtro.DB_PATH)
+    sys.argv = ["1.filter_Guttemberg_all.py", "--sin-cache", "--incremental",
+                "--metricas-log", os.path.join(carpeta, "metricas.jsonl"),
+                "--metricas-prometheus", os.path.join(carpeta, "metricas.prom"), *opciones]
+    try:
+        config = vars(filtro.parse_args())
+    finally:
+        sys.argv = argv
+    filtro.aplicar_configuracion(config)
+    conn = filtro.conectar(filtro.DB_PATH)
+    metadatos = filtro.leer_metadatos(conn, True)
+    conn.close()
+    indice = filtro.cargar_indice(filtro.BOOKS_FOLDER, filtro.MANIFIESTO_LIBROS)
+    filtro.ejecutar_secuencial(filtro.preparar_tareas(metadatos, indice, None), config)
+
+    conn = filtro.conectar(filtro.DB_PATH)
+    versiones = dict(conn.execute("SELECT book_id, version_pipeline FROM procesados").fetchall())
+    conn.close()
+    return versiones
+
+
+def test_mismo_troceado_no_repuntua(filtro, capsys):
+    puntuar(filtro)
+    capsys.readouterr()
+    puntuar(filtro)
+    assert f"{LIBROS} libros sin cambios omitidos" in capsys.readouterr().out
+
+
+def test_otro_tamano_de_trozo_repuntua(filtro, capsys):
+    assert set(puntuar(filtro).values()) == {filtro.PIPELINE_VERSION}
+    capsys.readouterr()
+
+    versiones = puntuar(filtro, "--tokens-por-trozo", "128")
+    assert "sin cambios" not in capsys.readouterr().out
+    assert len(versiones) == LIBROS
+    assert set(versiones.values()) == {f"{filtro.PIPELINE_VERSION}+trozos128"}
+
+    # Y volver al tamaño de la versión también repuntúa
+    assert set(puntuar(filtro).values()) == {filtro.PIPELINE_VERSION}
+    assert "sin cambios" not in capsys.readouterr().out
+
+
+def test_pasajes_repuntua_libros_sin_detalle(filtro, capsys):
+    puntuar(filtro, "--pasajes", "0")
+    capsys.readouterr()
+    puntuar(filtro, "--pasajes", "0")
+    assert f"{LIBROS} libros sin cambios omitidos" in capsys.readouterr().out
+
+    puntuar(filtro, "--pasajes", "5")
+    assert "sin cambios" not in capsys.readouterr().out
+    conn = filtro.conectar(filtro.DB_PATH)
+    assert conn.execute("SELECT COUNT(*) FROM trozos_puntuaciones").fetchone()[0] == LIBROS
+    assert conn.execute("SELECT COUNT(DISTINCT book_id) FROM pasajes_toxicos").fetchone()[0] == LIBROS
+    conn.close()
@@ -0,0 +1 @@
+# Utilidades compartidas por los scripts de análisis de toxicidad de Gutenberg.
@@ -0,0 +1,426 @@
+# Análisis de toxicidad por año sobre procesados (antes 2.analisysKmeans*.py).
+#
+#   python 2.analisis.py global      KMeans de 3 niveles sobre todos los libros
+#   python 2.analisis.py lenguajes   el mismo análisis por separado para cada lenguaje
+#   python 2.analisis.py simple      medias anuales por lenguaje, sin clustering
+#   python 2.analisis.py seleccion   barrido de k y semillas para justificar los 3 grupos
+#
+# Los datos salen de toxiclibros/caracteristicas.py: la primera ejecución
+# lee procesados y las siguientes, mientras la tabla no cambie, cargan la
+# caché aunque cambien --min-libros u otros parámetros. Con --streaming,
+# global y lenguajes no cargan la tabla: la recorren por bloques con
+# MiniBatchKMeans (para tablas que no caben en memoria). Con --salida no se
+# abre ninguna ventana: tablas y figuras (PNG/SVG/PDF) van a esa carpeta
+# junto a indice.csv, y lenguajes puede repartir los lenguajes entre
+# --procesos procesos.
+import argparse
+import csv
+import multiprocessing as mp
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans, MiniBatchKMeans
+import matplotlib.pyplot as plt
+from threadpoolctl import threadpool_limits
+
+from toxiclibros.caracteristicas import (
+    CACHE_DIR, cargar_caracteristicas, rango_continuo, filtrar_rango, ruta_cache,
+    contar_por_anio, contar_por_lenguaje, leer_bloques,
+)
+from toxiclibros.bd import crear_tablas_agregados, fijar_min_libros, leer_version_datos
+from toxiclibros import seleccion
+
+# === CONFIGURACIÓN ===
+DB_PATH = "gutenberg_all.db"
+MIN_LIBROS_POR_ANIO = 50
+MIN_LIBROS_POR_LENGUAJE = 50
+FEATURES = ["toxicity", "severe_toxicity", "obscene", "identity_attack", "insult", "threat"]
+ETIQUETAS = ["Toxicidad Bajo", "Toxicidad Medio", "Toxicidad Alto"]
+COLORES = {"Toxicidad Bajo": "#8BC34A", "Toxicidad Medio": "#FFC107", "Toxicidad Alto": "#F44336"}
+TAM_BLOQUE = 100_000  # --streaming: filas leídas de procesados por bloque
+TAM_LOTE = 1024       # --streaming: filas por paso de MiniBatchKMeans.partial_fit
+EPOCAS = 3            # --streaming: pasadas de ajuste antes de la de asignación
+SALIDA = None         # carpeta de --salida; None = ventanas de matplotlib
+FORMATOS = ["png"]
+INDICE = "indice.csv"  # dentro de SALIDA: un fichero generado por línea
+
+generados = []  # rutas escritas por este proceso, para el índice
+
+
+def aplicar_configuracion(config):
+    # Sin --salida, tablas en la carpeta actual y figuras en ventanas; con
+    # --salida, todo en esa carpeta y figuras con el backend Agg, sin ventanas.
+    # Los procesos del pool (spawn) reciben aquí la misma configuración.
+    global SALIDA, FORMATOS
+    SALIDA = config["salida"]
+    FORMATOS = config["formatos"]
+    if SALIDA is not None:
+        plt.switch_backend("Agg")
+        os.makedirs(SALIDA, exist_ok=True)
+    if config.get("hilos"):
+        threadpool_limits(config["hilos"])  # KMeans no debe usar todos los núcleos en cada proceso
+
+
+def ruta_salida(nombre_archivo):
+    ruta = nombre_archivo if SALIDA is None else os.path.join(SALIDA, nombre_archivo)
+    generados.append(ruta)
+    return ruta
+
+
+def exporttxt(df, nombre_archivo):
+    nombre_archivo = ruta_salida(nombre_archivo)
+    with pd.option_context('display.max_rows', None, 'display.max_columns', None):
+        contenido = df.to_string(index=True)
+    with open(nombre_archivo, 'w', encoding='utf-8') as f:
+        f.write(contenido)
+    print(f"✅ DataFrame exportado a '{nombre_archivo}' correctamente.")
+
+
+def mostrar(nombre):
+    # La figura actual: en una ventana o, con --salida, guardada en cada formato
+    if SALIDA is None:
+        plt.show()
+        return
+    for formato in FORMATOS:
+        plt.savefig(ruta_salida(f"{nombre}.{formato}"), bbox_inches="tight")
+    plt.close()
+
+
+def nombrar_clusters(cluster_mean):
+    # {cluster: etiqueta}: los grupos se nombran por la media de sus centroides
+    cluster_mean = cluster_mean.copy()
+    cluster_mean["avg"] = cluster_mean.mean(axis=1)
+    cluster_mean = cluster_mean.sort_values("avg")
+    return {cluster: label for cluster, label in zip(cluster_mean.index, ETIQUETAS)}
+
+
+def niveles_en_memoria(df):
+    # KMeans de 3 grupos sobre el DataFrame completo
+    # -> (libros por año y nivel, medias anuales, toxicidad total anual)
+    kmeans = KMeans(n_clusters=3, random_state=42)
+    df["cluster"] = kmeans.fit_predict(df[FEATURES])
+    cluster_to_label = nombrar_clusters(df.groupby("cluster")[FEATURES].mean())
+    df["toxicidad"] = df["cluster"].map(cluster_to_label)
+
+    count_by_year = df.groupby(["anio", "toxicidad"]).size().unstack(fill_value=0)
+    medias_por_indice = df.groupby("anio")[FEATURES].mean()
+    df["total_toxicidad"] = df[FEATURES].sum(axis=1)
+    suma_total_anual = df.groupby("anio")["total_toxicidad"].sum()
+    return count_by_year, medias_por_indice, suma_total_anual
+
+
+def sumar(acumulado, nuevo):
+    return nuevo if acumulado is None else acumulado.add(nuevo, fill_value=0)
+
+
+def niveles_streaming(conn, anio_ini, anio_fin, args, lenguaje=None):
+    # Lo mismo que niveles_en_memoria leyendo procesados por bloques: cada
+    # época ajusta MiniBatchKMeans con partial_fit en lotes de tam_lote filas
+    # y una última pasada asigna los grupos y solo acumula sumas por año y
+    # por grupo, así que la memoria no depende del tamaño de la tabla
+    kmeans = MiniBatchKMeans(n_clusters=3, random_state=42, batch_size=args.tam_lote)
+    for _ in range(args.epocas):
+        for bloque in leer_bloques(conn, FEATURES, anio_ini, anio_fin, args.tam_bloque, lenguaje):
+            X = bloque.to_numpy(dtype=np.float64)
+            for i in range(0, len(X), args.tam_lote):
+                kmeans.partial_fit(X[i:i + args.tam_lote])
+
+    conteos = sumas_anio = libros_anio = sumas_cluster = libros_cluster = None
+    for bloque in leer_bloques(conn, ["anio", *FEATURES], anio_ini, anio_fin, args.tam_bloque, lenguaje):
+        bloque["cluster"] = kmeans.predict(bloque[FEATURES].to_numpy(dtype=np.float64))
+        conteos = sumar(conteos, bloque.groupby(["anio", "cluster"]).size())
+        sumas_anio = sumar(sumas_anio, bloque.groupby("anio")[FEATURES].sum())
+        libros_anio = sumar(libros_anio, bloque.groupby("anio").size())
+        sumas_cluster = sumar(sumas_cluster, bloque.groupby("cluster")[FEATURES].sum())
+        libros_cluster = sumar(libros_cluster, bloque.groupby("cluster").size())
+
+    cluster_to_label = nombrar_clusters(sumas_cluster.div(libros_cluster, axis=0))
+    count_by_year = conteos.unstack(fill_value=0).astype(int).rename(columns=cluster_to_label)
+    count_by_year.columns.name = "toxicidad"
+    medias_por_indice = sumas_anio.div(libros_anio, axis=0)
+    suma_total_anual = sumas_anio.sum(axis=1).rename("total_toxicidad")
+    return count_by_year, medias_por_indice, suma_total_anual
+
+
+# === ANÁLISIS ===
+def exportar_niveles(count_by_year, medias_por_indice, suma_total_anual, sufijo, titulo=""):
+    # Porcentaje de libros por nivel y año, medias anuales y toxicidad total
+    percentages = count_by_year.div(count_by_year.sum(axis=1), axis=0) * 100
+    percentages = percentages.reindex(columns=ETIQUETAS, fill_value=0)
+    exporttxt(percentages, f"percentages_libros{sufijo}.txt")
+
+    fig, ax = plt.subplots(figsize=(12, 5))
+    percentages.plot(kind="bar", stacked=True, color=[COLORES[col] for col in percentages.columns], ax=ax)
+    ax.set_title(f"Porcentaje de libros por grupo de toxicidad y año{titulo}")
+    ax.set_xlabel("Año")
+    ax.set_ylabel("Porcentaje (%)")
+    ax.set_xticklabels(ax.get_xticklabels(), rotation=45)
+    ax.legend(title="Nivel de toxicidad", loc='upper center', bbox_to_anchor=(0.5, -0.15), ncol=3)
+    plt.tight_layout(rect=[0, 0.1, 1, 1])
+    mostrar(f"porcentajes_libros{sufijo}")
+
+    # Media por año
+    exporttxt(medias_por_indice, f"medias_por_indice_libros{sufijo}.txt")
+
+    plt.figure(figsize=(14, 7))
+    for feature in FEATURES:
+        plt.plot(medias_por_indice.index, medias_por_indice[feature], marker='o', label=feature)
+    plt.title(f"Evolución anual de los índices de toxicidad en libros{titulo}")
+    plt.xlabel("Año")
+    plt.ylabel("Media de toxicidad")
+    plt.legend(title="Índice de toxicidad", bbox_to_anchor=(1.05, 1), loc='upper left')
+    plt.grid(True)
+    plt.tight_layout()
+    mostrar(f"medias_por_indice_libros{sufijo}")
+
+    # Suma total de toxicidad por año
+    plt.figure(figsize=(14, 6))
+    plt.plot(suma_total_anual.index, suma_total_anual.values, marker='o', color='darkred')
+    plt.title(f"Toxicidad total combinada por año en libros{titulo}")
+    plt.xlabel("Año")
+    plt.ylabel("Suma total de toxicidad")
+    plt.grid(True)
+    plt.tight_layout()
+    mostrar(f"toxicidad_total_libros{sufijo}")
+
+
+def analisis_global(df, args):
+    exportar_niveles(*niveles_en_memoria(df), args.sufijo)
+
+
+def analisis_global_streaming(conn, anio_ini, anio_fin, args):
+    exportar_niveles(*niveles_streaming(conn, anio_ini, anio_fin, args), args.sufijo)
+
+
+def analizar_lenguaje(tarea):
+    # Un lenguaje, en el proceso principal o en uno del pool -> (lenguaje, ficheros)
+    lang, n, df_lang, anio_ini, anio_fin, args = tarea
+    inicio = len(generados)
+    print(f"\n📚 Analizando lenguaje: {lang} ({n} libros)")
+    if df_lang is None:  # --streaming: cada proceso abre su conexión
+        conn = sqlite3.connect(args.db)
+        try:
+            niveles = niveles_streaming(conn, anio_ini, anio_fin, args, lang)
+        finally:
+            conn.close()
+    else:
+        niveles = niveles_en_memoria(df_lang)
+    exportar_niveles(*niveles, f"{args.sufijo}_{lang}", f" - {lang}")
+    return lang, generados[inicio:]
+
+
+def ejecutar_lenguajes(tareas, args):
+    # -> {lenguaje: ficheros}; con --procesos > 1, cada lenguaje en un proceso
+    if args.procesos <= 1 or len(tareas) <= 1:
+        return dict(map(analizar_lenguaje, tareas))
+    procesos = min(args.procesos, len(tareas))
+    config = configuracion(args, hilos=max(1, (os.cpu_count() or 1) // procesos))
+    print(f"🚀 {len(tareas)} lenguajes en {procesos} procesos x {config['hilos']} hilos")
+    ctx = mp.get_context("spawn")
+    with ctx.Pool(procesos, initializer=aplicar_configuracion, initargs=(config,)) as pool:
+        return dict(pool.imap_unordered(analizar_lenguaje, tareas))
+
+
+def filtrar_lenguajes(num_libros, args):
+    # Lenguajes con al menos --min-libros-lenguaje libros, avisando de los demás
+    validos = []
+    for lang, n in num_libros.items():
+        if n < args.min_libros_lenguaje:
+            print(f"⏭️ Omitiendo '{lang}' por tener pocos libros ({n}).")
+        else:
+            validos.append((lang, n))
+    return validos
+
+
+def analisis_lenguajes(df, args):
+    validos = dict(filtrar_lenguajes(df.groupby("lenguaje").size(), args))
+    tareas = [(lang, validos[lang], df_lang.copy(), None, None, args)
+              for lang, df_lang in df.groupby("lenguaje") if lang in validos]
+    return ejecutar_lenguajes(tareas, args)
+
+
+def analisis_lenguajes_streaming(conn, anio_ini, anio_fin, args):
+    tareas = [(lang, n, None, anio_ini, anio_fin, args)
+              for lang, n in filtrar_lenguajes(contar_por_lenguaje(conn, anio_ini, anio_fin), args)]
+    return ejecutar_lenguajes(tareas, args)
+
+
+def analisis_simple(df, args):
+    # Media anual por lenguaje
+    medias = df.groupby(["anio", "lenguaje"])[FEATURES].mean().reset_index()
+    exporttxt(medias, f"medias_anuales_por_lenguaje{args.sufijo}.txt")
+
+    # Gráfico 1: evolución media por idioma
+    plt.figure(figsize=(16, 8))
+    for lang in medias["lenguaje"].unique():
+        medias_lang = medias[medias["lenguaje"] == lang]
+        avg = medias_lang[FEATURES].mean(axis=1)
+        plt.plot(medias_lang["anio"], avg, marker='o', label=lang)
+
+    plt.title("Evolución anual de la toxicidad media por idioma")
+    plt.xlabel("Año")
+    plt.ylabel("Toxicidad media (promedio de índices)")
+    plt.legend(title="Lenguaje", loc='upper center', bbox_to_anchor=(0.5, -0.2),
+               ncol=9, fontsize='small')
+    plt.grid(True)
+    plt.tight_layout()
+    mostrar(f"evolucion_por_lenguaje{args.sufijo}")
+
+    # Gráfico 2: barras para el año más reciente
+    ultimo_anio = df["anio"].max()
+    resumen_ultimo = df[df["anio"] == ultimo_anio].groupby("lenguaje")[FEATURES].mean()
+    exporttxt(resumen_ultimo, f"resumen_toxicidad_{ultimo_anio}{args.sufijo}.txt")
+
+    resumen_ultimo.plot(kind="bar", figsize=(14, 7))
+    plt.title(f"Media de toxicidad por lenguaje en {ultimo_anio}")
+    plt.ylabel("Media de índice")
+    plt.xlabel("Lenguaje")
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+    plt.grid(axis='y')
+    mostrar(f"resumen_toxicidad_{ultimo_anio}{args.sufijo}")
+
+
+def analisis_seleccion(df, args):
+    # Barrido de k y semillas (toxiclibros/seleccion.py) -> tabla, informe y figura
+    if args.lenguaje:
+        df = df[df["lenguaje"] == args.lenguaje]
+    if df.empty:
+        raise ValueError(f"No hay libros de '{args.lenguaje}' en el rango de años.")
+    anio_ini, anio_fin = df["anio"].min(), df["anio"].max()
+    ks = list(range(args.k_min, args.k_max + 1))
+    semillas = [42 + i for i in range(args.semillas)]  # la primera es la de los análisis
+    clave_datos = f"{anio_ini}-{anio_fin}|{args.lenguaje or '*'}|{','.join(FEATURES)}"
+    ajustes = seleccion.barrido(df[FEATURES].to_numpy(dtype=np.float64), ks, semillas, args.muestra,
+                                args.procesos, ruta_cache(args.db, args.cache, "seleccion", "json"),
+                                args.version_datos, clave_datos)
+    resumen, preferido = seleccion.resumir(ajustes)
+    exporttxt(ajustes.set_index(["k", "semilla"]), f"seleccion_k{args.sufijo}.txt")
+
+    descripcion = f"Años {anio_ini}-{anio_fin}" + (f", lenguaje {args.lenguaje}" if args.lenguaje else "")
+    ruta = ruta_salida(f"seleccion_k{args.sufijo}.md")
+    with open(ruta, "w", encoding="utf-8") as f:
+        f.write(seleccion.informe(resumen, preferido, len(df), semillas, args.muestra, descripcion))
+    print(f"📝 Informe en '{ruta}': silueta -> k = {preferido['silueta']}, "
+          f"Calinski–Harabasz -> k = {preferido['calinski_harabasz']}, "
+          f"Davies–Bouldin -> k = {preferido['davies_bouldin']}")
+
+    medias = resumen.xs("mean", axis=1, level=1)
+    desviaciones = resumen.xs("std", axis=1, level=1).fillna(0)
+    fig, ejes = plt.subplots(1, 3, figsize=(16, 4.5))
+    titulos = {"inercia": "Inercia (codo)", "silueta": "Silueta (muestra)", "calinski_harabasz": "Calinski–Harabasz"}
+    for eje, (metrica, titulo) in zip(ejes, titulos.items()):
+        eje.errorbar(medias.index, medias[metrica], yerr=desviaciones[metrica], marker='o', capsize=3)
+        eje.axvline(3, color='grey', linestyle='--', label="k de los análisis")
+        eje.set_title(titulo)
+        eje.set_xlabel("k")
+        eje.grid(True)
+    ejes[0].legend()
+    plt.tight_layout()
+    mostrar(f"seleccion_k{args.sufijo}")
+
+
+ANALISIS = {
+    "global": (analisis_global, "KMeans de 3 niveles de toxicidad sobre todos los libros", "_all"),
+    "lenguajes": (analisis_lenguajes, "el análisis global por separado para cada lenguaje", ""),
+    "simple": (analisis_simple, "medias anuales por lenguaje, sin clustering", ""),
+    "seleccion": (analisis_seleccion, "barrido del número de grupos con inercia, silueta y CH", ""),
+}
+# Variantes de --streaming: reciben la conexión en vez del DataFrame
+ANALISIS_STREAMING = {
+    "global": analisis_global_streaming,
+    "lenguajes": analisis_lenguajes_streaming,
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Análisis de toxicidad por año de los libros puntuados")
+    subparsers = parser.add_subparsers(dest="analisis", required=True)
+    for nombre, (_, ayuda, sufijo) in ANALISIS.items():
+        sub = subparsers.add_parser(nombre, help=ayuda)
+        sub.add_argument("--db", default=DB_PATH)
+        sub.add_argument("--min-libros", type=int, default=MIN_LIBROS_POR_ANIO,
+                         help="libros mínimos por año para entrar en el rango continuo")
+        sub.add_argument("--fijar-rango", action="store_true",
+                         help="usar también --min-libros para el rango de libros_view (web)")
+        sub.add_argument("--sufijo", default=sufijo, help="sufijo de los ficheros .txt exportados")
+        sub.add_argument("--cache", default=CACHE_DIR, help="carpeta de la caché de características")
+        if nombre == "lenguajes":
+            sub.add_argument("--min-libros-lenguaje", type=int, default=MIN_LIBROS_POR_LENGUAJE,
+                             help="lenguajes con menos libros se omiten")
+        sub.add_argument("--salida", metavar="CARPETA",
+                         help="sin ventanas: tablas, figuras e índice en esta carpeta")
+        sub.add_argument("--formato", dest="formatos", action="append", choices=["png", "svg", "pdf"],
+                         help="formato de las figuras con --salida (repetible; png por defecto)")
+        if nombre == "lenguajes":
+            sub.add_argument("--procesos", type=int, default=1, help="lenguajes analizados en paralelo")
+        if nombre == "seleccion":
+            sub.add_argument("--k-min", type=int, default=2)
+            sub.add_argument("--k-max", type=int, default=8)
+            sub.add_argument("--semillas", type=int, default=5, help="ajustes por k con semillas distintas")
+            sub.add_argument("--muestra", type=int, default=seleccion.MUESTRA_SILUETA,
+                             help="libros muestreados para la silueta")
+            sub.add_argument("--procesos", type=int, default=os.cpu_count() or 1,
+                             help="ajustes en paralelo (cada uno con un hilo)")
+            sub.add_argument("--lenguaje", help="limitar el barrido a un lenguaje")
+        if nombre in ANALISIS_STREAMING:
+            sub.add_argument("--streaming", action="store_true",
+                             help="leer procesados por bloques con MiniBatchKMeans, sin cargar la tabla")
+            sub.add_argument("--tam-bloque", type=int, default=TAM_BLOQUE, help="filas por bloque leído")
+            sub.add_argument("--tam-lote", type=int, default=TAM_LOTE, help="filas por paso de partial_fit")
+            sub.add_argument("--epocas", type=int, default=EPOCAS, help="pasadas de ajuste sobre la tabla")
+    args = parser.parse_args(argv)
+    if args.analisis == "lenguajes" and args.procesos > 1 and args.salida is None:
+        parser.error("--procesos necesita --salida (los procesos no pueden abrir ventanas)")
+    if args.analisis == "seleccion" and not 2 <= args.k_min <= args.k_max:
+        parser.error("hace falta 2 <= --k-min <= --k-max")
+    args.formatos = args.formatos or FORMATOS
+    return args
+
+
+def configuracion(args, hilos=None):
+    return {"salida": args.salida, "formatos": args.formatos, "hilos": hilos}
+
+
+def escribir_indice(args, por_lenguaje):
+    # indice.csv en --salida: cada tabla y figura generada, por lenguaje
+    ruta = os.path.join(SALIDA, INDICE)
+    with open(ruta, "w", newline="", encoding="utf-8") as f:
+        escritor = csv.writer(f)
+        escritor.writerow(["analisis", "lenguaje", "tipo", "fichero"])
+        for lang in sorted(por_lenguaje):
+            for fichero in sorted(por_lenguaje[lang]):
+                tipo = {".txt": "tabla", ".md": "informe"}.get(os.path.splitext(fichero)[1], "figura")
+                escritor.writerow([args.analisis, lang, tipo, os.path.relpath(fichero, SALIDA)])
+    print(f"🗂️ Índice de {sum(map(len, por_lenguaje.values()))} ficheros en {ruta}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    aplicar_configuracion(configuracion(args))
+    inicio = len(generados)
+    conn = sqlite3.connect(args.db)
+    try:
+        # Agregados y libros_view para las vistas de Django (solo la primera
+        # vez recorren procesados)
+        crear_tablas_agregados(conn, args.min_libros)
+        if args.fijar_rango:
+            fijar_min_libros(conn, args.min_libros)
+        conn.commit()
+        if getattr(args, "streaming", False):
+            anio_ini, anio_fin = rango_continuo(contar_por_anio(conn), args.min_libros)
+            por_lenguaje = ANALISIS_STREAMING[args.analisis](conn, anio_ini, anio_fin, args)
+        else:
+            df = cargar_caracteristicas(conn, args.db, args.cache)
+            args.version_datos = leer_version_datos(conn)
+            anio_ini, anio_fin = rango_continuo(df["anio"].value_counts(), args.min_libros)
+    finally:
+        conn.close()
+
+    if not getattr(args, "streaming", False):
+        por_lenguaje = ANALISIS[args.analisis][0](filtrar_rango(df, anio_ini, anio_fin), args)
+    if SALIDA is not None:
+        # lenguajes devuelve sus ficheros por lenguaje; los demás, nada
+        escribir_indice(args, por_lenguaje or {"": generados[inicio:]})
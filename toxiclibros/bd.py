@@ -0,0 +1,439 @@
+# Acceso a la base de datos de resultados (tabla procesados).
+import sqlite3
+import time
+
+# Columnas de procesados en el orden en que se insertan
+COLUMNAS_PROCESADOS = [
+    "book_id", "palabras", "lenguaje", "anio", "titulo",
+    "toxicity", "severe_toxicity", "obscene",
+    "identity_attack", "insult", "threat", "sexual_explicit",
+    "hash_contenido", "version_pipeline", "modelo",
+    "trozos_muestra", "trozos_total", "ic_semiancho", "actualizado",
+]
+ETIQUETAS = COLUMNAS_PROCESADOS[5:12]
+
+SQL_UPSERT_PROCESADOS = """
+    INSERT INTO procesados ({columnas})
+    VALUES ({marcadores})
+    ON CONFLICT(book_id) DO UPDATE SET
+        {actualizaciones}
+""".format(
+    columnas=", ".join(COLUMNAS_PROCESADOS),
+    marcadores=", ".join("?" for _ in COLUMNAS_PROCESADOS),
+    actualizaciones=",\n        ".join(f"{c} = excluded.{c}" for c in COLUMNAS_PROCESADOS[1:]),
+)
+
+
+def conectar(db_path):
+    # WAL permite que las vistas de Django lean mientras una ejecución escribe;
+    # con WAL, synchronous=NORMAL solo sincroniza en los checkpoints.
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-65536")  # 64 MB
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def crear_tabla_procesados(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS procesados (
+        book_id INTEGER PRIMARY KEY,
+        palabras INTEGER,
+        lenguaje TEXT,
+        anio INTEGER,
+        titulo TEXT,
+        toxicity REAL,
+        severe_toxicity REAL,
+        obscene REAL,
+        identity_attack REAL,
+        insult REAL,
+        threat REAL,
+        sexual_explicit REAL
+    )
+    """)
+
+    # Columnas añadidas después de crear la tabla original:
+    #   huella de cada fila para el modo incremental y, con muestreo, trozos
+    #   puntuados / trozos del libro y semiancho máximo del IC de las medias
+    #   (trozos_muestra < trozos_total indica que las medias son estimadas) y
+    #   fecha UTC de la puntuación para resolver conflictos al fusionar shards
+    nuevas = [
+        ("hash_contenido", "TEXT"), ("version_pipeline", "TEXT"), ("modelo", "TEXT"),
+        ("trozos_muestra", "INTEGER"), ("trozos_total", "INTEGER"), ("ic_semiancho", "REAL"),
+        ("actualizado", "TEXT"),
+    ]
+    columnas = [col[1] for col in conn.execute("PRAGMA table_info(procesados)")]
+    for columna, tipo in nuevas:
+        if columna not in columnas:
+            conn.execute(f"ALTER TABLE procesados ADD COLUMN {columna} {tipo}")
+    crear_tablas_pasajes(conn)
+    crear_version_datos(conn)
+    crear_tablas_agregados(conn)
+    conn.commit()
+
+
+# Versión de los datos de procesados: un contador que los triggers suben con
+# cada fila insertada, cambiada o borrada. Las cachés derivadas de la tabla
+# (toxiclibros/caracteristicas.py) se guardan con la versión de la que salen
+# y se invalidan cuando cambia. Empieza en los milisegundos de su creación
+# para que no coincida con la de otra base de datos recreada en la misma ruta.
+def crear_version_datos(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS version_datos (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER
+    )
+    """)
+    conn.execute("INSERT OR IGNORE INTO version_datos VALUES (1, ?)", (time.time_ns() // 1_000_000,))
+    for evento in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS version_procesados_{evento.lower()} AFTER {evento} ON procesados
+        BEGIN
+            UPDATE version_datos SET version = version + 1 WHERE id = 1;
+        END
+        """)
+
+
+def leer_version_datos(conn):
+    return conn.execute("SELECT version FROM version_datos WHERE id = 1").fetchone()[0]
+
+
+# Detalle por trozo de cada libro de procesados (ver toxiclibros/pasajes.py):
+#   trozos_puntuaciones: posiciones de los trozos (uint32) y sus puntuaciones
+#     por etiqueta (float32, NaN si el trozo no se puntuó), little-endian
+#   pasajes_toxicos: los K trozos más tóxicos de cada etiqueta
+COLUMNAS_TROZOS = ["book_id", "trozos", "inicios", "fines", *ETIQUETAS]
+COLUMNAS_PASAJES = ["book_id", "etiqueta", "puesto", "trozo", "inicio", "fin", "fragmento", *ETIQUETAS]
+
+SQL_REEMPLAZAR_TROZOS = (f"INSERT OR REPLACE INTO trozos_puntuaciones ({', '.join(COLUMNAS_TROZOS)}) "
+                         f"VALUES ({', '.join('?' for _ in COLUMNAS_TROZOS)})")
+SQL_INSERTAR_PASAJES = (f"INSERT OR REPLACE INTO pasajes_toxicos ({', '.join(COLUMNAS_PASAJES)}) "
+                        f"VALUES ({', '.join('?' for _ in COLUMNAS_PASAJES)})")
+
+
+def crear_tablas_pasajes(conn):
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS trozos_puntuaciones (
+        book_id INTEGER PRIMARY KEY,
+        trozos INTEGER,
+        inicios BLOB,
+        fines BLOB,
+        {", ".join(f"{etiqueta} BLOB" for etiqueta in ETIQUETAS)}
+    )
+    """)
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS pasajes_toxicos (
+        book_id INTEGER,
+        etiqueta TEXT,
+        puesto INTEGER,
+        trozo INTEGER,
+        inicio INTEGER,
+        fin INTEGER,
+        fragmento TEXT,
+        {", ".join(f"{etiqueta} REAL" for etiqueta in ETIQUETAS)},
+        PRIMARY KEY (book_id, etiqueta, puesto)
+    ) WITHOUT ROWID
+    """)
+
+
+# === AGREGADOS ANUALES ===
+# Tablas materializadas que sustituyen al GROUP BY sobre procesados que
+# repetía cada lectura de la antigua libros_view:
+#   agregados_anio           por año: libros y, por etiqueta, libros con
+#                            puntuación, suma y suma de cuadrados (media y varianza)
+#   agregados_anio_lenguaje  lo mismo por año y lenguaje ('' = sin lenguaje)
+#   rango_anios              rango continuo de años más largo con al menos
+#                            min_libros libros cada uno
+# Los triggers de procesados las actualizan fila a fila; rango_anios solo se
+# recalcula (sobre agregados_anio, unos cientos de filas) cuando un año cruza
+# el umbral. libros_view queda como una vista de procesados filtrada por
+# rango_anios, resuelta con el índice de anio.
+MIN_LIBROS_RANGO = 50
+CLAVES_AGREGADOS = {"agregados_anio": ["anio"], "agregados_anio_lenguaje": ["anio", "lenguaje"]}
+COLUMNAS_AGREGADOS = (["libros"] + [f"n_{e}" for e in ETIQUETAS] + [f"suma_{e}" for e in ETIQUETAS]
+                      + [f"suma2_{e}" for e in ETIQUETAS])
+
+SQL_LIBROS_VIEW = """
+    CREATE VIEW libros_view AS
+    SELECT procesados.* FROM procesados, rango_anios
+    WHERE rango_anios.id = 1 AND procesados.anio BETWEEN rango_anios.anio_ini AND rango_anios.anio_fin
+"""
+SQL_REFRESCAR_RANGO = """
+    UPDATE rango_anios SET
+        anio_ini = (SELECT inicio FROM islas_anios ORDER BY largo DESC, inicio LIMIT 1),
+        anio_fin = (SELECT fin FROM islas_anios ORDER BY largo DESC, inicio LIMIT 1)
+    WHERE id = 1
+"""
+
+
+def _sql_sumar_agregados(tabla, fila, signo):
+    # Suma (signo "+") o resta ("-") la fila NEW u OLD de procesados en tabla
+    claves = CLAVES_AGREGADOS[tabla]
+    valores_clave = {"anio": f"{fila}.anio", "lenguaje": f"COALESCE({fila}.lenguaje, '')"}
+    valores = ["1"] + [f"{fila}.{e} IS NOT NULL" for e in ETIQUETAS]
+    valores += [f"COALESCE({fila}.{e}, 0)" for e in ETIQUETAS]
+    valores += [f"COALESCE({fila}.{e}, 0) * COALESCE({fila}.{e}, 0)" for e in ETIQUETAS]
+    return f"""
+        INSERT INTO {tabla} ({", ".join(claves + COLUMNAS_AGREGADOS)})
+        SELECT {", ".join([valores_clave[c] for c in claves] + [f"{signo}({v})" for v in valores])}
+        WHERE {fila}.anio IS NOT NULL
+        ON CONFLICT({", ".join(claves)}) DO UPDATE SET
+            {", ".join(f"{c} = {c} + excluded.{c}" for c in COLUMNAS_AGREGADOS)};
+        DELETE FROM {tabla}
+        WHERE {" AND ".join(f"{c} = {valores_clave[c]}" for c in claves)} AND libros = 0;
+    """
+
+
+def crear_tablas_agregados(conn, min_libros=MIN_LIBROS_RANGO):
+    # min_libros solo cuenta al crear rango_anios (como el antiguo CREATE VIEW
+    # IF NOT EXISTS); para cambiarlo después, fijar_min_libros()
+    existian = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'rango_anios'").fetchone()[0]
+    for tabla, claves in CLAVES_AGREGADOS.items():
+        definiciones = [f"{c} {'INTEGER' if c == 'anio' else 'TEXT'} NOT NULL" for c in claves]
+        definiciones += [f"{c} {'REAL' if c.startswith('suma') else 'INTEGER'} NOT NULL"
+                         for c in COLUMNAS_AGREGADOS]
+        conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {tabla} (
+            {", ".join(definiciones)},
+            PRIMARY KEY ({", ".join(claves)})
+        ) WITHOUT ROWID
+        """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS rango_anios (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        min_libros INTEGER NOT NULL,
+        anio_ini INTEGER,
+        anio_fin INTEGER
+    )
+    """)
+    conn.execute("INSERT OR IGNORE INTO rango_anios (id, min_libros) VALUES (1, ?)", (min_libros,))
+    # Secuencias de años consecutivos con min_libros (huecos e islas)
+    conn.execute("""
+    CREATE VIEW IF NOT EXISTS islas_anios AS
+    SELECT MIN(anio) AS inicio, MAX(anio) AS fin, COUNT(*) AS largo FROM (
+        SELECT anio, anio - ROW_NUMBER() OVER (ORDER BY anio) AS isla
+        FROM agregados_anio
+        WHERE libros >= (SELECT min_libros FROM rango_anios WHERE id = 1)
+    ) GROUP BY isla
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_procesados_anio ON procesados(anio)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_procesados_lenguaje ON procesados(lenguaje)")
+
+    # Mantenimiento fila a fila desde procesados
+    columnas_vigiladas = ", ".join(["anio", "lenguaje", *ETIQUETAS])
+    cuerpos = {
+        "insert": ("AFTER INSERT", ["NEW"]),
+        "update": (f"AFTER UPDATE OF {columnas_vigiladas}", ["OLD", "NEW"]),
+        "delete": ("AFTER DELETE", ["OLD"]),
+    }
+    for nombre, (evento, filas) in cuerpos.items():
+        sentencias = "".join(_sql_sumar_agregados(tabla, fila, "-" if fila == "OLD" else "+")
+                             for fila in filas for tabla in CLAVES_AGREGADOS)
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS agregados_procesados_{nombre} {evento} ON procesados
+        BEGIN {sentencias} END
+        """)
+    # El rango solo cambia cuando un año cruza min_libros
+    umbral = "(SELECT min_libros FROM rango_anios WHERE id = 1)"
+    condiciones = {
+        "insert": ("AFTER INSERT", f"NEW.libros >= {umbral}"),
+        "update": ("AFTER UPDATE OF libros", f"(OLD.libros >= {umbral}) <> (NEW.libros >= {umbral})"),
+        "delete": ("AFTER DELETE", f"OLD.libros >= {umbral}"),
+    }
+    for nombre, (evento, condicion) in condiciones.items():
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS rango_anios_{nombre} {evento} ON agregados_anio
+        WHEN {condicion}
+        BEGIN {SQL_REFRESCAR_RANGO}; END
+        """)
+
+    # libros_view de versiones anteriores (GROUP BY en cada lectura) se sustituye
+    vista = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'view' AND name = 'libros_view'").fetchone()
+    if vista is None or "rango_anios" not in vista[0]:
+        conn.execute("DROP VIEW IF EXISTS libros_view")
+        conn.execute(SQL_LIBROS_VIEW)
+    if not existian:
+        reconstruir_agregados(conn)
+
+
+def reconstruir_agregados(conn):
+    # Recalcula los agregados desde procesados (al crearlos sobre una tabla
+    # con datos o para descartar el error acumulado de las sumas)
+    for tabla, claves in CLAVES_AGREGADOS.items():
+        valores_clave = {"anio": "anio", "lenguaje": "COALESCE(lenguaje, '')"}
+        valores = ["COUNT(*)"] + [f"COUNT({e})" for e in ETIQUETAS]
+        valores += [f"TOTAL({e})" for e in ETIQUETAS]
+        valores += [f"TOTAL({e} * {e})" for e in ETIQUETAS]
+        conn.execute(f"DELETE FROM {tabla}")
+        conn.execute(f"""
+            INSERT INTO {tabla} ({", ".join(claves + COLUMNAS_AGREGADOS)})
+            SELECT {", ".join([valores_clave[c] for c in claves] + valores)}
+            FROM procesados WHERE anio IS NOT NULL
+            GROUP BY {", ".join(valores_clave[c] for c in claves)}
+        """)
+    conn.execute(SQL_REFRESCAR_RANGO)
+
+
+def fijar_min_libros(conn, min_libros):
+    conn.execute("UPDATE rango_anios SET min_libros = ? WHERE id = 1", (min_libros,))
+    conn.execute(SQL_REFRESCAR_RANGO)
+    conn.commit()
+
+
+def crear_tabla_cuarentena(conn):
+    # Libros apartados por exceder su presupuesto o tumbar un worker, con el
+    # uso de recursos al apartarlos y el troceado con el que se intentó
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS cuarentena (
+        book_id INTEGER PRIMARY KEY,
+        motivo TEXT,
+        segundos REAL,
+        memoria_mb REAL,
+        bytes INTEGER,
+        trozos INTEGER,
+        tokens_por_trozo INTEGER,
+        intentos INTEGER,
+        actualizado TEXT
+    )
+    """)
+    conn.commit()
+
+
+def registrar_cuarentena(conn, book_id, motivo, uso, tokens_por_trozo):
+    with conn:
+        conn.execute("""
+            INSERT INTO cuarentena (book_id, motivo, segundos, memoria_mb, bytes, trozos,
+                                    tokens_por_trozo, intentos, actualizado)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)
+            ON CONFLICT(book_id) DO UPDATE SET
+                motivo = excluded.motivo,
+                segundos = excluded.segundos,
+                memoria_mb = excluded.memoria_mb,
+                bytes = excluded.bytes,
+                trozos = excluded.trozos,
+                tokens_por_trozo = excluded.tokens_por_trozo,
+                intentos = cuarentena.intentos + 1,
+                actualizado = excluded.actualizado
+        """, (book_id, motivo, uso.get("segundos"), uso.get("memoria_mb"), uso.get("bytes"),
+              uso.get("trozos"), tokens_por_trozo, time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())))
+
+
+def cargar_cuarentena(conn):
+    return {fila[0] for fila in conn.execute("SELECT book_id FROM cuarentena")}
+
+
+# Condición para que la fila de un shard sustituya a la que ya hay al fusionar
+CRITERIOS_FUSION = {
+    # la puntuada más recientemente
+    "fecha": "COALESCE(excluded.actualizado, '') > COALESCE(procesados.actualizado, '')",
+    # la de versión del pipeline posterior ("3+muestreo0.01" cuenta como 3) y,
+    # a igual versión, la más reciente
+    "version": """(CAST(COALESCE(excluded.version_pipeline, 0) AS INTEGER), COALESCE(excluded.actualizado, ''))
+                > (CAST(COALESCE(procesados.version_pipeline, 0) AS INTEGER), COALESCE(procesados.actualizado, ''))""",
+}
+
+
+def fusionar_procesados(conn, ruta, criterio="fecha"):
+    # Copia en conn las filas de procesados de otra base de datos; si el libro
+    # ya está, se queda la fila que gane según el criterio. Devuelve las filas
+    # insertadas o sustituidas. El detalle por trozo acompaña a la fila ganadora.
+    columnas = ", ".join(COLUMNAS_PROCESADOS)
+    actualizaciones = ", ".join(f"{c} = excluded.{c}" for c in COLUMNAS_PROCESADOS[1:])
+    conn.execute("ATTACH DATABASE ? AS origen", (ruta,))
+    try:
+        with conn:
+            # "WHERE true" evita que SQLite lea ON CONFLICT como parte de un JOIN
+            cambiadas = conn.execute(f"""
+                INSERT INTO procesados ({columnas})
+                SELECT {columnas} FROM origen.procesados WHERE true
+                ON CONFLICT(book_id) DO UPDATE SET {actualizaciones}
+                WHERE {CRITERIOS_FUSION[criterio]}
+            """).rowcount
+
+            # Ganadoras: filas que ahora son idénticas a las del origen
+            conn.execute("""
+                CREATE TEMP TABLE ganadores AS
+                SELECT o.book_id FROM origen.procesados o JOIN procesados p USING (book_id)
+                WHERE p.actualizado IS o.actualizado AND p.hash_contenido IS o.hash_contenido
+                  AND p.version_pipeline IS o.version_pipeline AND p.modelo IS o.modelo
+            """)
+            tablas_origen = {fila[0] for fila in conn.execute("SELECT name FROM origen.sqlite_master")}
+            for tabla, columnas_tabla in (("trozos_puntuaciones", COLUMNAS_TROZOS),
+                                          ("pasajes_toxicos", COLUMNAS_PASAJES)):
+                if tabla not in tablas_origen:
+                    continue
+                lista = ", ".join(columnas_tabla)
+                conn.execute(f"DELETE FROM {tabla} WHERE book_id IN (SELECT book_id FROM ganadores)")
+                conn.execute(f"""
+                    INSERT INTO {tabla} ({lista})
+                    SELECT {lista} FROM origen.{tabla} WHERE book_id IN (SELECT book_id FROM ganadores)
+                """)
+            conn.execute("DROP TABLE temp.ganadores")
+    finally:
+        conn.execute("DETACH DATABASE origen")
+    return cambiadas
+
+
+class EscritorProcesados:
+    # Acumula filas de procesados y las vuelca con executemany en una sola
+    # transacción cada max_filas filas o max_segundos segundos, junto con el
+    # detalle por trozo de cada libro (que sustituye al anterior). Con
+    # limpiar_cuarentena, en la misma transacción se sacan de la cuarentena
+    # los libros que ya tienen fila.
+
+    def __init__(self, conn, max_filas=200, max_segundos=30.0, limpiar_cuarentena=False):
+        self.conn = conn
+        self.max_filas = max_filas
+        self.max_segundos = max_segundos
+        self.limpiar_cuarentena = limpiar_cuarentena
+        self.pendientes = []
+        self.ultimo_volcado = time.monotonic()
+        self.filas_escritas = 0
+
+    def agregar(self, fila, detalle=None):
+        # detalle: (fila de trozos_puntuaciones, filas de pasajes_toxicos) o None
+        self.pendientes.append((fila, detalle))
+        if len(self.pendientes) >= self.max_filas:
+            self.volcar()
+        else:
+            self.volcar_si_toca()
+
+    def volcar_si_toca(self):
+        if self.pendientes and time.monotonic() - self.ultimo_volcado >= self.max_segundos:
+            self.volcar()
+
+    def _escribir(self, lote):
+        ids = [(fila[0],) for fila, _ in lote]
+        with self.conn:
+            self.conn.executemany(SQL_UPSERT_PROCESADOS, [fila for fila, _ in lote])
+            self.conn.executemany("DELETE FROM trozos_puntuaciones WHERE book_id = ?", ids)
+            self.conn.executemany("DELETE FROM pasajes_toxicos WHERE book_id = ?", ids)
+            detalles = [detalle for _, detalle in lote if detalle is not None]
+            self.conn.executemany(SQL_REEMPLAZAR_TROZOS, [trozos for trozos, _ in detalles])
+            self.conn.executemany(SQL_INSERTAR_PASAJES, [p for _, pasajes in detalles for p in pasajes])
+            if self.limpiar_cuarentena:
+                self.conn.executemany("DELETE FROM cuarentena WHERE book_id = ?", ids)
+
+    def volcar(self):
+        self.ultimo_volcado = time.monotonic()
+        if not self.pendientes:
+            return
+        lote, self.pendientes = self.pendientes, []
+        try:
+            self._escribir(lote)
+            self.filas_escritas += len(lote)
+        except sqlite3.Error as e:
+            # Se reintenta fila a fila para no perder el lote por una fila mala
+            print(f"⚠️ Error al volcar {len(lote)} filas, reintentando una a una: {e}")
+            for elemento in lote:
+                try:
+                    self._escribir([elemento])
+                    self.filas_escritas += 1
+                except sqlite3.Error as e:
+                    print(f"⚠️ Error al registrar {elemento[0][0]}: {e}")
+
+    def cerrar(self):
+        self.volcar()
+        self.conn.close()
@@ -0,0 +1,117 @@
+# Caché persistente de puntuaciones por fragmento, compartida entre libros.
+#
+# Los textos de Gutenberg repiten bloques idénticos (licencia, notas del
+# transcriptor...). La clave es el hash del texto normalizado más el nombre
+# del modelo, y el valor las siete puntuaciones de Detoxify. Se guarda en
+# SQLite con un tope de entradas y expulsión de las menos usadas (LRU).
+# La marca de uso es aproximada para que un acierto sea solo una lectura (los
+# workers no compiten por el bloqueo de escritura): solo se renueva en las
+# entradas no usadas en la última REFRESCO_USADO_S, y por lotes.
+import hashlib
+import sqlite3
+import time
+import unicodedata
+
+LABELS = [
+    "toxicity", "severe_toxicity", "obscene",
+    "identity_attack", "insult", "threat", "sexual_explicit"
+]
+
+RECORTE_CADA = 1000      # inserciones entre comprobaciones del tope
+REFRESCO_USADO_S = 3600  # antigüedad mínima de `usado` para renovarlo en un acierto
+USADOS_CADA = 1000       # marcas de uso pendientes antes de escribirlas
+
+
+def normalizar(texto):
+    return " ".join(unicodedata.normalize("NFC", texto).split())
+
+
+class CachePuntuaciones:
+
+    def __init__(self, ruta, modelo, max_entradas=1_000_000):
+        self.modelo = modelo
+        self.max_entradas = max_entradas
+        self.conn = sqlite3.connect(ruta, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS puntuaciones (
+                clave BLOB PRIMARY KEY,
+                {", ".join(f"{label} REAL" for label in LABELS)},
+                usado INTEGER
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_puntuaciones_usado ON puntuaciones(usado)")
+        self.conn.commit()
+        self.consultas = 0
+        self.aciertos = 0
+        self.inserciones = 0
+        self.usados = set()  # claves acertadas con `usado` por renovar
+
+    def clave(self, texto):
+        datos = f"{self.modelo}\0{normalizar(texto)}".encode("utf-8")
+        return hashlib.blake2b(datos, digest_size=16).digest()
+
+    def buscar(self, textos):
+        # Lista paralela a textos: dict de puntuaciones o None si no está
+        claves = [self.clave(t) for t in textos]
+        marcadores = ", ".join("?" for _ in claves)
+        filas = self.conn.execute(
+            f"SELECT clave, usado, {', '.join(LABELS)} FROM puntuaciones WHERE clave IN ({marcadores})",
+            claves
+        ).fetchall()
+        encontrados = {fila[0]: dict(zip(LABELS, fila[2:])) for fila in filas}
+
+        self.consultas += len(claves)
+        self.aciertos += sum(1 for c in claves if c in encontrados)
+        limite = time.time_ns() - REFRESCO_USADO_S * 10**9
+        self.usados.update(fila[0] for fila in filas if fila[1] < limite)
+        if len(self.usados) >= USADOS_CADA:
+            with self.conn:
+                self.volcar_usados()
+        return [encontrados.get(c) for c in claves]
+
+    def volcar_usados(self):
+        # Dentro de una transacción abierta por quien llama
+        if self.usados:
+            ahora = time.time_ns()
+            self.conn.executemany("UPDATE puntuaciones SET usado = ? WHERE clave = ?",
+                                  [(ahora, clave) for clave in self.usados])
+            self.usados.clear()
+
+    def guardar(self, textos, puntuaciones):
+        ahora = time.time_ns()
+        filas = [
+            (self.clave(t), *(float(p.get(label, 0.0)) for label in LABELS), ahora)
+            for t, p in zip(textos, puntuaciones)
+        ]
+        with self.conn:
+            self.volcar_usados()  # ya se escribe: de paso, las marcas pendientes
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO puntuaciones VALUES ({', '.join('?' for _ in range(len(LABELS) + 2))})",
+                filas
+            )
+        self.inserciones += len(filas)
+        if self.inserciones >= RECORTE_CADA:
+            self.inserciones = 0
+            self.recortar()
+
+    def recortar(self):
+        # Deja la caché en el 90 % del tope expulsando las entradas usadas hace más tiempo
+        with self.conn:
+            self.volcar_usados()
+        total = self.conn.execute("SELECT COUNT(*) FROM puntuaciones").fetchone()[0]
+        if total <= self.max_entradas:
+            return
+        sobrantes = total - int(self.max_entradas * 0.9)
+        with self.conn:
+            self.conn.execute("""
+                DELETE FROM puntuaciones WHERE clave IN (
+                    SELECT clave FROM puntuaciones ORDER BY usado LIMIT ?
+                )
+            """, (sobrantes,))
+
+    def cerrar(self):
+        with self.conn:
+            self.volcar_usados()
+        self.conn.close()
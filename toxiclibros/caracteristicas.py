@@ -0,0 +1,147 @@
+# Matriz de características de procesados para los análisis (2.analisis.py).
+#
+# Los análisis solo necesitan año, lenguaje y las puntuaciones de cada libro.
+# Se leen de procesados con una sola consulta y se guardan tipados en un .npz
+# (float64 para las puntuaciones, int64 para ids y años, lenguajes como
+# códigos sobre su lista de valores) junto a la versión de los datos de la
+# base (tabla version_datos, ver toxiclibros/bd.py). Mientras procesados no
+# cambie, las siguientes ejecuciones, con los parámetros que sean, cargan el
+# .npz en vez de recorrer la tabla. El filtro por el rango continuo de años
+# se aplica en memoria. Para el modo por bloques (--streaming) están
+# contar_por_anio y leer_bloques, que nunca materializan la tabla entera.
+import hashlib
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from toxiclibros.bd import ETIQUETAS, crear_version_datos, leer_version_datos
+
+CACHE_DIR = "cache_analisis"
+COLUMNAS_ENTERAS = ["book_id", "anio"]
+COLUMNAS_REALES = ["palabras", *ETIQUETAS]  # palabras admite nulos
+
+
+def ruta_cache(db_path, cache_dir=CACHE_DIR, prefijo="caracteristicas", extension="npz"):
+    # Un fichero por base de datos, identificada por su ruta absoluta
+    clave = hashlib.blake2b(os.path.abspath(db_path).encode("utf-8"), digest_size=8).hexdigest()
+    return os.path.join(cache_dir, f"{prefijo}_{clave}.{extension}")
+
+
+def leer_de_bd(conn):
+    # -> (versión, DataFrame) leídos en la misma transacción de lectura
+    conn.execute("BEGIN")
+    try:
+        version = leer_version_datos(conn)
+        df = pd.read_sql(f"""
+            SELECT {", ".join(COLUMNAS_ENTERAS)}, lenguaje, {", ".join(COLUMNAS_REALES)}
+            FROM procesados
+            WHERE anio IS NOT NULL
+            ORDER BY book_id
+        """, conn)
+    finally:
+        conn.execute("COMMIT")
+    return version, df
+
+
+def guardar_cache(ruta, version, df):
+    codigos, lenguajes = pd.factorize(df["lenguaje"])  # nulos -> -1
+    arrays = {columna: df[columna].to_numpy(dtype=np.int64) for columna in COLUMNAS_ENTERAS}
+    arrays.update({columna: df[columna].to_numpy(dtype=np.float64) for columna in COLUMNAS_REALES})
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    temporal = ruta + ".tmp.npz"
+    np.savez(temporal, version=np.int64(version), lenguaje=codigos.astype(np.int32),
+             lenguajes=np.asarray(lenguajes, dtype=str), **arrays)
+    os.replace(temporal, ruta)  # nunca queda un .npz a medio escribir
+
+
+def leer_cache(ruta, version):
+    # DataFrame de la caché, o None si no existe o es de otra versión
+    if not os.path.exists(ruta):
+        return None
+    with np.load(ruta, allow_pickle=False) as datos:
+        if int(datos["version"]) != version:
+            return None
+        columnas = {columna: datos[columna] for columna in COLUMNAS_ENTERAS}
+        codigos = datos["lenguaje"]
+        columnas["lenguaje"] = pd.Categorical.from_codes(codigos, datos["lenguajes"]).astype(object)
+        columnas.update({columna: datos[columna] for columna in COLUMNAS_REALES})
+    df = pd.DataFrame(columnas)
+    df["lenguaje"] = df["lenguaje"].where(codigos >= 0, None)
+    return df
+
+
+def cargar_caracteristicas(conn, db_path, cache_dir=CACHE_DIR):
+    # Libros de procesados con año: book_id, anio, lenguaje, palabras y etiquetas
+    crear_version_datos(conn)  # bases creadas antes del contador
+    conn.commit()
+    version = leer_version_datos(conn)
+    ruta = ruta_cache(db_path, cache_dir)
+    inicio = time.perf_counter()
+    df = leer_cache(ruta, version)
+    if df is not None:
+        print(f"⚡ Características de {len(df)} libros desde la caché {ruta} ({time.perf_counter() - inicio:.2f} s)")
+        return df
+    version, df = leer_de_bd(conn)
+    guardar_cache(ruta, version, df)
+    print(f"🗄️ Características de {len(df)} libros leídas de {db_path} y guardadas en {ruta} "
+          f"({time.perf_counter() - inicio:.2f} s)")
+    return leer_cache(ruta, version)
+
+
+# === LECTURA POR BLOQUES ===
+# Para tablas que no caben en memoria (p. ej. puntuaciones por trozo): los
+# recuentos salen de las tablas de agregados (toxiclibros/bd.py) y las filas,
+# en bloques de tamaño fijo, sin pasar por la caché.
+def contar_por_anio(conn):
+    # Libros por año (Series indexada por año)
+    return pd.read_sql("SELECT anio, libros AS n FROM agregados_anio", conn, index_col="anio")["n"]
+
+
+def contar_por_lenguaje(conn, anio_ini, anio_fin):
+    return pd.read_sql("""
+        SELECT lenguaje, SUM(libros) AS n FROM agregados_anio_lenguaje
+        WHERE anio BETWEEN ? AND ? AND lenguaje <> ''
+        GROUP BY lenguaje ORDER BY lenguaje
+    """, conn, params=[int(anio_ini), int(anio_fin)], index_col="lenguaje")["n"]
+
+
+def leer_bloques(conn, columnas, anio_ini, anio_fin, tam_bloque, lenguaje=None):
+    # DataFrames de hasta tam_bloque filas del rango de años, siempre en el mismo orden
+    sql = f"SELECT {', '.join(columnas)} FROM procesados WHERE anio BETWEEN ? AND ?"
+    parametros = [int(anio_ini), int(anio_fin)]
+    if lenguaje is not None:
+        sql += " AND lenguaje = ?"
+        parametros.append(lenguaje)
+    return pd.read_sql(sql + " ORDER BY book_id", conn, params=parametros, chunksize=tam_bloque)
+
+
+# === RANGO CONTINUO DE AÑOS ===
+def rango_continuo(num_libros, min_libros):
+    # Secuencia más larga de años consecutivos con al menos min_libros libros
+    # (num_libros: libros por año, p. ej. df["anio"].value_counts())
+    num_libros = num_libros.sort_index()
+    anios_validos = num_libros[num_libros >= min_libros].index.tolist()
+
+    if not anios_validos:
+        raise ValueError("No hay años con suficientes libros para el análisis.")
+
+    secuencias, temp = [], [anios_validos[0]]
+    for i in range(1, len(anios_validos)):
+        if anios_validos[i] == anios_validos[i-1] + 1:
+            temp.append(anios_validos[i])
+        else:
+            secuencias.append(temp)
+            temp = [anios_validos[i]]
+    secuencias.append(temp)
+
+    rango_max = max(secuencias, key=len)
+    anio_ini, anio_fin = rango_max[0], rango_max[-1]
+    print(f"\U0001F4C5 Rango continuo seleccionado: {anio_ini} - {anio_fin} ({len(rango_max)} años)")
+    return anio_ini, anio_fin
+
+
+def filtrar_rango(df, anio_ini, anio_fin):
+    # Lo mismo que libros_view: todos los años del rango tienen min_libros
+    return df[df["anio"].between(anio_ini, anio_fin)].reset_index(drop=True)
@@ -0,0 +1,124 @@
+# Corpus empaquetado: todos los libros en unos pocos ficheros grandes (shards)
+# con un índice book_id -> (shard, offset, longitud, codificación, hash).
+#
+# Sustituye a un .pkl por libro: en lugar de abrir y deserializar miles de
+# ficheros, el lector proyecta los shards con mmap y sirve cada libro como
+# memoryview sin copias o como texto decodificado bajo demanda.
+import hashlib
+import json
+import mmap
+import os
+import pickle
+
+VERSION_CORPUS = 1
+FICHERO_INDICE = "indice.json"
+TAMANO_SHARD = 1 << 30  # 1 GiB
+
+
+def nombre_shard(n):
+    return f"shard_{n:04d}.bin"
+
+
+def codificar(texto):
+    # ASCII siempre que se pueda: así un offset de carácter es un offset de byte
+    # y se pueden leer fragmentos sin decodificar el libro entero.
+    try:
+        return texto.encode("ascii"), "ascii"
+    except UnicodeEncodeError:
+        return texto.encode("utf-8"), "utf-8"
+
+
+def empaquetar(indice, destino, tamano_shard=TAMANO_SHARD):
+    # indice: {book_id: ruta del .pkl}. Devuelve el número de libros empaquetados.
+    # El hash guardado es el SHA-1 del .pkl original, el mismo que registra
+    # el modo incremental, para que cambiar de formato no obligue a repuntuar.
+    os.makedirs(destino, exist_ok=True)
+    libros, shards = {}, []
+    salida, n_shard, offset = None, -1, 0
+
+    try:
+        for book_id in sorted(indice):
+            try:
+                with open(indice[book_id], "rb") as f:
+                    datos = f.read()
+                texto = pickle.loads(datos)
+                if not isinstance(texto, str):
+                    raise ValueError("Contenido no es texto")
+            except Exception as e:
+                print(f"⚠️ [{book_id}] No se pudo empaquetar: {e}")
+                continue
+            hash_contenido = hashlib.sha1(datos).hexdigest()
+            bytes_libro, codificacion = codificar(texto)
+            del datos, texto
+
+            if salida is None or (offset > 0 and offset + len(bytes_libro) > tamano_shard):
+                if salida is not None:
+                    salida.close()
+                n_shard += 1
+                shards.append(nombre_shard(n_shard))
+                salida = open(os.path.join(destino, shards[-1]), "wb")
+                offset = 0
+
+            salida.write(bytes_libro)
+            libros[book_id] = [n_shard, offset, len(bytes_libro), codificacion, hash_contenido]
+            offset += len(bytes_libro)
+    finally:
+        if salida is not None:
+            salida.close()
+
+    temporal = os.path.join(destino, FICHERO_INDICE + ".tmp")
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump({"version": VERSION_CORPUS, "shards": shards, "libros": libros}, f)
+    os.replace(temporal, os.path.join(destino, FICHERO_INDICE))
+    return len(libros)
+
+
+class CorpusEmpaquetado:
+
+    def __init__(self, carpeta):
+        self.carpeta = carpeta
+        with open(os.path.join(carpeta, FICHERO_INDICE), "r", encoding="utf-8") as f:
+            datos = json.load(f)
+        if datos.get("version") != VERSION_CORPUS:
+            raise ValueError(f"Versión de corpus no soportada en {carpeta}")
+        self.shards = datos["shards"]
+        self.libros = {int(k): v for k, v in datos["libros"].items()}
+        self._mapas = {}
+
+    def __contains__(self, book_id):
+        return book_id in self.libros
+
+    def __len__(self):
+        return len(self.libros)
+
+    def ids(self):
+        return self.libros.keys()
+
+    def hash(self, book_id):
+        return self.libros[book_id][4]
+
+    def _mapa(self, n_shard):
+        # Los shards se proyectan la primera vez que se piden
+        if n_shard not in self._mapas:
+            with open(os.path.join(self.carpeta, self.shards[n_shard]), "rb") as f:
+                self._mapas[n_shard] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mapas[n_shard]
+
+    def bytes(self, book_id):
+        # memoryview sobre el mmap, sin copiar el libro
+        n_shard, offset, longitud, _, _ = self.libros[book_id]
+        return memoryview(self._mapa(n_shard))[offset:offset + longitud]
+
+    def texto(self, book_id):
+        return str(self.bytes(book_id), self.libros[book_id][3])
+
+    def fragmento(self, book_id, inicio, fin):
+        # Caracteres [inicio, fin) del libro; en ASCII sin decodificar el resto
+        if self.libros[book_id][3] == "ascii":
+            return str(self.bytes(book_id)[inicio:fin], "ascii")
+        return self.texto(book_id)[inicio:fin]
+
+    def cerrar(self):
+        for mapa in self._mapas.values():
+            mapa.close()
+        self._mapas = {}
@@ -0,0 +1,72 @@
+# Presupuesto de tiempo y memoria por libro.
+#
+# Un libro patológico (fichero enorme, codificación rara...) no debe parar la
+# ejecución: si se pasa del presupuesto se aparta a la tabla cuarentena con el
+# motivo y los recursos que llevaba consumidos, y se sigue con el siguiente.
+# Las comprobaciones son cooperativas (entre trozos y entre lotes): un bloqueo
+# dentro de una sola llamada al modelo solo lo corta el vigilante de los
+# workers en modo paralelo, que mata el proceso.
+import os
+import time
+from collections import namedtuple
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+INTERVALO_MEMORIA = 0.5   # segundos mínimos entre lecturas de la memoria del proceso
+
+# Resultado de un libro apartado: motivo ("tiempo", "memoria", "tamaño"...) y uso
+Cuarentena = namedtuple("Cuarentena", ["motivo", "uso"])
+
+
+def memoria_mb():
+    # Memoria residente del proceso en MB (None si no se puede medir)
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2**20
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class PresupuestoExcedido(Exception):
+
+    def __init__(self, motivo, uso):
+        super().__init__(f"presupuesto de {motivo} excedido ({uso})")
+        self.motivo = motivo
+        self.uso = uso
+
+
+class Presupuesto:
+    # Límites para una unidad de trabajo (un libro o un grupo de libros que se
+    # puntúan juntos, con la suma de sus presupuestos). La memoria se mide como
+    # crecimiento sobre la del proceso al empezar, que ya incluye el modelo.
+
+    def __init__(self, max_segundos=None, max_memoria_mb=None):
+        self.max_segundos = max_segundos
+        self.max_memoria_mb = max_memoria_mb
+        self.inicio = time.perf_counter()
+        self.ultima_medida = self.inicio
+        self.memoria_inicial = memoria_mb() if max_memoria_mb else None
+        self.memoria_pico = self.memoria_inicial
+
+    def uso(self):
+        uso = {"segundos": round(time.perf_counter() - self.inicio, 3)}
+        if self.memoria_inicial is not None:
+            uso["memoria_mb"] = round(self.memoria_pico - self.memoria_inicial, 1)
+        return uso
+
+    def comprobar(self):
+        ahora = time.perf_counter()
+        if self.max_segundos and ahora - self.inicio > self.max_segundos:
+            raise PresupuestoExcedido("tiempo", self.uso())
+        if self.memoria_inicial is not None and ahora - self.ultima_medida >= INTERVALO_MEMORIA:
+            self.ultima_medida = ahora
+            memoria = memoria_mb()
+            if memoria is not None:
+                self.memoria_pico = max(self.memoria_pico, memoria)
+                if self.memoria_pico - self.memoria_inicial > self.max_memoria_mb:
+                    raise PresupuestoExcedido("memoria", self.uso())
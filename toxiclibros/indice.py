@@ -0,0 +1,96 @@
+# Índice book_id -> fichero .pkl construido con un único recorrido de BOOKS_FOLDER.
+#
+# El resultado se guarda en un manifiesto JSON con el tamaño y mtime de cada
+# fichero y el mtime de cada directorio. En ejecuciones posteriores basta con
+# comprobar los mtimes de los directorios (crear, borrar o renombrar un fichero
+# cambia el de su carpeta) para reutilizarlo sin volver a recorrer el árbol.
+import json
+import os
+
+VERSION_MANIFIESTO = 1
+
+
+def id_de_fichero(nombre):
+    # "{book_id}_loquesea.pkl" -> book_id; None si no sigue el patrón
+    if not nombre.endswith(".pkl"):
+        return None
+    prefijo, separador, _ = nombre.partition("_")
+    if not separador or not prefijo.isdigit():
+        return None
+    return int(prefijo)
+
+
+def escanear_carpeta(carpeta):
+    directorios, libros = {}, {}
+    for root, _, files in os.walk(carpeta):
+        directorios[os.path.relpath(root, carpeta)] = os.stat(root).st_mtime_ns
+        for file in files:
+            book_id = id_de_fichero(file)
+            # Como buscar_archivo_pkl: gana el primero que aparece en el recorrido
+            if book_id is None or book_id in libros:
+                continue
+            ruta = os.path.join(root, file)
+            st = os.stat(ruta)
+            libros[book_id] = [os.path.relpath(ruta, carpeta), st.st_size, st.st_mtime_ns]
+
+    return {
+        "version": VERSION_MANIFIESTO,
+        "carpeta": os.path.abspath(carpeta),
+        "directorios": directorios,
+        "libros": libros,
+    }
+
+
+def manifiesto_vigente(manifiesto, carpeta):
+    if manifiesto.get("version") != VERSION_MANIFIESTO:
+        return False
+    if manifiesto.get("carpeta") != os.path.abspath(carpeta):
+        return False
+    for relativo, mtime in manifiesto["directorios"].items():
+        try:
+            if os.stat(os.path.join(carpeta, relativo)).st_mtime_ns != mtime:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def leer_manifiesto(ruta_manifiesto):
+    try:
+        with open(ruta_manifiesto, "r", encoding="utf-8") as f:
+            manifiesto = json.load(f)
+    except (OSError, ValueError):
+        return None
+    manifiesto["libros"] = {int(k): v for k, v in manifiesto.get("libros", {}).items()}
+    return manifiesto
+
+
+def guardar_manifiesto(manifiesto, ruta_manifiesto):
+    temporal = ruta_manifiesto + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f)
+    os.replace(temporal, ruta_manifiesto)
+
+
+def obtener_manifiesto(carpeta, ruta_manifiesto):
+    manifiesto = leer_manifiesto(ruta_manifiesto)
+    if manifiesto is not None and manifiesto_vigente(manifiesto, carpeta):
+        print(f"🗂️ Índice de libros reutilizado: {len(manifiesto['libros'])} ficheros")
+        return manifiesto
+
+    manifiesto = escanear_carpeta(carpeta)
+    try:
+        guardar_manifiesto(manifiesto, ruta_manifiesto)
+    except OSError as e:
+        print(f"⚠️ No se pudo guardar el manifiesto {ruta_manifiesto}: {e}")
+    print(f"🗂️ Índice de libros generado: {len(manifiesto['libros'])} ficheros")
+    return manifiesto
+
+
+def cargar_indice(carpeta, ruta_manifiesto):
+    # {book_id: ruta absoluta del .pkl}
+    manifiesto = obtener_manifiesto(carpeta, ruta_manifiesto)
+    return {
+        book_id: os.path.join(carpeta, entrada[0])
+        for book_id, entrada in manifiesto["libros"].items()
+    }
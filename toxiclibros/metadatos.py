@@ -0,0 +1,103 @@
+# Metadatos de Gutenberg compilados una vez en la tabla metadata.
+#
+# El CSV se lee una sola vez y se limpia con operaciones de columna de
+# pandas (año de "Published Date", lenguajes y títulos normalizados) en vez
+# de df.loc y re.search libro a libro. El resultado queda tipado en la misma
+# base de datos que procesados, para que el filtro y el reparador lo crucen
+# con SQL. metadata_fuente guarda tamaño y fecha del CSV compilado: si
+# cambian, se vuelve a compilar.
+import os
+import time
+
+import pandas as pd
+
+COLUMNAS_METADATA = ["book_id", "titulo", "autor", "lenguaje", "lenguaje_principal", "anio", "fecha_publicacion"]
+
+
+def crear_tabla_metadata(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS metadata (
+        book_id INTEGER PRIMARY KEY,
+        titulo TEXT,
+        autor TEXT,
+        lenguaje TEXT,
+        lenguaje_principal TEXT,
+        anio INTEGER,
+        fecha_publicacion TEXT
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS metadata_fuente (
+        ruta TEXT,
+        tamano INTEGER,
+        modificado REAL,
+        compilado TEXT
+    )
+    """)
+    conn.commit()
+
+
+def limpiar_texto(serie):
+    # Espacios repetidos y saltos de línea a un solo espacio; vacíos a nulo
+    serie = serie.astype("string").str.replace(r"\s+", " ", regex=True).str.strip()
+    return serie.mask(serie == "")
+
+
+def normalizar_metadatos(df):
+    # DataFrame del CSV -> DataFrame con COLUMNAS_METADATA, una fila por libro
+    lenguaje = limpiar_texto(df["Language"]).str.replace(r"\s*[;,]\s*", "; ", regex=True)
+    fecha = limpiar_texto(df["Published Date"])
+    metadatos = pd.DataFrame({
+        "book_id": pd.to_numeric(df["Book Num"], errors="coerce").astype("Int64"),
+        "titulo": limpiar_texto(df["Book Title"]),
+        "autor": limpiar_texto(df["Author"]) if "Author" in df else pd.NA,
+        "lenguaje": lenguaje,
+        "lenguaje_principal": lenguaje.str.split(";").str[0],
+        "anio": pd.to_numeric(fecha.str.extract(r"(\d{4})", expand=False), errors="coerce").astype("Int64"),
+        "fecha_publicacion": fecha,
+    })
+    metadatos = metadatos.dropna(subset=["book_id"])
+    return metadatos.drop_duplicates(subset="book_id", keep="first")
+
+
+def firma_csv(ruta_csv):
+    estado = os.stat(ruta_csv)
+    return estado.st_size, estado.st_mtime
+
+
+def metadatos_al_dia(conn, ruta_csv):
+    crear_tabla_metadata(conn)
+    fila = conn.execute("SELECT ruta, tamano, modificado FROM metadata_fuente").fetchone()
+    if fila is None or not os.path.exists(ruta_csv):
+        return fila is not None
+    return (os.path.abspath(ruta_csv), *firma_csv(ruta_csv)) == tuple(fila)
+
+
+def compilar_metadatos(conn, ruta_csv):
+    # Sustituye el contenido de metadata por el del CSV; devuelve los libros
+    crear_tabla_metadata(conn)
+    metadatos = normalizar_metadatos(pd.read_csv(ruta_csv))
+    # Nulos de pandas (NA, NaN) a None para SQLite
+    filas = metadatos.astype(object).where(metadatos.notna(), None).itertuples(index=False, name=None)
+    with conn:
+        conn.execute("DELETE FROM metadata")
+        conn.executemany(
+            f"INSERT INTO metadata ({', '.join(COLUMNAS_METADATA)}) "
+            f"VALUES ({', '.join('?' for _ in COLUMNAS_METADATA)})",
+            filas,
+        )
+        conn.execute("DELETE FROM metadata_fuente")
+        conn.execute("INSERT INTO metadata_fuente VALUES (?, ?, ?, ?)",
+                     (os.path.abspath(ruta_csv), *firma_csv(ruta_csv),
+                      time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())))
+    return len(metadatos)
+
+
+def asegurar_metadatos(conn, ruta_csv):
+    # Compila la tabla si no existe o el CSV ha cambiado desde la última vez
+    if metadatos_al_dia(conn, ruta_csv):
+        return False
+    inicio = time.perf_counter()
+    n = compilar_metadatos(conn, ruta_csv)
+    print(f"🗃️ Metadatos compilados: {n} libros de {ruta_csv} ({time.perf_counter() - inicio:.1f} s)")
+    return True
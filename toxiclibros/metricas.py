@@ -0,0 +1,198 @@
+# Instrumentación del pipeline de puntuación.
+#
+# Cada libro lleva un Cronometro con el tiempo de cada etapa y sus contadores;
+# un único objeto Metricas por ejecución (el proceso que escribe en SQLite)
+# los acumula en histogramas y contadores y los vuelca periódicamente como
+# una línea JSON por intervalo y como fichero de texto para Prometheus
+# (node_exporter textfile collector).
+import heapq
+import json
+import math
+import os
+import time
+from contextlib import contextmanager
+
+ETAPAS = ("busqueda", "lectura", "troceado", "inferencia", "escritura")
+ESTADOS = ("puntuado", "sin_cambios", "error", "cuarentena")
+
+# Límites superiores de los cubos de los histogramas, en segundos
+LIMITES_SEGUNDOS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, math.inf)
+
+
+class Cronometro:
+    # Tiempos por etapa y contadores de un libro (se envía entre procesos)
+
+    def __init__(self):
+        self.tiempos = {}
+        self.trozos = 0
+        self.tokens = 0
+        self.fallidos = 0
+
+    def sumar(self, etapa, segundos):
+        self.tiempos[etapa] = self.tiempos.get(etapa, 0.0) + segundos
+
+    @contextmanager
+    def medir(self, etapa):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.sumar(etapa, time.perf_counter() - inicio)
+
+    def cronometrar(self, iterable, etapa):
+        # Como iter(iterable), sumando a la etapa el tiempo de generar cada elemento
+        iterador = iter(iterable)
+        while True:
+            inicio = time.perf_counter()
+            try:
+                elemento = next(iterador)
+            except StopIteration:
+                self.sumar(etapa, time.perf_counter() - inicio)
+                return
+            self.sumar(etapa, time.perf_counter() - inicio)
+            yield elemento
+
+    def total(self):
+        return sum(self.tiempos.values())
+
+
+class Histograma:
+
+    def __init__(self, limites=LIMITES_SEGUNDOS):
+        self.limites = limites
+        self.cubos = [0] * len(limites)
+        self.suma = 0.0
+        self.n = 0
+
+    def observar(self, valor):
+        for k, limite in enumerate(self.limites):
+            if valor <= limite:
+                self.cubos[k] += 1
+                break
+        self.suma += valor
+        self.n += 1
+
+    def cuantil(self, q):
+        # Límite superior del cubo que contiene el cuantil q (aproximado)
+        if not self.n:
+            return 0.0
+        objetivo, acumulado = q * self.n, 0
+        for limite, cuenta in zip(self.limites, self.cubos):
+            acumulado += cuenta
+            if acumulado >= objetivo:
+                return limite
+        return self.limites[-1]
+
+
+def formato_limite(limite):
+    return "+Inf" if math.isinf(limite) else repr(limite)
+
+
+def valor_json(valor):
+    # JSON no admite infinito: un cuantil en el último cubo se escribe como null
+    return None if math.isinf(valor) else valor
+
+
+class Metricas:
+
+    def __init__(self, ruta_log=None, ruta_prometheus=None, intervalo=60.0, n_lentos=10, prefijo="toxiclibros"):
+        self.ruta_log = ruta_log
+        self.ruta_prometheus = ruta_prometheus
+        self.intervalo = intervalo
+        self.n_lentos = n_lentos
+        self.prefijo = prefijo
+        self.inicio = time.time()
+        self.ultimo_volcado = time.monotonic()
+        self.histogramas = {etapa: Histograma() for etapa in ETAPAS + ("total",)}
+        self.libros = {estado: 0 for estado in ESTADOS}
+        self.contadores = {"trozos": 0, "tokens": 0, "trozos_fallidos": 0}
+        self.lentos = []  # montículo de (segundos, book_id, tiempos) con los n_lentos mayores
+
+    def libro(self, book_id, crono, estado):
+        self.libros[estado] += 1
+        if crono is not None:
+            self.contadores["trozos"] += crono.trozos
+            self.contadores["tokens"] += crono.tokens
+            self.contadores["trozos_fallidos"] += crono.fallidos
+            for etapa, segundos in crono.tiempos.items():
+                self.histogramas[etapa].observar(segundos)
+            if estado == "puntuado":
+                total = crono.total()
+                self.histogramas["total"].observar(total)
+                entrada = (total, book_id, dict(crono.tiempos))
+                if len(self.lentos) < self.n_lentos:
+                    heapq.heappush(self.lentos, entrada)
+                elif total > self.lentos[0][0]:
+                    heapq.heapreplace(self.lentos, entrada)
+        self.volcar_si_toca()
+
+    def volcar_si_toca(self):
+        if time.monotonic() - self.ultimo_volcado >= self.intervalo:
+            self.volcar()
+
+    def instantanea(self):
+        return {
+            "ts": round(time.time(), 3),
+            "transcurrido": round(time.time() - self.inicio, 3),
+            "libros": dict(self.libros),
+            "contadores": dict(self.contadores),
+            "etapas": {
+                etapa: {"n": h.n, "segundos": round(h.suma, 6),
+                        "p50": valor_json(h.cuantil(0.5)), "p95": valor_json(h.cuantil(0.95))}
+                for etapa, h in self.histogramas.items() if h.n
+            },
+        }
+
+    def volcar(self):
+        self.ultimo_volcado = time.monotonic()
+        if self.ruta_log:
+            with open(self.ruta_log, "a", encoding="utf-8") as f:
+                f.write(json.dumps(self.instantanea(), ensure_ascii=False) + "\n")
+        if self.ruta_prometheus:
+            # Se escribe aparte y se renombra para que el recolector nunca lea medio fichero
+            temporal = self.ruta_prometheus + ".tmp"
+            with open(temporal, "w", encoding="utf-8") as f:
+                f.write(self.texto_prometheus())
+            os.replace(temporal, self.ruta_prometheus)
+
+    def texto_prometheus(self):
+        p = self.prefijo
+        lineas = [
+            f"# HELP {p}_etapa_segundos Tiempo por libro en cada etapa del pipeline",
+            f"# TYPE {p}_etapa_segundos histogram",
+        ]
+        for etapa, h in self.histogramas.items():
+            acumulado = 0
+            for limite, cuenta in zip(h.limites, h.cubos):
+                acumulado += cuenta
+                lineas.append(f'{p}_etapa_segundos_bucket{{etapa="{etapa}",le="{formato_limite(limite)}"}} {acumulado}')
+            lineas.append(f'{p}_etapa_segundos_sum{{etapa="{etapa}"}} {h.suma}')
+            lineas.append(f'{p}_etapa_segundos_count{{etapa="{etapa}"}} {h.n}')
+
+        lineas += [f"# HELP {p}_libros_total Libros terminados por estado", f"# TYPE {p}_libros_total counter"]
+        lineas += [f'{p}_libros_total{{estado="{estado}"}} {n}' for estado, n in self.libros.items()]
+        for nombre, valor in self.contadores.items():
+            lineas += [f"# TYPE {p}_{nombre}_total counter", f"{p}_{nombre}_total {valor}"]
+        lineas += [f"# TYPE {p}_inicio_segundos gauge", f"{p}_inicio_segundos {self.inicio}"]
+        return "\n".join(lineas) + "\n"
+
+    def resumen(self):
+        total = sum(self.histogramas[etapa].suma for etapa in ETAPAS)
+        if total > 0:
+            print("⏱️ Tiempo por etapa (suma de libros; p50/p95 por libro):")
+            for etapa in ETAPAS:
+                h = self.histogramas[etapa]
+                if h.n:
+                    print(f"   {etapa:<11} {h.suma:9.1f} s {100 * h.suma / total:5.1f} %   "
+                          f"p50 <= {h.cuantil(0.5):g} s, p95 <= {h.cuantil(0.95):g} s")
+        if self.contadores["trozos_fallidos"]:
+            print(f"⚠️ {self.contadores['trozos_fallidos']} trozos sin puntuar por error del modelo")
+        if self.lentos:
+            print(f"🐢 {len(self.lentos)} libros más lentos:")
+            for segundos, book_id, tiempos in sorted(self.lentos, reverse=True):
+                detalle = ", ".join(f"{etapa} {tiempos[etapa]:.2f}" for etapa in ETAPAS if etapa in tiempos)
+                print(f"   {book_id:>8} {segundos:8.2f} s ({detalle})")
+
+    def cerrar(self):
+        self.volcar()
+        self.resumen()
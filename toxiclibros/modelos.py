@@ -0,0 +1,189 @@
+# Backends de puntuación intercambiables con la misma interfaz que Detoxify:
+# predict(str) -> {etiqueta: float} y predict(list) -> {etiqueta: [float, ...]}.
+#
+#   pytorch  Detoxify tal cual (PyTorch eager, fp32)
+#   onnx     el mismo checkpoint exportado a ONNX y ejecutado con ONNX Runtime
+#            en CPU, opcionalmente con cuantización dinámica int8
+#
+# PoolModelos mantiene varios modelos de Detoxify cargados bajo demanda (p.
+# ej. original para inglés y multilingual para el resto) dentro de un tope
+# de memoria.
+import gc
+import json
+import os
+from collections import OrderedDict
+
+from toxiclibros.cuarentena import memoria_mb
+
+BACKENDS = ("pytorch", "onnx")
+ONNX_DIR = "modelos_onnx"
+
+# Memoria aproximada de cada modelo cargado (pesos fp32 y tokenizer), para
+# hacer sitio antes de cargarlo; después se usa la medida de verdad
+MEMORIA_MODELOS_MB = {"original": 500, "unbiased": 550, "multilingual": 1200}
+
+
+def identificador_modelo(modelo, cuantizado=False):
+    # Nombre que se registra en procesados y en la caché. ONNX fp32 reproduce
+    # las puntuaciones de PyTorch (ver comprobar_paridad) y comparte nombre;
+    # int8 no, así que sus resultados no se mezclan con los demás.
+    return f"{modelo}+int8" if cuantizado else modelo
+
+
+def crear_backend(nombre, modelo, hilos=None, cuantizar=False, hilos_inter=1, onnx_dir=ONNX_DIR):
+    if nombre == "pytorch":
+        return BackendPyTorch(modelo, hilos)
+    if nombre == "onnx":
+        return BackendONNX(modelo, hilos, cuantizar, hilos_inter, onnx_dir)
+    raise ValueError(f"Backend desconocido: {nombre} (opciones: {', '.join(BACKENDS)})")
+
+
+class BackendPyTorch:
+
+    def __init__(self, modelo, hilos=None):
+        import torch
+        from detoxify import Detoxify
+        if hilos:
+            torch.set_num_threads(hilos)
+        self.nombre = identificador_modelo(modelo)
+        self.detox = Detoxify(modelo)
+
+    def predict(self, texto):
+        return self.detox.predict(texto)
+
+
+def exportar_onnx(modelo, carpeta, cuantizar):
+    # Exporta el checkpoint de Detoxify (una sola vez) junto con su tokenizer
+    # y los nombres de las clases; devuelve la ruta del .onnx a usar.
+    ruta = os.path.join(carpeta, "modelo.onnx")
+    ruta_int8 = os.path.join(carpeta, "modelo.int8.onnx")
+
+    if not os.path.exists(ruta):
+        import torch
+        from detoxify import Detoxify
+
+        print(f"📤 Exportando '{modelo}' a ONNX en {carpeta}")
+        os.makedirs(carpeta, exist_ok=True)
+        detox = Detoxify(modelo, device="cpu")
+        detox.model.eval()
+        ejemplo = detox.tokenizer(["ejemplo de exportación"], return_tensors="pt",
+                                  truncation=True, padding=True)
+        nombres = list(ejemplo.keys())
+
+        class Envoltorio(torch.nn.Module):
+            # El modelo de HF recibe los tensores por nombre; ONNX, por posición
+            def __init__(self, red):
+                super().__init__()
+                self.red = red
+
+            def forward(self, *tensores):
+                return self.red(**dict(zip(nombres, tensores)))[0]
+
+        ejes = {n: {0: "lote", 1: "secuencia"} for n in nombres}
+        ejes["logits"] = {0: "lote"}
+        with torch.no_grad():
+            torch.onnx.export(
+                Envoltorio(detox.model), tuple(ejemplo[n] for n in nombres), ruta,
+                input_names=nombres, output_names=["logits"],
+                dynamic_axes=ejes, opset_version=14,
+            )
+        detox.tokenizer.save_pretrained(carpeta)
+        with open(os.path.join(carpeta, "clases.json"), "w", encoding="utf-8") as f:
+            json.dump(list(detox.class_names), f)
+
+    if cuantizar and not os.path.exists(ruta_int8):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        print("🗜️ Cuantizando pesos a int8")
+        quantize_dynamic(ruta, ruta_int8, weight_type=QuantType.QInt8)
+
+    return ruta_int8 if cuantizar else ruta
+
+
+class BackendONNX:
+
+    def __init__(self, modelo, hilos=None, cuantizar=False, hilos_inter=1, onnx_dir=ONNX_DIR):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        carpeta = os.path.join(onnx_dir, modelo)
+        ruta = exportar_onnx(modelo, carpeta, cuantizar)
+        self.nombre = identificador_modelo(modelo, cuantizar)
+        self.tokenizer = AutoTokenizer.from_pretrained(carpeta)
+        with open(os.path.join(carpeta, "clases.json"), "r", encoding="utf-8") as f:
+            self.clases = json.load(f)
+
+        opciones = ort.SessionOptions()
+        opciones.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opciones.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if hilos:
+            opciones.intra_op_num_threads = hilos
+        opciones.inter_op_num_threads = hilos_inter
+        self.sesion = ort.InferenceSession(ruta, opciones, providers=["CPUExecutionProvider"])
+        self.entradas = [e.name for e in self.sesion.get_inputs()]
+
+    def predict(self, texto):
+        import numpy as np
+
+        lista = [texto] if isinstance(texto, str) else list(texto)
+        tokens = self.tokenizer(lista, return_tensors="np", truncation=True, padding=True)
+        logits = self.sesion.run(None, {n: tokens[n].astype(np.int64) for n in self.entradas})[0]
+        scores = 1.0 / (1.0 + np.exp(-logits))
+
+        if isinstance(texto, str):
+            return {clase: float(scores[0][j]) for j, clase in enumerate(self.clases)}
+        return {clase: [float(x) for x in scores[:, j]] for j, clase in enumerate(self.clases)}
+
+
+class PoolModelos:
+    # Backends por nombre de modelo, creados con crear(nombre) la primera vez
+    # que se piden. Si con el nuevo la memoria de los cargados pasaría de
+    # max_memoria_mb, se descargan antes los usados hace más tiempo (el que
+    # se pide se carga siempre, aunque por sí solo supere el tope).
+
+    def __init__(self, crear, max_memoria_mb=None):
+        self.crear = crear
+        self.max_memoria_mb = max_memoria_mb
+        self.cargados = OrderedDict()  # nombre -> (backend, MB), del menos al más reciente
+        self.cargas = 0
+        self.expulsiones = 0
+
+    def memoria(self):
+        return sum(mb for _, mb in self.cargados.values())
+
+    def obtener(self, nombre):
+        if nombre in self.cargados:
+            self.cargados.move_to_end(nombre)
+            return self.cargados[nombre][0]
+
+        estimada = MEMORIA_MODELOS_MB.get(nombre, 0)
+        if self.max_memoria_mb:
+            while self.cargados and self.memoria() + estimada > self.max_memoria_mb:
+                expulsado, (_, mb) = self.cargados.popitem(last=False)
+                self.expulsiones += 1
+                print(f"♻️ Descargando el modelo {expulsado} (~{mb:.0f} MB) para cargar {nombre}")
+            gc.collect()
+
+        antes = memoria_mb()
+        backend = self.crear(nombre)
+        despues = memoria_mb()
+        medida = despues - antes if antes is not None and despues is not None else 0
+        self.cargados[nombre] = (backend, max(medida, estimada))
+        self.cargas += 1
+        return backend
+
+    def estadisticas(self):
+        return {"modelos_cargas": self.cargas, "modelos_expulsiones": self.expulsiones}
+
+
+def comprobar_paridad(referencia, candidato, textos, tam_lote=32):
+    # Diferencia absoluta máxima por etiqueta entre dos backends sobre los mismos textos
+    diferencias = {}
+    for i in range(0, len(textos), tam_lote):
+        lote = textos[i:i + tam_lote]
+        a, b = referencia.predict(lote), candidato.predict(lote)
+        for etiqueta in a:
+            if etiqueta not in b:
+                continue
+            maxima = max(abs(float(x) - float(y)) for x, y in zip(a[etiqueta], b[etiqueta]))
+            diferencias[etiqueta] = max(diferencias.get(etiqueta, 0.0), maxima)
+    return diferencias
@@ -0,0 +1,59 @@
+# Muestreo adaptativo de trozos para estimar las medias de un libro.
+#
+# En lugar de puntuar todos los trozos se toma una muestra aleatoria
+# estratificada (el libro se divide en tramos contiguos y se va sacando un
+# trozo de cada tramo por turnos) y se para en cuanto el intervalo de confianza
+# de la media de cada etiqueta es más estrecho que la tolerancia.
+import math
+
+Z_95 = 1.959964
+
+
+def orden_estratificado(n, estratos, rng):
+    # Permutación de range(n) que reparte los primeros índices por todo el libro
+    estratos = max(1, min(estratos, n))
+    tramos = []
+    for k in range(estratos):
+        tramo = list(range(n * k // estratos, n * (k + 1) // estratos))
+        rng.shuffle(tramo)
+        tramos.append(tramo)
+
+    orden = []
+    while len(orden) < n:
+        ronda = [tramo for tramo in tramos if tramo]
+        rng.shuffle(ronda)
+        for tramo in ronda:
+            orden.append(tramo.pop())
+    return orden
+
+
+class EstimadorMedias:
+    # Media y varianza incrementales (Welford) por etiqueta
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.n = 0
+        self.medias = {label: 0.0 for label in labels}
+        self.m2 = {label: 0.0 for label in labels}
+
+    def agregar(self, puntuacion):
+        self.n += 1
+        for label in self.labels:
+            x = puntuacion.get(label, 0.0)
+            delta = x - self.medias[label]
+            self.medias[label] += delta / self.n
+            self.m2[label] += delta * (x - self.medias[label])
+
+    def semiancho(self, label, poblacion, z=Z_95):
+        # Semiancho del IC de la media con corrección por población finita
+        if self.n < 2:
+            return math.inf
+        varianza = self.m2[label] / (self.n - 1)
+        correccion = (poblacion - self.n) / (poblacion - 1) if poblacion > 1 else 0.0
+        return z * math.sqrt(varianza / self.n * max(correccion, 0.0))
+
+    def semiancho_maximo(self, poblacion, z=Z_95):
+        return max(self.semiancho(label, poblacion, z) for label in self.labels)
+
+    def convergido(self, tolerancia, poblacion, z=Z_95):
+        return self.semiancho_maximo(poblacion, z) <= tolerancia
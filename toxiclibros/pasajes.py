@@ -0,0 +1,107 @@
+# Puntuaciones por trozo y pasajes más tóxicos de cada libro.
+#
+# Además de las medias de procesados, de cada libro se guardan las
+# puntuaciones de todos sus trozos como arrays compactos en
+# trozos_puntuaciones (4 bytes por trozo y etiqueta) y, por etiqueta, los K
+# trozos más tóxicos con su posición en el libro y un fragmento en
+# pasajes_toxicos. Así saber dónde es tóxico un libro o calcular agregados
+# nuevos (máximo, p95, proporción sobre un umbral) no exige volver a puntuar.
+# Con muestreo, los trozos sin puntuar quedan como NaN.
+import heapq
+import math
+import sys
+from array import array
+
+from toxiclibros.bd import ETIQUETAS, COLUMNAS_PASAJES
+
+TOP_K = 5                 # pasajes por libro y etiqueta
+LONGITUD_FRAGMENTO = 300  # caracteres del fragmento guardado de cada pasaje
+UMBRAL = 0.5              # para la proporción de trozos tóxicos en resumir()
+
+# uint32 para las posiciones y float32 para las puntuaciones
+TIPO_POSICION = "I"
+TIPO_PUNTUACION = "f"
+
+
+def a_blob(valores, tipo):
+    datos = array(tipo, valores)
+    if sys.byteorder == "big":
+        datos.byteswap()
+    return datos.tobytes()
+
+
+def de_blob(blob, tipo):
+    datos = array(tipo)
+    datos.frombytes(blob)
+    if sys.byteorder == "big":
+        datos.byteswap()
+    return datos
+
+
+def fragmento(texto, inicio, fin, longitud=LONGITUD_FRAGMENTO):
+    fragmento = " ".join(texto[inicio:fin].split())
+    if len(fragmento) <= longitud:
+        return fragmento
+    return fragmento[:longitud - 1].rstrip() + "…"
+
+
+def detalle_libro(book_id, texto, trozos, k=TOP_K):
+    # trozos: [(inicio, fin, puntuaciones o None)] en el orden del libro
+    # -> (fila de trozos_puntuaciones, filas de pasajes_toxicos)
+    nan = float("nan")
+    fila = (
+        book_id,
+        len(trozos),
+        a_blob([inicio for inicio, _, _ in trozos], TIPO_POSICION),
+        a_blob([fin for _, fin, _ in trozos], TIPO_POSICION),
+        *(a_blob([nan if p is None else p.get(etiqueta, nan) for _, _, p in trozos], TIPO_PUNTUACION)
+          for etiqueta in ETIQUETAS),
+    )
+
+    puntuados = [j for j, (_, _, p) in enumerate(trozos) if p is not None]
+    pasajes = []
+    for etiqueta in ETIQUETAS:
+        mejores = heapq.nlargest(k, puntuados, key=lambda j: trozos[j][2].get(etiqueta, 0.0))
+        for puesto, j in enumerate(mejores, 1):
+            inicio, fin, p = trozos[j]
+            pasajes.append((book_id, etiqueta, puesto, j, inicio, fin, fragmento(texto, inicio, fin),
+                            *(p.get(e) for e in ETIQUETAS)))
+    return fila, pasajes
+
+
+# === CONSULTAS ===
+def leer_puntuaciones(conn, book_id):
+    # {"inicios", "fines", etiqueta...: array} de un libro; None si no hay detalle
+    fila = conn.execute(f"""
+        SELECT inicios, fines, {", ".join(ETIQUETAS)} FROM trozos_puntuaciones WHERE book_id = ?
+    """, (book_id,)).fetchone()
+    if fila is None:
+        return None
+    datos = {"inicios": de_blob(fila[0], TIPO_POSICION), "fines": de_blob(fila[1], TIPO_POSICION)}
+    for etiqueta, blob in zip(ETIQUETAS, fila[2:]):
+        datos[etiqueta] = de_blob(blob, TIPO_PUNTUACION)
+    return datos
+
+
+def leer_pasajes(conn, book_id, etiqueta=None):
+    # Pasajes de un libro como dicts, por etiqueta y puesto
+    sql = f"SELECT {', '.join(COLUMNAS_PASAJES)} FROM pasajes_toxicos WHERE book_id = ?"
+    parametros = [book_id]
+    if etiqueta:
+        sql += " AND etiqueta = ?"
+        parametros.append(etiqueta)
+    filas = conn.execute(sql + " ORDER BY etiqueta, puesto", parametros)
+    return [dict(zip(COLUMNAS_PASAJES, fila)) for fila in filas]
+
+
+def resumir(valores, umbral=UMBRAL):
+    # Máximo, p95 y proporción de trozos >= umbral, ignorando los no puntuados
+    validos = sorted(v for v in valores if not math.isnan(v))
+    if not validos:
+        return None
+    return {
+        "trozos": len(validos),
+        "maximo": validos[-1],
+        "p95": validos[max(0, math.ceil(0.95 * len(validos)) - 1)],
+        "sobre_umbral": sum(v >= umbral for v in validos) / len(validos),
+    }
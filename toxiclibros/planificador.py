@@ -0,0 +1,41 @@
+# Planificación de lotes de inferencia.
+#
+# Un lote se rellena hasta su trozo más largo, así que mezclar trozos de
+# longitudes muy distintas desperdicia cómputo en relleno. Políticas:
+#   secuencial    lotes en el orden de los trozos (perezoso, no materializa nada)
+#   por_longitud  ordena por tokens antes de formar los lotes, de modo que cada
+#                 lote agrupa trozos de longitud parecida
+POLITICAS = ("secuencial", "por_longitud")
+
+
+def tokens_de(elemento):
+    return elemento.tokens
+
+
+def generar_lotes(elementos, batch_size, max_tokens, tokens=tokens_de):
+    # Agrupa elementos consecutivos sin superar batch_size ni max_tokens
+    # (el lote se rellena hasta el elemento más largo).
+    lote, max_lote = [], 0
+    for elemento in elementos:
+        t = tokens(elemento)
+        nuevo_max = max(max_lote, t)
+        if lote and (len(lote) >= batch_size or nuevo_max * (len(lote) + 1) > max_tokens):
+            yield lote
+            lote, nuevo_max = [], t
+        lote.append(elemento)
+        max_lote = nuevo_max
+    if lote:
+        yield lote
+
+
+def planificar(elementos, politica, batch_size, max_tokens, tokens=tokens_de):
+    if politica == "por_longitud":
+        elementos = sorted(elementos, key=tokens)
+    elif politica != "secuencial":
+        raise ValueError(f"Política de lotes desconocida: {politica} (opciones: {', '.join(POLITICAS)})")
+    return generar_lotes(elementos, batch_size, max_tokens, tokens)
+
+
+def tokens_relleno(tokens_lote):
+    # (tokens reales, tokens tras rellenar hasta el más largo) de un lote
+    return sum(tokens_lote), len(tokens_lote) * max(tokens_lote, default=0)
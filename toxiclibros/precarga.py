@@ -0,0 +1,71 @@
+# Precarga de libros en segundo plano.
+#
+# Un hilo lee, deserializa y trocea los siguientes grupos de libros mientras
+# el hilo principal puntúa el actual (la inferencia de PyTorch/ONNX Runtime
+# libera el GIL). La cola está acotada para no tener más de `profundidad`
+# grupos en memoria. Su ocupación indica dónde está el cuello de botella:
+#   casi siempre vacía  -> el consumidor espera a la lectura (limitado por E/S)
+#   casi siempre llena  -> el lector espera al modelo (limitado por cómputo)
+import queue
+import threading
+import time
+
+_FIN = object()
+
+
+class Precargador:
+    # Iterable de (grupo, cargar(grupo)) en el mismo orden que `grupos`
+
+    def __init__(self, grupos, cargar, profundidad):
+        self.profundidad = max(1, profundidad)
+        self.cola = queue.Queue(self.profundidad)
+        self.tomas = 0
+        self.ocupacion_acumulada = 0
+        self.tomas_vacia = 0
+        self.espera_consumidor = 0.0
+        self.espera_productor = 0.0
+        self.hilo = threading.Thread(target=self._producir, args=(grupos, cargar), daemon=True)
+        self.hilo.start()
+
+    def _poner(self, elemento):
+        inicio = time.perf_counter()
+        self.cola.put(elemento)
+        self.espera_productor += time.perf_counter() - inicio
+
+    def _producir(self, grupos, cargar):
+        try:
+            for grupo in grupos:
+                self._poner((grupo, cargar(grupo)))
+        except BaseException as e:
+            # Se relanza en el hilo consumidor
+            self._poner((_FIN, e))
+            return
+        self._poner((_FIN, None))
+
+    def __iter__(self):
+        while True:
+            ocupacion = self.cola.qsize()
+            inicio = time.perf_counter()
+            grupo, cargado = self.cola.get()
+            if grupo is _FIN:
+                if cargado is not None:
+                    raise cargado
+                return
+            self.espera_consumidor += time.perf_counter() - inicio
+            self.tomas += 1
+            self.ocupacion_acumulada += ocupacion
+            if ocupacion == 0:
+                self.tomas_vacia += 1
+            yield grupo, cargado
+
+    def ocupacion(self):
+        return self.cola.qsize()
+
+    def estadisticas(self):
+        return {
+            "precarga_tomas": self.tomas,
+            "precarga_ocupacion": self.ocupacion_acumulada,
+            "precarga_vacia": self.tomas_vacia,
+            "precarga_espera_consumidor": self.espera_consumidor,
+            "precarga_espera_productor": self.espera_productor,
+        }
@@ -0,0 +1,143 @@
+# Selección del número de grupos de KMeans (2.analisis.py seleccion).
+#
+# Los análisis usan siempre 3 grupos de toxicidad. Este barrido ajusta KMeans
+# para cada k de un rango y varias semillas, repartiendo los ajustes entre
+# procesos, y puntúa cada uno con:
+#   inercia            suma de distancias al cuadrado a los centroides
+#   silueta            en una muestra de `muestra` libros (la exacta es O(n²))
+#   calinski_harabasz  dispersión entre grupos / dentro de grupos, O(n)
+#   davies_bouldin     similitud media de cada grupo con el más parecido, O(n)
+# Cada ajuste se guarda en un JSON junto a la versión de los datos de la base
+# (ver toxiclibros/bd.py): repetir el barrido o ampliar el rango de k solo
+# calcula los ajustes que faltan, hasta que cambie procesados.
+import json
+import multiprocessing as mp
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+from sklearn.metrics import calinski_harabasz_score, davies_bouldin_score, silhouette_score
+from threadpoolctl import threadpool_limits
+
+MUESTRA_SILUETA = 10_000
+METRICAS = ["inercia", "silueta", "calinski_harabasz", "davies_bouldin"]
+
+matriz = None  # X del barrido en cada proceso (se envía una vez, al iniciar el pool)
+
+
+def iniciar_proceso(X, hilos):
+    global matriz
+    matriz = X
+    threadpool_limits(hilos)
+
+
+def ajustar(tarea):
+    # Un ajuste de KMeans sobre `matriz` -> dict con sus métricas
+    k, semilla, muestra = tarea
+    inicio = time.perf_counter()
+    # n_init=1: la variación entre inicializaciones es lo que miden las semillas
+    kmeans = KMeans(n_clusters=k, random_state=semilla, n_init=1)
+    grupos = kmeans.fit_predict(matriz)
+    return {
+        "k": k,
+        "semilla": semilla,
+        "inercia": float(kmeans.inertia_),
+        "silueta": float(silhouette_score(matriz, grupos, sample_size=min(muestra, len(matriz)),
+                                          random_state=semilla)),
+        "calinski_harabasz": float(calinski_harabasz_score(matriz, grupos)),
+        "davies_bouldin": float(davies_bouldin_score(matriz, grupos)),
+        "iteraciones": int(kmeans.n_iter_),
+        "segundos": time.perf_counter() - inicio,
+    }
+
+
+# === CACHÉ ===
+def leer_cache(ruta, version):
+    # {clave de ajuste: resultado} de la versión de datos actual
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta, encoding="utf-8") as f:
+        datos = json.load(f)
+    return datos["ajustes"] if datos.get("version") == version else {}
+
+
+def guardar_cache(ruta, version, ajustes):
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    temporal = ruta + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump({"version": version, "ajustes": ajustes}, f)
+    os.replace(temporal, ruta)
+
+
+def barrido(X, ks, semillas, muestra, procesos, ruta_cache, version, clave_datos):
+    # Ajustes de todos los (k, semilla) como DataFrame; clave_datos identifica
+    # las filas y columnas de X para no mezclar barridos distintos en la caché
+    ajustes = leer_cache(ruta_cache, version)
+    claves = {(k, s): f"{clave_datos}|k={k}|semilla={s}|muestra={muestra}" for k in ks for s in semillas}
+    pendientes = [(k, s, muestra) for (k, s), clave in claves.items() if clave not in ajustes]
+    print(f"🔁 {len(claves)} ajustes: {len(claves) - len(pendientes)} en caché, {len(pendientes)} por calcular")
+
+    if pendientes:
+        inicio = time.perf_counter()
+        procesos = max(1, min(procesos, len(pendientes)))
+        if procesos == 1:
+            iniciar_proceso(X, None)
+            nuevos = map(ajustar, pendientes)
+        else:
+            print(f"🚀 {procesos} procesos x 1 hilo")
+            pool = mp.get_context("spawn").Pool(procesos, initializer=iniciar_proceso, initargs=(X, 1))
+            # Los ajustes grandes primero, para no acabar esperando a uno solo
+            nuevos = pool.imap_unordered(ajustar, sorted(pendientes, reverse=True))
+        try:
+            for resultado in nuevos:
+                ajustes[claves[resultado["k"], resultado["semilla"]]] = resultado
+                print(f"   k={resultado['k']:<3} semilla={resultado['semilla']:<4} "
+                      f"silueta={resultado['silueta']:.3f} ({resultado['segundos']:.1f} s)")
+        finally:
+            if procesos > 1:
+                pool.close()
+                pool.join()
+            guardar_cache(ruta_cache, version, ajustes)  # también lo hecho si se interrumpe
+        print(f"⏱️ Barrido en {time.perf_counter() - inicio:.1f} s")
+
+    return pd.DataFrame([ajustes[claves[k, s]] for k in ks for s in semillas])
+
+
+def resumir(ajustes):
+    # Media y desviación por k de cada métrica, más el k que prefiere cada una
+    resumen = ajustes.groupby("k")[METRICAS + ["segundos"]].agg(["mean", "std"])
+    medias = resumen.xs("mean", axis=1, level=1)
+    preferido = {
+        "silueta": int(medias["silueta"].idxmax()),
+        "calinski_harabasz": int(medias["calinski_harabasz"].idxmax()),
+        "davies_bouldin": int(medias["davies_bouldin"].idxmin()),
+    }
+    return resumen, preferido
+
+
+def informe(resumen, preferido, n_libros, semillas, muestra, descripcion):
+    # Informe en Markdown para el artículo
+    lineas = [
+        "# Selección del número de grupos (KMeans)",
+        "",
+        f"{descripcion}: {n_libros} libros, {len(semillas)} semillas por k, "
+        f"silueta sobre una muestra de {min(muestra, n_libros)} libros.",
+        "",
+        "| k | inercia | silueta | Calinski–Harabasz | Davies–Bouldin | s/ajuste |",
+        "|---|---|---|---|---|---|",
+    ]
+    for k, fila in resumen.iterrows():
+        celdas = [f"{fila[(m, 'mean')]:.4g} ± {np.nan_to_num(fila[(m, 'std')]):.2g}" for m in METRICAS]
+        lineas.append(f"| {k} | {' | '.join(celdas)} | {fila[('segundos', 'mean')]:.2f} |")
+    lineas += [
+        "",
+        f"- Silueta máxima: k = {preferido['silueta']}",
+        f"- Calinski–Harabasz máximo: k = {preferido['calinski_harabasz']}",
+        f"- Davies–Bouldin mínimo: k = {preferido['davies_bouldin']}",
+        "",
+        "Media ± desviación típica entre semillas. La inercia siempre baja al "
+        "subir k; se busca el codo de la curva.",
+    ]
+    return "\n".join(lineas) + "\n"
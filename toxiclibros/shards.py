@@ -0,0 +1,38 @@
+# Reparto de libros entre varias máquinas.
+#
+# El shard i de n (0 <= i < n) puntúa los libros cuyo hash de book_id módulo n
+# es i, y escribe en su propia base de datos (gutenberg_all.shard{i}-of-{n}.db)
+# para que 1.2.fusionar_shards.py las combine después. Se usa un hash estable
+# (no hash() de Python, que cambia entre procesos) y no book_id % n para no
+# repartir por rangos de IDs, que se parecen en época y tamaño.
+import hashlib
+import os
+import re
+
+PATRON_SHARD = re.compile(r"\.shard(\d+)-of-(\d+)\.[^.]*$")
+
+
+def parsear_shard(texto):
+    # "i/n" -> (i, n)
+    i, separador, n = texto.partition("/")
+    if not separador or not i.isdigit() or not n.isdigit() or not 0 <= int(i) < int(n):
+        raise ValueError(f"Shard inválido: {texto} (se espera i/n con 0 <= i < n)")
+    return int(i), int(n)
+
+
+def shard_de(book_id, n):
+    resumen = hashlib.blake2b(str(int(book_id)).encode("ascii"), digest_size=8).digest()
+    return int.from_bytes(resumen, "big") % n
+
+
+def ruta_shard(db_path, i, n):
+    base, extension = os.path.splitext(db_path)
+    return f"{base}.shard{i}-of-{n}{extension}"
+
+
+def shard_de_ruta(ruta):
+    # (i, n) a partir del nombre de la base de datos de un shard; None si no lo es
+    coincidencia = PATRON_SHARD.search(os.path.basename(ruta))
+    if coincidencia is None:
+        return None
+    return int(coincidencia.group(1)), int(coincidencia.group(2))
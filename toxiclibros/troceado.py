@@ -0,0 +1,104 @@
+# Troceado de libros en fragmentos que caben en el presupuesto de tokens del modelo.
+#
+# Se respetan los saltos de párrafo originales (línea en blanco) y se agrupan
+# párrafos consecutivos hasta llenar el presupuesto; un párrafo que no cabe
+# solo se parte por palabras. Las marcas "*** START/END OF THE PROJECT
+# GUTENBERG EBOOK ..." van en su propio trozo para que la licencia y el resto
+# del texto repetido caigan siempre en los mismos trozos (y en la caché).
+# Los fragmentos se generan de uno en uno, así que nunca coexisten el libro
+# entero y una lista con copias de sus párrafos.
+import re
+from collections import namedtuple
+
+CARACTERES_POR_TOKEN = 4  # estimación para no tokenizar dos veces
+TOKENS_POR_TROZO = 384    # margen respecto a los 512 del modelo por el error de la estimación
+
+SEPARADOR_PARRAFOS = re.compile(r"\n[^\S\n]*\n\s*")
+PALABRA = re.compile(r"\S+")
+MARCA_GUTENBERG = re.compile(r"\*{3}\s*(START|END) OF (THE|THIS) PROJECT GUTENBERG", re.IGNORECASE)
+
+# texto normalizado, posición [inicio, fin) en el libro original y tokens estimados
+Trozo = namedtuple("Trozo", ["texto", "inicio", "fin", "tokens"])
+
+
+def estimar_tokens(texto):
+    return max(1, len(texto) // CARACTERES_POR_TOKEN)
+
+
+def iterar_parrafos(texto):
+    # (inicio, fin) de cada párrafo sin recorrer el texto más de una vez
+    inicio = 0
+    for separador in SEPARADOR_PARRAFOS.finditer(texto):
+        if separador.start() > inicio:
+            yield inicio, separador.start()
+        inicio = separador.end()
+    if inicio < len(texto):
+        yield inicio, len(texto)
+
+
+class Troceador:
+    # Iterable de Trozo sobre un libro. Tras recorrerlo, `palabras` contiene
+    # el mismo recuento que len(texto.split()), obtenido en la misma pasada,
+    # y `trozos` y `tokens` los trozos generados y sus tokens estimados.
+
+    def __init__(self, texto, max_tokens=TOKENS_POR_TROZO, contar_tokens=estimar_tokens):
+        self.texto = texto
+        self.max_tokens = max_tokens
+        self.contar_tokens = contar_tokens
+        self.palabras = 0
+        self.trozos = 0
+        self.tokens = 0
+
+    def __iter__(self):
+        partes, inicio, fin, tokens = [], 0, 0, 0
+        for p_inicio, p_fin in iterar_parrafos(self.texto):
+            palabras = self.texto[p_inicio:p_fin].split()
+            if not palabras:
+                continue
+            self.palabras += len(palabras)
+            parrafo = " ".join(palabras)
+            del palabras
+            p_tokens = self.contar_tokens(parrafo)
+            es_marca = MARCA_GUTENBERG.match(parrafo) is not None
+
+            if partes and (es_marca or tokens + p_tokens > self.max_tokens):
+                yield self._trozo(partes, inicio, fin, tokens)
+                partes, tokens = [], 0
+
+            if es_marca and p_tokens <= self.max_tokens:
+                yield self._trozo([parrafo], p_inicio, p_fin, p_tokens)
+                continue
+
+            if p_tokens > self.max_tokens:
+                yield from self._partir_parrafo(p_inicio, p_fin)
+                continue
+
+            if not partes:
+                inicio = p_inicio
+            partes.append(parrafo)
+            fin = p_fin
+            tokens += p_tokens
+
+        if partes:
+            yield self._trozo(partes, inicio, fin, tokens)
+
+    def _trozo(self, partes, inicio, fin, tokens):
+        self.trozos += 1
+        self.tokens += tokens
+        return Trozo("\n".join(partes), inicio, fin, tokens)
+
+    def _partir_parrafo(self, p_inicio, p_fin):
+        # Párrafo mayor que el presupuesto: ventanas de palabras consecutivas
+        partes, inicio, fin, tokens = [], p_inicio, p_inicio, 0
+        for palabra in PALABRA.finditer(self.texto, p_inicio, p_fin):
+            w_tokens = self.contar_tokens(palabra.group())
+            if partes and tokens + w_tokens > self.max_tokens:
+                yield self._trozo([" ".join(partes)], inicio, fin, tokens)
+                partes, tokens = [], 0
+            if not partes:
+                inicio = palabra.start()
+            partes.append(palabra.group())
+            fin = palabra.end()
+            tokens += w_tokens
+        if partes:
+            yield self._trozo([" ".join(partes)], inicio, fin, tokens)
@@ -4,15 +4,30 @@ from django.shortcuts import render
 from django.http import JsonResponse
 from sklearn.cluster import KMeans
 
+# Medias anuales y últimos años del rango salen de las tablas de agregados
+# que mantienen los triggers de procesados (ver toxiclibros/bd.py), sin
+# recorrer procesados en cada petición
+ULTIMOS_ANIOS = """
+    SELECT anio FROM agregados_anio, rango_anios
+    WHERE rango_anios.id = 1 AND anio BETWEEN anio_ini AND anio_fin
+    ORDER BY anio DESC LIMIT 10
+"""
+
 def dashboard(request):
     conn = sqlite3.connect('../gutenberg_all.db')  # Ajusta ruta si es necesario
-    df = pd.read_sql("""
-        SELECT anio, toxicity, severe_toxicity, obscene,
-               identity_attack, insult, threat
-        FROM libros_view
+    medios = pd.read_sql("""
+        SELECT anio,
+               suma_toxicity / n_toxicity AS toxicity,
+               suma_severe_toxicity / n_severe_toxicity AS severe_toxicity,
+               suma_obscene / n_obscene AS obscene,
+               suma_identity_attack / n_identity_attack AS identity_attack,
+               suma_insult / n_insult AS insult,
+               suma_threat / n_threat AS threat
+        FROM agregados_anio, rango_anios
+        WHERE rango_anios.id = 1 AND anio BETWEEN anio_ini AND anio_fin
+        ORDER BY anio
     """, conn)
 
-    medios = df.groupby("anio").mean().reset_index()
     data = medios.to_dict(orient="list")
 
     context = {
@@ -38,17 +53,14 @@ def grafo_parametrico_html(request, param):
 def grafo_libros(request):
     conn = sqlite3.connect('../gutenberg_all.db')
 
-    df = pd.read_sql("""
+    df = pd.read_sql(f"""
         SELECT book_id, anio, lenguaje, titulo,
                toxicity, severe_toxicity, obscene,
                identity_attack, insult, threat
         FROM libros_view
-        WHERE anio IS NOT NULL
+        WHERE anio IN ({ULTIMOS_ANIOS})
     """, conn)
 
-    ultimos_10 = sorted(df["anio"].dropna().unique())[-10:]
-    df = df[df["anio"].isin(ultimos_10)]
-
     features = ["toxicity", "severe_toxicity", "obscene", "identity_attack", "insult", "threat"]
     df = df.dropna(subset=features)
 
@@ -124,12 +136,9 @@ def grafo_parametrico_data(request, param):
     df = pd.read_sql(f"""
         SELECT book_id, anio, lenguaje, titulo, {param}
         FROM libros_view
-        WHERE anio IS NOT NULL AND {param} IS NOT NULL
+        WHERE anio IN ({ULTIMOS_ANIOS}) AND {param} IS NOT NULL
     """, conn)
 
-    ultimos_10 = sorted(df["anio"].dropna().unique())[-10:]
-    df = df[df["anio"].isin(ultimos_10)]
-
     if df.empty:
         return JsonResponse({"error": "Not enough books to analyze."}, status=400)
 